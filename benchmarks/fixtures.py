@@ -0,0 +1,57 @@
+import os
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from boardgames.data.games import Game
+from boardgames.services import migrations
+from boardgames.services.bgg_xml_stream import iterparse_games
+from boardgames.services.collection_service import get_game_columns
+from boardgames.services.search_service import index_games
+from boardgames.services.tag_service import insert_game_tags
+from .synthetic_bgg import GENERATOR_VERSION, create_thing_responses
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_SIZES = [100, 5000, 50000]
+FIXTURE_USERNAME = "benchmark"
+
+
+def get_fixture_path(num_games):
+    return os.path.join(FIXTURES_DIR, f"games_{num_games}_v{GENERATOR_VERSION}.sqlite")
+
+
+def open_fixture(num_games):
+    # The db can only be initialised once per process, so every size has to
+    # be benchmarked in a process of its own.
+    path = get_fixture_path(num_games)
+    exists = os.path.exists(path)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    db_session.global_init(path)
+    migrations.upgrade()
+    if not exists:
+        populate_fixture(num_games)
+    return path
+
+
+def populate_fixture(num_games):
+    game_ids = list(range(1, num_games + 1))
+    session = db_session.create_session()
+    for content in create_thing_responses(game_ids):
+        parsed_games = iterparse_games(content)
+        session.execute(sa.insert(Game), [get_game_columns(bg) for bg in parsed_games])
+        insert_game_tags(session, [(bg.id, bg) for bg in parsed_games])
+        index_games(session, [(bg.id, bg) for bg in parsed_games])
+
+    user = User(name=FIXTURE_USERNAME)
+    session.add(user)
+    session.flush()
+    session.execute(
+        sa.insert(UserGame),
+        [
+            {"user_id": user.id, "bgg_game_id": game_id, "user_rating": None}
+            for game_id in game_ids
+        ],
+    )
+    session.commit()
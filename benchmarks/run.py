@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import boardgames.data.db_session as db_session
+from boardgames.services import collection_cache
+from boardgames.services import filtered_games_service as fgs
+from boardgames.services import similar_games_service
+from boardgames.services.bgg_xml_stream import iterparse_games, iterparse_items
+from boardgames.services.collection_service import get_user_game_from_collection_item
+from .fixtures import FIXTURE_SIZES, FIXTURE_USERNAME, open_fixture
+from .synthetic_bgg import create_collection_xml, create_thing_responses
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Parsing is benchmarked on at most this many games, it scales linearly.
+MAX_PARSED_GAMES = 5000
+# A benchmark is flagged when its median is this much slower than the baseline.
+REGRESSION_THRESHOLD = 1.25
+
+FILTER_COMBINATIONS = {
+    "default": fgs.DEFAULT_COLLECTION_FILTERS,
+    "best_at_4": fgs.DEFAULT_COLLECTION_FILTERS._replace(
+        player_count="4", player_count_filter_type="Best"
+    ),
+    "mechanic_by_rating": fgs.DEFAULT_COLLECTION_FILTERS._replace(
+        mechanic="Mechanic 7", sort_field="BGG rating", sort_type="desc"
+    ),
+    "weight_and_time": fgs.DEFAULT_COLLECTION_FILTERS._replace(
+        min_weight="2",
+        max_weight="3.5",
+        max_playing_time="90",
+        include_expansions=True,
+        sort_field="Weight",
+    ),
+}
+
+SEARCH_FILTERS = fgs.DEFAULT_COLLECTION_FILTERS._replace(
+    search="word42", sort_field=fgs.RELEVANCE_SORT_FIELD
+)
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.mean(timings),
+        "repeat": repeat,
+    }
+
+
+def parse_things(responses):
+    for content in responses:
+        iterparse_games(content)
+
+
+def parse_collection(content):
+    for item in iterparse_items(io.BytesIO(content)):
+        get_user_game_from_collection_item(item)
+
+
+def filter_and_sort_cached(collection, filters):
+    indices = collection.filter_games(filters)
+    sorted_indices = collection.sort_games(
+        indices, filters.sort_field, filters.sort_type
+    )
+    collection.get_games_page(
+        sorted_indices, filters.sort_field, filters.sort_type, None, len(indices)
+    )
+
+
+def run_size_benchmarks(num_games, repeat):
+    results = {}
+    # The services print progress, which would only add noise here.
+    with contextlib.redirect_stdout(io.StringIO()):
+        open_fixture(num_games)
+
+        parsed_ids = range(1, min(num_games, MAX_PARSED_GAMES) + 1)
+        thing_responses = create_thing_responses(parsed_ids)
+        results["parse_things"] = measure(lambda: parse_things(thing_responses), repeat)
+        collection_content = create_collection_xml(range(1, num_games + 1))
+        results["parse_collection"] = measure(
+            lambda: parse_collection(collection_content), repeat
+        )
+
+        for name, filters in FILTER_COMBINATIONS.items():
+            results[f"sql_filter_sort[{name}]"] = measure(
+                lambda: fgs.get_games(FIXTURE_USERNAME, filters), repeat
+            )
+            results[f"sql_first_page[{name}]"] = measure(
+                lambda: fgs.get_games_page(FIXTURE_USERNAME, filters), repeat
+            )
+        results["sql_search"] = measure(
+            lambda: fgs.get_games_page(FIXTURE_USERNAME, SEARCH_FILTERS), repeat
+        )
+        results["sql_facets"] = measure(
+            lambda: fgs.get_facets(FIXTURE_USERNAME, FILTER_COMBINATIONS["best_at_4"]),
+            repeat,
+        )
+
+        session = db_session.get_current_session()
+        results["similarity_index_build"] = measure(
+            lambda: similar_games_service.SimilarityIndex(
+                *similar_games_service.load_features(session)
+            ),
+            repeat,
+        )
+        index = similar_games_service.get_index(session)
+        results["similar_games"] = measure(
+            lambda: index.find_similar(int(index.bgg_game_ids[0])), repeat
+        )
+
+        games = fgs.get_games(FIXTURE_USERNAME, collection_cache.ALL_GAMES_FILTERS)
+        results["cache_build"] = measure(
+            lambda: collection_cache.CachedCollection(0, games), repeat
+        )
+        collection = collection_cache.CachedCollection(0, games)
+        for name, filters in FILTER_COMBINATIONS.items():
+            results[f"cache_filter_sort[{name}]"] = measure(
+                lambda: filter_and_sort_cached(collection, filters), repeat
+            )
+        results["cache_facets"] = measure(
+            lambda: {
+                kind: collection.get_facet_values(
+                    kind, FILTER_COMBINATIONS["best_at_4"]
+                )
+                for kind in fgs.FACET_FILTER_FIELDS
+            },
+            repeat,
+        )
+    return results
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, repeat):
+    results = {}
+    for num_games in sizes:
+        print(f"Benchmarking {num_games} games")
+        # A fresh process per size, see open_fixture.
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            size_results = pool.submit(run_size_benchmarks, num_games, repeat).result()
+        for name, timing in size_results.items():
+            results.setdefault(name, {})[str(num_games)] = timing
+            print(f"  {name}: {timing['median_ms']:.2f} ms")
+    return {
+        "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare_runs(baseline, current, threshold):
+    regressions = []
+    for name, sizes in current["results"].items():
+        for num_games, timing in sizes.items():
+            baseline_timing = baseline["results"].get(name, {}).get(num_games)
+            if baseline_timing is None:
+                continue
+            ratio = timing["median_ms"] / baseline_timing["median_ms"]
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(
+                f"{name} [{num_games}]: {baseline_timing['median_ms']:.2f} -> "
+                f"{timing['median_ms']:.2f} ms ({ratio:.2f}x) {flag}"
+            )
+            if flag:
+                regressions.append((name, num_games))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing, filtering and sorting on synthetic data."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=FIXTURE_SIZES, metavar="NUM_GAMES"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="defaults to a timestamped file in results/")
+    parser.add_argument("--compare", metavar="BASELINE_JSON")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    run = run_benchmarks(args.sizes, args.repeat)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{run['created_at'].replace(':', '')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(run, results_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_runs(json.load(baseline_file), run, args.threshold)
+        if regressions:
+            sys.exit(1)
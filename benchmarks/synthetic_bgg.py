@@ -0,0 +1,117 @@
+import random
+from xml.sax.saxutils import quoteattr
+
+from boardgames.services.bgg_fetcher import MAX_ITEMS_PER_REQUEST, split_into_chunks
+
+# Bump when the generated data changes, so cached fixtures are rebuilt.
+GENERATOR_VERSION = 1
+
+MECHANICS = [f"Mechanic {i}" for i in range(180)]
+CATEGORIES = [f"Category {i}" for i in range(80)]
+DESIGNERS = [f"Designer {i}" for i in range(2500)]
+
+
+def get_game_rng(seed, game_id):
+    return random.Random(seed * 1_000_003 + game_id)
+
+
+def create_poll_xml(rng, max_players):
+    results = []
+    for num_players in [str(n) for n in range(1, max_players + 1)] + [
+        f"{max_players}+"
+    ]:
+        best, recommended, not_recommended = (rng.randint(0, 60) for _ in range(3))
+        results.append(
+            f'<results numplayers="{num_players}">'
+            f'<result value="Best" numvotes="{best}"/>'
+            f'<result value="Recommended" numvotes="{recommended}"/>'
+            f'<result value="Not Recommended" numvotes="{not_recommended}"/>'
+            "</results>"
+        )
+    total_votes = 0 if rng.random() < 0.05 else rng.randint(1, 500)
+    return (
+        f'<poll name="suggested_numplayers" title="User Suggested Number of Players" '
+        f'totalvotes="{total_votes}">{"".join(results)}</poll>'
+    )
+
+
+def create_links_xml(rng):
+    links = []
+    for link_type, values, max_count in [
+        ("boardgamemechanic", MECHANICS, 6),
+        ("boardgamecategory", CATEGORIES, 4),
+        ("boardgamedesigner", DESIGNERS, 2),
+    ]:
+        for value in rng.sample(values, rng.randint(1, max_count)):
+            links.append(f'<link type="{link_type}" id="1" value={quoteattr(value)}/>')
+    return "".join(links)
+
+
+def create_thing_xml(game_id, seed=0):
+    rng = get_game_rng(seed, game_id)
+    game_type = "boardgameexpansion" if rng.random() < 0.2 else "boardgame"
+    max_players = rng.randint(1, 8)
+    min_playing_time = rng.choice([15, 20, 30, 45, 60, 90, 120])
+    max_playing_time = min_playing_time + rng.choice([0, 15, 30, 60])
+    description = " ".join(f"word{rng.randint(0, 5000)}" for _ in range(120))
+    return (
+        f'<item type="{game_type}" id="{game_id}">'
+        f"<thumbnail>https://example.com/thumb/{game_id}.jpg</thumbnail>"
+        f"<image>https://example.com/image/{game_id}.jpg</image>"
+        f'<name type="primary" sortindex="1" value="Game {game_id}"/>'
+        f"<description>{description}&amp;#10;&amp;#10;More text.</description>"
+        f'<yearpublished value="{rng.randint(1980, 2024)}"/>'
+        f'<minplayers value="{rng.randint(1, max_players)}"/>'
+        f'<maxplayers value="{max_players}"/>'
+        f"{create_poll_xml(rng, max_players)}"
+        f'<playingtime value="{max_playing_time}"/>'
+        f'<minplaytime value="{min_playing_time}"/>'
+        f'<maxplaytime value="{max_playing_time}"/>'
+        f'<minage value="{rng.choice([8, 10, 12, 14])}"/>'
+        f"{create_links_xml(rng)}"
+        '<statistics page="1"><ratings>'
+        f'<usersrated value="{rng.randint(10, 100000)}"/>'
+        f'<average value="{rng.uniform(4, 9):.5f}"/>'
+        f'<bayesaverage value="{rng.uniform(5, 8):.5f}"/>'
+        '<ranks><rank type="subtype" id="1" name="boardgame" '
+        f'friendlyname="Board Game Rank" value="{game_id}" bayesaverage="6"/></ranks>'
+        f'<numweights value="{rng.randint(0, 3000)}"/>'
+        f'<averageweight value="{rng.uniform(1, 5):.4f}"/>'
+        "</ratings></statistics></item>"
+    )
+
+
+def create_things_xml(game_ids, seed=0):
+    items = "".join(create_thing_xml(game_id, seed) for game_id in game_ids)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<items termsofuse="https://boardgamegeek.com/xmlapi/termsofuse">{items}</items>'
+    ).encode()
+
+
+def create_thing_responses(game_ids, seed=0):
+    # One response per bgg request, like ThingFetcher.fetch_things yields them.
+    return [
+        create_things_xml(chunk, seed)
+        for chunk in split_into_chunks(list(game_ids), MAX_ITEMS_PER_REQUEST)
+    ]
+
+
+def create_collection_xml(game_ids, seed=0):
+    items = []
+    for game_id in game_ids:
+        rng = get_game_rng(seed, game_id)
+        rating = "N/A" if rng.random() < 0.6 else str(rng.randint(1, 10))
+        items.append(
+            f'<item objecttype="thing" objectid="{game_id}" subtype="boardgame" '
+            f'collid="{game_id}"><name sortindex="1">Game {game_id}</name>'
+            '<status own="1" prevowned="0" fortrade="0" want="0" wanttoplay="0" '
+            'wanttobuy="0" wishlist="0" preordered="0" '
+            'lastmodified="2021-01-01 00:00:00"/>'
+            '<stats minplayers="1" maxplayers="4"><rating value='
+            f'"{rating}"><average value="7"/></rating></stats></item>'
+        )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<items totalitems="{len(game_ids)}">{"".join(items)}</items>'
+    ).encode()
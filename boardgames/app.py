@@ -8,14 +8,37 @@ folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, folder)
 
 import boardgames.data.db_session as db_session
+import boardgames.data.import_jobs as import_jobs
+import boardgames.services.catalog_refresh_service as catalog_refresh_service
+import boardgames.services.collection_cache as collection_cache
+import boardgames.services.export_service as export_service
 import boardgames.services.filtered_games_service as fgs
-from boardgames.services.collection_service import (
-    add_new_users_collection_to_db,
-    check_user_in_database,
-)
+import boardgames.services.game_night_service as game_night_service
+import boardgames.services.similar_games_service as similar_games_service
+import boardgames.services.import_job_service as import_job_service
+import boardgames.services.metrics as metrics
+import boardgames.services.migrations as migrations
+import boardgames.services.render_cache as render_cache
+import boardgames.services.thumbnail_service as thumbnail_service
+from boardgames.services.collection_service import check_user_in_database
 
 app = flask.Flask(__name__)
 jinja_partials.register_extensions(app)
+app.jinja_env.globals["thumbnail_src"] = thumbnail_service.get_thumbnail_src
+metrics.instrument_app(app)
+
+# Descriptions only change when the catalog refresh fetches a game again,
+# a day old one is fine for browsers and proxies to show.
+GAME_DETAILS_MAX_AGE = int(os.environ.get("GAME_DETAILS_MAX_AGE", 24 * 60 * 60))
+# Cached thumbnails are named after their content and never change.
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+# Where a game's thumbnail is cached only changes when the catalog refresh
+# finds a new image.
+THUMBNAIL_REDIRECT_MAX_AGE = int(
+    os.environ.get("THUMBNAIL_REDIRECT_MAX_AGE", 24 * 60 * 60)
+)
+# Values that turn a checkbox off in a hand written export link.
+FALSE_VALUES = {"", "0", "false", "off", "no"}
 
 
 def main():
@@ -34,6 +57,12 @@ def setup_db():
     )
     print(db_file)
     db_session.global_init(db_file)
+    migrations.upgrade()
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    db_session.remove_current_session()
 
 
 @app.errorhandler(500)
@@ -50,62 +79,254 @@ def index_get():
 def index_post():
     username = flask.request.form["username"].lower()
     if not check_user_in_database(username):
-        add_new_users_collection_to_db(username)
+        job_id = import_job_service.enqueue_import(username)
+        return flask.redirect(f"/import/{job_id}")
     return flask.redirect(f"/user_collection/{username}")
 
 
+# Internal, nginx does not pass it through.
+@app.route("/metrics", methods=["GET"])
+def metrics_get():
+    catalog_refresh_service.observe_catalog_staleness(db_session.get_current_session())
+    response = flask.make_response(metrics.render_metrics())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
 @app.route("/user_collection/<username>", methods=["GET"])
 def collection_get(username):
-    games = fgs.get_games(username)
-    sorted_games = fgs.sort_filtered_games(games, "Title", "asc")
-    collection_stats = fgs.get_collection_stats(games)
-    sorting_options = fgs.SORTING_FIELDS.keys()
-    possible_mechanics = fgs.get_unique_from_sperated_pipe_seperatedcolumns(
-        games, "mechanics"
-    )
-    possible_categories = fgs.get_unique_from_sperated_pipe_seperatedcolumns(
-        games, "categories"
+    def render():
+        page, collection_stats = collection_cache.find_games(
+            username, fgs.DEFAULT_COLLECTION_FILTERS
+        )
+        sorting_options = fgs.SORTING_FIELDS.keys()
+        facets = collection_cache.get_facets(username)
+
+        return flask.render_template(
+            "user_collection.html",
+            page=page,
+            collection_stats=collection_stats,
+            username=username,
+            sorting_options=sorting_options,
+            facets=facets,
+            collection_url=f"/user_collection/{username}",
+            usernames=[username],
+            owners=None,
+            export_formats=export_service.get_linked_formats(),
+        )
+
+    return create_cached_response(username, ("collection_get",), render)
+
+
+@app.route("/user_collection/<username>", methods=["POST"])
+def collection_post(username):
+    filters = create_collection_filter(flask.request.form)
+    after = create_page_cursor(flask.request.form, filters)
+
+    def render():
+        page, collection_stats = collection_cache.find_games(username, filters, after)
+
+        if after is not None:
+            return flask.render_template(
+                "shared/partials/games_page.html",
+                page=page,
+                collection_url=f"/user_collection/{username}",
+                usernames=[username],
+                owners=None,
+            )
+        return flask.render_template(
+            "shared/partials/filtered_games.html",
+            page=page,
+            collection_stats=collection_stats,
+            collection_url=f"/user_collection/{username}",
+            usernames=[username],
+            owners=None,
+            filters=filters,
+            facets=collection_cache.get_facets(username, filters),
+            facet_filter_fields=fgs.FACET_FILTER_FIELDS,
+        )
+
+    return create_cached_response(username, ("collection_post", filters, after), render)
+
+
+@app.route("/user_collection/<username>/export", methods=["GET"])
+def collection_export(username):
+    export_format = flask.request.args.get("format", "csv")
+    if export_format not in export_service.EXPORT_FORMATS:
+        flask.abort(400)
+    if not export_service.is_format_available(export_format):
+        flask.abort(501)
+    if not check_user_in_database(username):
+        flask.abort(404)
+    filters = create_export_filter(flask.request.args)
+    # Checked before streaming, once the first row is out it's too late for a 400.
+    if not fgs.are_valid_filters(filters):
+        flask.abort(400)
+    media_type, extension = export_service.EXPORT_FORMATS[export_format]
+    response = flask.Response(
+        flask.stream_with_context(
+            export_service.export_games(username, filters, export_format)
+        ),
+        mimetype=media_type,
     )
-    possible_designers = fgs.get_unique_from_sperated_pipe_seperatedcolumns(
-        games, "designers"
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="{username}_collection.{extension}"'
     )
+    return response
 
+
+@app.route("/game_night", methods=["GET"])
+def game_night_get():
+    usernames = game_night_service.parse_usernames(flask.request.args.get("users", ""))
+    group = game_night_service.get_group_games(usernames)
+    page, collection_stats, owners = game_night_service.find_group_games(
+        group, fgs.DEFAULT_COLLECTION_FILTERS
+    )
     return flask.render_template(
-        "user_collection.html",
-        images=sorted_games,
+        "game_night.html",
+        page=page,
         collection_stats=collection_stats,
-        username=username,
-        sorting_options=sorting_options,
-        possible_categories=possible_categories,
-        possible_mechanics=possible_mechanics,
-        possible_designers=possible_designers,
+        owners=owners,
+        usernames=group.usernames,
+        missing_usernames=[
+            username for username in usernames if username not in group.usernames
+        ],
+        sorting_options=fgs.SORTING_FIELDS.keys(),
+        facets=game_night_service.get_group_facets(group),
+        collection_url=get_game_night_url(usernames),
     )
 
 
-@app.route("/user_collection/<username>", methods=["POST"])
-def collection_post(username):
+@app.route("/game_night", methods=["POST"])
+def game_night_post():
+    usernames = game_night_service.parse_usernames(flask.request.args.get("users", ""))
     filters = create_collection_filter(flask.request.form)
-    filtered_games = fgs.get_games(username, filters)
-    sorted_games = fgs.sort_filtered_games(
-        filtered_games, filters.sort_field, filters.sort_type
+    after = create_page_cursor(flask.request.form, filters)
+    group = game_night_service.get_group_games(
+        usernames, owned_by_all="owned_by_all" in flask.request.form
+    )
+    page, collection_stats, owners = game_night_service.find_group_games(
+        group, filters, after
     )
-    collection_stats = fgs.get_collection_stats(filtered_games)
 
+    if after is not None:
+        return flask.render_template(
+            "shared/partials/games_page.html",
+            page=page,
+            collection_url=get_game_night_url(usernames),
+            usernames=group.usernames,
+            owners=owners,
+        )
     return flask.render_template(
-        "shared/partials/games_list.html",
-        images=sorted_games,
+        "shared/partials/filtered_games.html",
+        page=page,
         collection_stats=collection_stats,
+        collection_url=get_game_night_url(usernames),
+        usernames=group.usernames,
+        owners=owners,
+        filters=filters,
+        facets=game_night_service.get_group_facets(group, filters),
+        facet_filter_fields=fgs.FACET_FILTER_FIELDS,
+    )
+
+
+@app.route("/game/<int:bgg_game_id>/details", methods=["GET"])
+def game_details_get(bgg_game_id):
+    game = fgs.get_game_details(bgg_game_id)
+    if game is None:
+        flask.abort(404)
+    response = flask.make_response(
+        flask.render_template("shared/partials/game_details.html", game=game)
+    )
+    # The same for every user, unlike the collection pages.
+    response.add_etag()
+    response.headers["Cache-Control"] = f"public, max-age={GAME_DETAILS_MAX_AGE}"
+    return response.make_conditional(flask.request)
+
+
+@app.route("/game/<int:bgg_game_id>/thumbnail/<int:size>", methods=["GET"])
+def game_thumbnail_get(bgg_game_id, size):
+    if size not in thumbnail_service.THUMBNAIL_SIZES:
+        flask.abort(404)
+    thumbnail_url, is_cached = thumbnail_service.get_thumbnail_url(bgg_game_id, size)
+    if thumbnail_url is None:
+        flask.abort(404)
+    response = flask.redirect(thumbnail_url)
+    # Until the thumbnail is cached the redirect to bgg's is asked for again.
+    if is_cached:
+        response.headers["Cache-Control"] = (
+            f"public, max-age={THUMBNAIL_REDIRECT_MAX_AGE}"
+        )
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/thumbnails/<int:size>/<thumbnail_file>", methods=["GET"])
+def thumbnail_get(size, thumbnail_file):
+    # nginx serves these from the same directory, this is for running the
+    # app on its own.
+    if size not in thumbnail_service.THUMBNAIL_SIZES:
+        flask.abort(404)
+    response = flask.send_from_directory(
+        os.path.join(thumbnail_service.THUMBNAIL_DIR, str(size)),
+        thumbnail_file,
+        max_age=THUMBNAIL_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/game/<int:bgg_game_id>/similar", methods=["GET"])
+def similar_games_get(bgg_game_id):
+    # Ranked within the games of users, or the whole catalog without them.
+    usernames = game_night_service.parse_usernames(flask.request.args.get("users", ""))
+    scope = flask.request.args.get("scope", "collection" if usernames else "catalog")
+    candidate_game_ids = None
+    if scope == "collection":
+        candidate_game_ids = game_night_service.get_group_games(usernames).game_ids
+    return flask.render_template(
+        "shared/partials/similar_games.html",
+        bgg_game_id=bgg_game_id,
+        similar_games=similar_games_service.find_similar_games(
+            bgg_game_id, candidate_game_ids
+        ),
+        usernames=usernames,
+        scope=scope,
     )
 
 
 @app.route("/user_collection/<username>/refresh", methods=["GET"])
 def refresh_user_collection(username):
-    add_new_users_collection_to_db(username, user_exists=True)
-    return flask.redirect(f"/user_collection/{username}")
+    job_id = import_job_service.enqueue_import(username, user_exists=True)
+    return flask.redirect(f"/import/{job_id}")
+
+
+@app.route("/import/<int:job_id>", methods=["GET"])
+def import_status_get(job_id):
+    job = import_job_service.get_job(job_id)
+    if job is None:
+        flask.abort(404)
+    if job.status == import_jobs.DONE:
+        return flask.redirect(f"/user_collection/{job.username}")
+    return flask.render_template("import_status.html", job=job)
+
+
+@app.route("/import/<int:job_id>/status", methods=["GET"])
+def import_status_partial(job_id):
+    job = import_job_service.get_job(job_id)
+    if job is None:
+        flask.abort(404)
+    if job.status == import_jobs.DONE:
+        response = flask.make_response("")
+        response.headers["HX-Redirect"] = f"/user_collection/{job.username}"
+        return response
+    return flask.render_template("shared/partials/import_status.html", job=job)
 
 
 def create_collection_filter(form):
-    return fgs.GameCollectionFilters(
+    filters = fgs.GameCollectionFilters(
         player_count=form["player_count"],
         player_count_filter_type=form["player_count_filter_type"],
         min_playing_time=form["min_playing_time"],
@@ -115,10 +336,54 @@ def create_collection_filter(form):
         category=form["category"],
         mechanic=form["mechanic"],
         designer=form["designer"],
-        include_expansions=form.get("include_expansions", False),
+        include_expansions="include_expansions" in form,
+        search=form.get("search", "").strip(),
         sort_field=form["sort_field"],
         sort_type=form["sort_type"],
     )
+    return fgs.normalize_filters(filters)
+
+
+def create_export_filter(args):
+    # Filters missing from the url keep their default. A checkbox is only
+    # sent when it is on, links built by hand can turn it off with 0 or false.
+    form = {
+        field: value
+        for field, value in fgs.DEFAULT_COLLECTION_FILTERS._asdict().items()
+        if field != "include_expansions"
+    }
+    form.update(args.items())
+    if not is_checked(form.get("include_expansions")):
+        form.pop("include_expansions", None)
+    return create_collection_filter(form)
+
+
+def is_checked(value):
+    return value is not None and value.strip().lower() not in FALSE_VALUES
+
+
+def create_cached_response(username, view_key, render):
+    collection_version = collection_cache.get_collection_version(username)
+    if collection_version is None:
+        return render()
+    page = render_cache.render_cached((username, collection_version) + view_key, render)
+    response = flask.make_response(page.body)
+    response.set_etag(page.etag)
+    # Browsers revalidate every time and get a 304 while nothing changed.
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(flask.request)
+
+
+def get_game_night_url(usernames):
+    return flask.url_for("game_night_get", users=",".join(usernames))
+
+
+def create_page_cursor(form, filters):
+    if "after_id" not in form:
+        return None
+    return fgs.parse_page_cursor(
+        filters.sort_field, form["after_value"], form["after_id"]
+    )
 
 
 if __name__ == "__main__":
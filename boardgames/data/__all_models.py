@@ -1,3 +1,5 @@
 import boardgames.data.games
 import boardgames.data.user_games
 import boardgames.data.users
+import boardgames.data.import_jobs
+import boardgames.data.tags
@@ -1,13 +1,37 @@
+from collections import namedtuple
+
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 
 from boardgames.data.modelbase import SqlAlchemyBase
 
+StorageProfile = namedtuple(
+    "StorageProfile",
+    [
+        "journal_mode",
+        "synchronous",
+        "cache_size_kib",
+        "mmap_size_bytes",
+        "busy_timeout_ms",
+    ],
+)
+
+# WAL lets the web workers read while an import is writing, and with WAL
+# synchronous=NORMAL only risks the last commits on power loss, not corruption.
+DEFAULT_STORAGE_PROFILE = StorageProfile(
+    journal_mode="WAL",
+    synchronous="NORMAL",
+    cache_size_kib=64 * 1024,
+    mmap_size_bytes=256 * 1024 * 1024,
+    busy_timeout_ms=10000,
+)
+
 __factory = None
+__current_session = None
 
 
-def global_init(db_file: str):
-    global __factory
+def global_init(db_file: str, storage_profile=DEFAULT_STORAGE_PROFILE):
+    global __factory, __current_session
 
     if __factory:
         return
@@ -19,13 +43,39 @@ def global_init(db_file: str):
     print("Connecting to DB with {}".format(conn_str))
 
     engine = sa.create_engine(conn_str, connect_args={"check_same_thread": False})
+    apply_storage_profile(engine, storage_profile)
     __factory = orm.sessionmaker(bind=engine)
+    # One session per thread, the app removes it when a request is torn down
+    # so every request is a unit of work of its own.
+    __current_session = orm.scoped_session(__factory)
 
     import boardgames.data.__all_models
 
     SqlAlchemyBase.metadata.create_all(engine)
 
 
+def apply_storage_profile(engine, storage_profile):
+    @sa.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={storage_profile.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={storage_profile.synchronous}")
+        # Negative cache sizes are in KiB rather than pages.
+        cursor.execute(f"PRAGMA cache_size=-{storage_profile.cache_size_kib}")
+        cursor.execute(f"PRAGMA mmap_size={storage_profile.mmap_size_bytes}")
+        cursor.execute(f"PRAGMA busy_timeout={storage_profile.busy_timeout_ms}")
+        cursor.close()
+
+
 def create_session():
     global __factory
     return __factory()
+
+
+def get_current_session():
+    return __current_session()
+
+
+def remove_current_session():
+    if __current_session is not None:
+        __current_session.remove()
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float
+import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Float
 
 from boardgames.data.modelbase import SqlAlchemyBase
 
@@ -13,6 +15,8 @@ class Game(SqlAlchemyBase):
     description = Column(String)
     image_url = Column(String)
     thumbnail_url = Column(String)
+    # Name of the resized copies of the thumbnail, see thumbnail_service.
+    thumbnail_file = Column(String)
     min_players = Column(Integer, nullable=False)
     max_players = Column(Integer, nullable=False)
     playing_time = Column(Integer, nullable=False)
@@ -32,3 +36,16 @@ class Game(SqlAlchemyBase):
     user_suggested_recommended_not_best_number_of_players = Column(
         String, nullable=False
     )
+    user_suggested_best_player_count_mask = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    user_suggested_recommended_player_count_mask = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # When the row was last fetched from bgg, null for rows older than this.
+    fetched_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # Bumped by a trigger whenever the row is inserted or fetched again, it
+    # only grows in commit order, see migrations.add_game_change_version_column.
+    change_version = Column(
+        Integer, nullable=False, default=0, server_default="0", index=True
+    )
@@ -0,0 +1,31 @@
+import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String
+
+from boardgames.data.modelbase import SqlAlchemyBase
+
+QUEUED = "queued"
+WAITING_ON_BGG = "waiting_on_bgg"
+FETCHING = "fetching"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATUSES = [QUEUED, WAITING_ON_BGG, FETCHING]
+
+
+class ImportJob(SqlAlchemyBase):
+    __tablename__ = "import_jobs"
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False, index=True)
+    user_exists = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False, default=QUEUED)
+    games_total = Column(Integer, nullable=False, default=0)
+    games_fetched = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Index, Integer, String, UniqueConstraint
+
+from boardgames.data.modelbase import SqlAlchemyBase
+
+
+class Tag(SqlAlchemyBase):
+    __tablename__ = "tags"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+
+    __table_args__ = (UniqueConstraint("kind", "name"),)
+
+
+class GameTag(SqlAlchemyBase):
+    __tablename__ = "game_tags"
+    bgg_game_id = Column(Integer, primary_key=True)
+    tag_id = Column(Integer, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_game_tags_tag_id_bgg_game_id", "tag_id", "bgg_game_id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 
 from boardgames.data.modelbase import SqlAlchemyBase
 
@@ -9,3 +9,10 @@ class UserGame(SqlAlchemyBase):
     user_id = Column(Integer, nullable=False)
     bgg_game_id = Column(Integer, nullable=False)
     user_rating = Column(Integer)
+
+    __table_args__ = (
+        Index(
+            "ix_user_games_user_id_bgg_game_id", "user_id", "bgg_game_id", unique=True
+        ),
+        Index("ix_user_games_bgg_game_id", "bgg_game_id"),
+    )
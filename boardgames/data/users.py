@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String
 
 
 from boardgames.data.modelbase import SqlAlchemyBase
@@ -8,3 +8,7 @@ class User(SqlAlchemyBase):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True)
+    # Bumped whenever the user's games change, used to invalidate caches.
+    collection_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Start of the last successful collection sync, in utc.
+    last_synced_at = Column(DateTime)
@@ -0,0 +1,212 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .bgg_response_cache import CachedResponse, get_default_response_cache
+from .bgg_xml_stream import join_items, split_items
+
+BASE_URI = os.environ.get("BGG_BASE_URI", "https://www.boardgamegeek.com/xmlapi2/")
+
+MAX_ITEMS_PER_REQUEST = 20  # limitation in bgg, how many items to get per api call.
+REQUESTS_PER_SECOND = float(os.environ.get("BGG_REQUESTS_PER_SECOND", 2))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("BGG_MAX_CONCURRENT_REQUESTS", 4))
+MAX_RETRIES = int(os.environ.get("BGG_MAX_RETRIES", 4))
+RETRY_BACKOFF_SECONDS = float(os.environ.get("BGG_RETRY_BACKOFF_SECONDS", 2))
+REQUEST_TIMEOUT_SECONDS = 60
+
+# 202 is what bgg answers while it is still preparing a response.
+RETRY_STATUS_CODES = {202, 429, 500, 502, 503, 504}
+
+
+class BoardgamegeekRequestError(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ThingFetcher:
+    def __init__(
+        self,
+        base_uri=BASE_URI,
+        requests_per_second=REQUESTS_PER_SECOND,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        max_retries=MAX_RETRIES,
+        retry_backoff_seconds=RETRY_BACKOFF_SECONDS,
+        response_cache=None,
+    ):
+        self.base_uri = base_uri
+        self.response_cache = response_cache
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.rate_limiter = RateLimiter(requests_per_second)
+        # Every request sent, retries included, budgets are counted from it.
+        self.requests_sent = 0
+        self._requests_sent_lock = threading.Lock()
+        # Caps requests in flight across every import sharing this fetcher.
+        self._in_flight = threading.BoundedSemaphore(max_concurrent_requests)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, endpoint, params, stream=False):
+        if self.response_cache is not None and self.response_cache.replay:
+            raise BoardgamegeekRequestError(
+                f"No recorded response for {endpoint} {params}"
+            )
+        with self._in_flight:
+            self.rate_limiter.wait()
+            with self._requests_sent_lock:
+                self.requests_sent += 1
+            started = time.perf_counter()
+            status = "error"
+            try:
+                response = self.session.get(
+                    self.base_uri + endpoint,
+                    params=params,
+                    stream=stream,
+                    timeout=REQUEST_TIMEOUT_SECONDS,
+                )
+                status = response.status_code
+                return response
+            finally:
+                metrics.observe_bgg_request(
+                    endpoint, status, time.perf_counter() - started
+                )
+
+    def open(self, endpoint, params):
+        # For streaming parsers, the response is streamed straight from bgg
+        # and with a cache a copy is stored as it is read.
+        if self.response_cache is None:
+            return self.get(endpoint, params, stream=True)
+        body = self.response_cache.get_compressed(endpoint, params)
+        metrics.BGG_CACHE_LOOKUPS.inc(
+            endpoint=endpoint, result="miss" if body is None else "hit"
+        )
+        if body is not None:
+            return CachedResponse(body)
+        response = self.get(endpoint, params, stream=True)
+        if response.status_code != 200:
+            return response
+        return self.response_cache.record(endpoint, params, response)
+
+    def fetch_chunk(self, game_ids):
+        if self.response_cache is None:
+            return self.request_things(game_ids)
+        # Cached per game, chunks are grouped differently on every import, and
+        # only the games that are not cached are asked for.
+        game_ids = [str(game_id) for game_id in game_ids]
+        items = {}
+        for game_id in game_ids:
+            item = self.response_cache.get("thing", get_thing_params([game_id]))
+            if item is not None:
+                items[game_id] = item
+        missing_ids = [game_id for game_id in game_ids if game_id not in items]
+        metrics.BGG_CACHE_LOOKUPS.inc(len(items), endpoint="thing", result="hit")
+        metrics.BGG_CACHE_LOOKUPS.inc(len(missing_ids), endpoint="thing", result="miss")
+        if not missing_ids:
+            return join_items([items[game_id] for game_id in game_ids])
+
+        content = self.request_things(missing_ids)
+        for game_id, item in split_items(content):
+            self.response_cache.put("thing", get_thing_params([game_id]), item)
+            items[game_id] = item
+        if len(missing_ids) == len(game_ids):
+            return content
+        # Games bgg did not return are left out, like bgg does.
+        return join_items([items[game_id] for game_id in game_ids if game_id in items])
+
+    def request_things(self, game_ids):
+        params = get_thing_params(game_ids)
+        for try_ in range(self.max_retries + 1):
+            try:
+                response = self.get("thing", params)
+            except requests.RequestException as e:
+                print(f"Request for things {params['id']} failed: {e}")
+                retry_after = None
+            else:
+                if response.status_code == 200:
+                    return response.content
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+                print(f"bgg answered {response.status_code} for {params['id']}")
+                retry_after = response.headers.get("Retry-After")
+            if try_ < self.max_retries:
+                time.sleep(self._get_backoff(try_, retry_after))
+        raise BoardgamegeekRequestError(f"Could not fetch things {params['id']}")
+
+    def fetch_things(self, game_ids):
+        chunks = split_into_chunks(list(game_ids), MAX_ITEMS_PER_REQUEST)
+        if len(chunks) == 1:
+            yield self.fetch_chunk(chunks[0])
+            return
+        # Only max_concurrent_requests chunks are fetched ahead of the caller,
+        # the next one is asked for as one is done, so responses don't pile
+        # up while the caller is busy inserting.
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrent_requests)
+        pending_chunks = iter(chunks)
+        in_flight = {
+            pool.submit(self.fetch_chunk, chunk)
+            for chunk in itertools.islice(pending_chunks, self.max_concurrent_requests)
+        }
+        try:
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    content = future.result()
+                    chunk = next(pending_chunks, None)
+                    if chunk is not None:
+                        in_flight.add(pool.submit(self.fetch_chunk, chunk))
+                    yield content
+        finally:
+            # A failed or abandoned import stops asking bgg for the rest.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_backoff(self, try_, retry_after):
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.retry_backoff_seconds * 2**try_
+
+
+def get_thing_params(game_ids):
+    return {"id": ",".join(str(game_id) for game_id in game_ids), "stats": 1}
+
+
+def split_into_chunks(items, chunk_size):
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+__default_fetcher = None
+__default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    global __default_fetcher
+    with __default_fetcher_lock:
+        if __default_fetcher is None:
+            __default_fetcher = ThingFetcher(
+                response_cache=get_default_response_cache()
+            )
+        return __default_fetcher
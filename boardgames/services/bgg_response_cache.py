@@ -0,0 +1,230 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+# "on" serves fresh responses from the cache and stores new ones, "off" always
+# goes to bgg and "replay" only serves recorded responses, whatever their age,
+# and never touches the network or the cache file.
+CACHE_MODE = os.environ.get("BGG_CACHE_MODE", "on")
+CACHE_PATH = os.environ.get(
+    "BGG_CACHE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "db",
+        "bgg_cache.sqlite",
+    ),
+)
+MAX_CACHE_BYTES = int(os.environ.get("BGG_CACHE_MAX_MB", 512)) * 1024 * 1024
+# Compressed copies of streamed responses bigger than this are spooled to disk.
+SPOOL_MAX_BYTES = 1024 * 1024
+
+# Collections change whenever their owner logs a game, thing data rarely does.
+TTL_SECONDS = {
+    "collection": int(os.environ.get("BGG_CACHE_COLLECTION_TTL_SECONDS", 600)),
+    "thing": int(os.environ.get("BGG_CACHE_THING_TTL_SECONDS", 24 * 3600)),
+}
+DEFAULT_TTL_SECONDS = 3600
+
+
+class DecompressingReader:
+    # Reads a compressed body back in pieces instead of decompressing it whole.
+    def __init__(self, body):
+        self.body = io.BytesIO(body)
+        self.decompressor = zlib.decompressobj()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.decompressor.decompress(self.body.read())
+        data = b""
+        while not data and not self.decompressor.eof:
+            compressed = self.decompressor.unconsumed_tail or self.body.read(size)
+            if not compressed:
+                return self.decompressor.flush()
+            data = self.decompressor.decompress(compressed, size)
+        return data
+
+    def close(self):
+        self.body.close()
+
+
+class CachedResponse:
+    # Stands in for a streamed requests response in iterparse_response.
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.raw = DecompressingReader(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.raw.close()
+
+
+class RecordingReader:
+    # Hands a streamed body to its parser while compressing a copy of it.
+    def __init__(self, raw, copy):
+        raw.decode_content = True
+        self.raw = raw
+        self.copy = copy
+        self.compressor = zlib.compressobj()
+        self.finished = False
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if data:
+            self.copy.write(self.compressor.compress(data))
+        else:
+            self.finished = True
+        return data
+
+
+class RecordingResponse:
+    # Stands in for a streamed requests response in iterparse_response, the
+    # body is only stored once its parser has read all of it.
+    def __init__(self, response, cache, endpoint, params):
+        self.response = response
+        self.status_code = response.status_code
+        self.cache = cache
+        self.endpoint = endpoint
+        self.params = params
+        # Kept in memory while small, bigger copies go to a temporary file.
+        self.copy = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self.raw = RecordingReader(response.raw, self.copy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.raw.finished:
+                self.copy.write(self.raw.compressor.flush())
+                if self.copy.tell() <= self.cache.max_bytes:
+                    self.copy.seek(0)
+                    self.cache.put_compressed(
+                        self.endpoint, self.params, self.copy.read()
+                    )
+        finally:
+            self.copy.close()
+            self.response.close()
+
+
+def normalize_params(params):
+    normalized = {key: str(value) for key, value in params.items()}
+    # The same things asked for in another order are the same response.
+    if "id" in normalized:
+        ids = {game_id for game_id in normalized["id"].split(",") if game_id != ""}
+        normalized["id"] = ",".join(sorted(ids, key=int))
+    return sorted(normalized.items())
+
+
+def get_cache_key(endpoint, params):
+    request = json.dumps([endpoint, normalize_params(params)])
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path=CACHE_PATH,
+        max_bytes=MAX_CACHE_BYTES,
+        ttl_seconds=TTL_SECONDS,
+        replay=False,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.replay = replay
+        self._lock = threading.Lock()
+        if replay:
+            self._connection = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+            return
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "endpoint TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "body BLOB NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_responses_accessed_at "
+            "ON responses (accessed_at)"
+        )
+
+    def get(self, endpoint, params):
+        body = self.get_compressed(endpoint, params)
+        return None if body is None else zlib.decompress(body)
+
+    def get_compressed(self, endpoint, params):
+        key = get_cache_key(endpoint, params)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT stored_at, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            stored_at, body = row
+            if not self.replay:
+                ttl_seconds = self.ttl_seconds.get(endpoint, DEFAULT_TTL_SECONDS)
+                if time.time() - stored_at > ttl_seconds:
+                    return None
+                self._connection.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        return body
+
+    def put(self, endpoint, params, content):
+        self.put_compressed(endpoint, params, zlib.compress(content))
+
+    def put_compressed(self, endpoint, params, body):
+        if self.replay:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, endpoint, stored_at, accessed_at, size, body) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (get_cache_key(endpoint, params), endpoint, now, now, len(body), body),
+            )
+            self._evict()
+
+    def record(self, endpoint, params, response):
+        return RecordingResponse(response, self, endpoint, params)
+
+    def _evict(self):
+        cached_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if cached_bytes <= self.max_bytes:
+            return
+        least_recently_used = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for key, size in least_recently_used:
+            if cached_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            cached_bytes -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+
+def get_default_response_cache():
+    if CACHE_MODE == "off":
+        return None
+    return ResponseCache(replay=CACHE_MODE == "replay")
@@ -0,0 +1,67 @@
+import io
+import time
+import xml.etree.ElementTree as ET
+
+from . import metrics
+from .boardgame_xml_parser import BoardgameXMLParser
+from .player_count_poll import evaluate_polls
+
+
+class BoardgamegeekMessage(Exception):
+    pass
+
+
+def iterparse_items(source):
+    # Yields every top level <item> as soon as it is closed and drops it from
+    # the tree once the caller is done with it, so memory stays flat.
+    depth = 0
+    root = None
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == "item":
+            yield element
+            root.clear()
+
+    if root is not None and root.tag != "items":
+        raise BoardgamegeekMessage("".join(root.itertext()).strip())
+
+
+def split_items(content):
+    # (bgg id, item xml) for every item of a thing response.
+    return [
+        (item.get("id"), ET.tostring(item))
+        for item in iterparse_items(io.BytesIO(content))
+    ]
+
+
+def join_items(items):
+    return (
+        b'<?xml version="1.0" encoding="utf-8"?><items>'
+        + b"".join(items)
+        + (b"</items>")
+    )
+
+
+def iterparse_response(response):
+    response.raw.decode_content = True
+    return iterparse_items(response.raw)
+
+
+def iterparse_games(content):
+    # A thing response holds at most 20 items, so their player count polls
+    # are evaluated together in one vectorized pass.
+    started = time.perf_counter()
+    games = [
+        BoardgameXMLParser(item, evaluate_player_count_poll=False)
+        for item in iterparse_items(io.BytesIO(content))
+    ]
+    poll_results = evaluate_polls([game.suggested_player_poll for game in games])
+    for game, poll_result in zip(games, poll_results):
+        game.set_player_count_poll_result(poll_result)
+    metrics.BGG_PARSE_SECONDS.observe(time.perf_counter() - started, endpoint="thing")
+    return games
@@ -1,11 +1,11 @@
 import xml.etree.ElementTree as ET
 import html
 
-import pandas as pd
+from .player_count_poll import PlayerCountPoll, evaluate_poll, get_player_count_mask
 
 
 class BoardgameXMLParser:
-    def __init__(self, board_game_element):
+    def __init__(self, board_game_element, evaluate_player_count_poll=True):
         self.board_game_element = board_game_element
         self.type = self.board_game_element.get("type")
         self.id = self.board_game_element.get("id")
@@ -54,37 +54,14 @@ class BoardgameXMLParser:
             'link[@type="boardgamecategory"]', "value"
         )
 
-        (
-            suggested_player_poll_element,
-            suggested_players_total_votes,
-        ) = self._get_poll_results('poll[@name="suggested_numplayers"]')
+        self.suggested_player_poll = self._get_suggested_player_poll(
+            'poll[@name="suggested_numplayers"]'
+        )
+        if evaluate_player_count_poll:
+            self.set_player_count_poll_result(evaluate_poll(self.suggested_player_poll))
 
-        if suggested_players_total_votes == 0:
-            self.user_suggested_best_number_of_players = ""
-            self.user_suggested_recommended_number_of_players = ""
-            self.user_suggested_recommended_not_best_number_of_players = ""
-        else:
-            suggested_player_counts_df = self._get_suggested_player_counts_dataframe(
-                suggested_player_poll_element
-            )
-            suggested_player_counts_df_with_poll_result = (
-                self._get_suggested_player_counts_data_with_realtive_amounts(
-                    suggested_player_counts_df
-                )
-            )
-            self.user_suggested_best_number_of_players = self._get_best_player_counts(
-                suggested_player_counts_df_with_poll_result
-            )
-            self.user_suggested_recommended_number_of_players = (
-                self._get_recommended_player_counts(
-                    suggested_player_counts_df_with_poll_result
-                )
-            )
-            self.user_suggested_recommended_not_best_number_of_players = (
-                self._get_recommended_player_not_best_counts(
-                    suggested_player_counts_df_with_poll_result
-                )
-            )
+        # Parsed values are all copied out, don't keep the element alive.
+        del self.board_game_element
 
     def _get_optional_element(self, element_name):
         try:
@@ -101,57 +78,31 @@ class BoardgameXMLParser:
         attributes = [element.get(attribute_name) for element in elements]
         return "|".join(attributes)
 
-    def _get_poll_results(self, poll_pattern):
-        poll = self.board_game_element.find(poll_pattern)
-        return (poll.findall("results"), int(poll.get("totalvotes")))
+    def set_player_count_poll_result(self, poll_result):
+        self.user_suggested_best_number_of_players = poll_result.best
+        self.user_suggested_recommended_number_of_players = poll_result.recommended
+        self.user_suggested_recommended_not_best_number_of_players = (
+            poll_result.recommended_not_best
+        )
+        self.user_suggested_best_player_count_mask = get_player_count_mask(
+            poll_result.best
+        )
+        self.user_suggested_recommended_player_count_mask = get_player_count_mask(
+            poll_result.recommended
+        )
 
-    def _get_suggested_player_counts_dataframe(self, suggested_player_poll_element):
+    def _get_suggested_player_poll(self, poll_pattern):
+        poll = self.board_game_element.find(poll_pattern)
         options = []
-        for option in suggested_player_poll_element:
-            option_row = {"num_players": option.get("numplayers")}
-            option_row["best"] = int(
-                option.find('result[@value="Best"]').get("numvotes")
-            )
-            option_row["recommended"] = int(
-                option.find('result[@value="Recommended"]').get("numvotes")
-            )
-            option_row["not_recommended"] = int(
-                option.find('result[@value="Not Recommended"]').get("numvotes")
+        for option in poll.findall("results"):
+            options.append(
+                (
+                    option.get("numplayers"),
+                    int(option.find('result[@value="Best"]').get("numvotes")),
+                    int(option.find('result[@value="Recommended"]').get("numvotes")),
+                    int(
+                        option.find('result[@value="Not Recommended"]').get("numvotes")
+                    ),
+                )
             )
-            options.append(option_row)
-        return pd.DataFrame(options)
-
-    def _get_suggested_player_counts_data_with_realtive_amounts(
-        self, suggested_player_counts_df
-    ):
-        df = suggested_player_counts_df
-        df.loc[
-            df["not_recommended"] > df["recommended"] + df["best"], "poll_result"
-        ] = "not_recommended"
-        df.loc[
-            (df["poll_result"] != "not_recommended") & (df["recommended"] < df["best"]),
-            "poll_result",
-        ] = "best"
-        df.loc[
-            (df["poll_result"] != "not_recommended") & (df["poll_result"] != "best"),
-            "poll_result",
-        ] = "recommended"
-        return df
-
-    def _get_best_player_counts(self, poll_result):
-        best_player_counts = poll_result.loc[
-            poll_result["poll_result"] == "best", "num_players"
-        ].tolist()
-        return "|".join(best_player_counts)
-
-    def _get_recommended_player_counts(self, poll_result):
-        recommended_player_counts = poll_result.loc[
-            poll_result["poll_result"] != "not_recommended", "num_players"
-        ].tolist()
-        return "|".join(recommended_player_counts)
-
-    def _get_recommended_player_not_best_counts(self, poll_result):
-        recommended_player_counts = poll_result.loc[
-            poll_result["poll_result"] == "recommended", "num_players"
-        ].tolist()
-        return "|".join(recommended_player_counts)
+        return PlayerCountPoll(int(poll.get("totalvotes")), options)
@@ -0,0 +1,224 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from . import migrations
+from .bgg_fetcher import get_default_fetcher
+from .bgg_xml_stream import iterparse_games
+from .collection_service import (
+    CollectionItem,
+    check_user_in_database,
+    get_game_columns,
+    get_game_ids_not_currently_in_db,
+    get_user_games_from_boardgamegeek,
+    insert_user_into_database,
+    sync_user_games,
+)
+from .search_service import index_games
+from .tag_service import insert_game_tags
+
+# Games are written in transactions of this size, a crash loses at most one.
+BULK_INSERT_BATCH_SIZE = 1000
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+# bgg prepares collections in the background, every round asks again for all
+# of the collections that were not ready yet.
+COLLECTION_TRIES = 10
+COLLECTION_RETRY_SECONDS = 5
+
+
+def read_usernames(usernames_file):
+    # Lowercased like the usernames entered in the app, or the collection
+    # page would never find them.
+    usernames = []
+    seen = set()
+    with open(usernames_file) as lines:
+        for line in lines:
+            username = line.strip().lower()
+            if username and not username.startswith("#") and username not in seen:
+                seen.add(username)
+                usernames.append(username)
+    return usernames
+
+
+def load_checkpoint(checkpoint_file):
+    # collections maps username to its fetched items and when they were
+    # fetched, synced_users are written to the db already.
+    checkpoint = {"collections": {}, "invalid_users": [], "synced_users": []}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            checkpoint.update(json.load(f))
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    # Written to a temporary file first so a crash never leaves half of one.
+    temporary_file = checkpoint_file + ".tmp"
+    with open(temporary_file, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary_file, checkpoint_file)
+
+
+def fetch_collections(usernames, checkpoint, checkpoint_file):
+    pending = [
+        username
+        for username in usernames
+        if username not in checkpoint["collections"]
+        and username not in checkpoint["invalid_users"]
+    ]
+    for try_ in range(COLLECTION_TRIES):
+        waiting = []
+        for username in pending:
+            fetched_at = datetime.datetime.utcnow()
+            collection_items = get_user_games_from_boardgamegeek(username)
+            if collection_items == "invalid username":
+                checkpoint["invalid_users"].append(username)
+            elif collection_items == "waiting":
+                waiting.append(username)
+                continue
+            else:
+                checkpoint["collections"][username] = {
+                    "fetched_at": fetched_at.isoformat(),
+                    "items": [list(item) for item in collection_items],
+                }
+            save_checkpoint(checkpoint_file, checkpoint)
+        if not waiting:
+            return []
+        print(f"Waiting for boardgamegeek to prepare {len(waiting)} collections")
+        pending = waiting
+        time.sleep(COLLECTION_RETRY_SECONDS)
+    return pending
+
+
+def get_collection_items(checkpoint, username):
+    return [
+        CollectionItem(*item) for item in checkpoint["collections"][username]["items"]
+    ]
+
+
+def get_owned_game_ids(checkpoint):
+    return sorted(
+        {
+            item.bgg_game_id
+            for username in checkpoint["collections"]
+            for item in get_collection_items(checkpoint, username)
+            if item.owned
+        }
+    )
+
+
+def parse_things(content):
+    # Runs in a worker process, plain dicts are cheap to send back.
+    return [get_game_columns(bg) for bg in iterparse_games(content)]
+
+
+def insert_games(session, games):
+    session.execute(sa.insert(Game), games)
+    # Transient Game rows, only their tag and search columns are read.
+    parsed_games = [(columns["bgg_game_id"], Game(**columns)) for columns in games]
+    insert_game_tags(session, parsed_games)
+    index_games(session, parsed_games)
+    session.commit()
+
+
+def import_games(game_ids, workers):
+    # Responses are fetched on the fetcher's threads and parsed on worker
+    # processes, so parsing keeps up with the rate limited requests.
+    session = db_session.create_session()
+    imported = 0
+    batch = []
+
+    def collect(done, last=False):
+        nonlocal imported, batch
+        for future in done:
+            batch.extend(future.result())
+        if len(batch) >= BULK_INSERT_BATCH_SIZE or (last and batch):
+            insert_games(session, batch)
+            imported += len(batch)
+            batch = []
+            print(f"Imported {imported} of {len(game_ids)} games")
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        parsing = set()
+        for content in get_default_fetcher().fetch_things(game_ids):
+            parsing.add(pool.submit(parse_things, content))
+            if len(parsing) >= 2 * workers:
+                done, parsing = wait(parsing, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(parsing, last=True)
+    session.close()
+    return imported
+
+
+def sync_users(checkpoint, checkpoint_file):
+    for username in checkpoint["collections"]:
+        if username in checkpoint["synced_users"]:
+            continue
+        if not check_user_in_database(username):
+            insert_user_into_database(username)
+        collection = checkpoint["collections"][username]
+        sync_user_games(
+            username,
+            get_collection_items(checkpoint, username),
+            full_sync=True,
+            synced_at=datetime.datetime.fromisoformat(collection["fetched_at"]),
+        )
+        checkpoint["synced_users"].append(username)
+        save_checkpoint(checkpoint_file, checkpoint)
+
+
+def bulk_import(usernames, checkpoint_file, workers=DEFAULT_WORKERS):
+    checkpoint = load_checkpoint(checkpoint_file)
+    not_ready = fetch_collections(usernames, checkpoint, checkpoint_file)
+
+    owned_game_ids = get_owned_game_ids(checkpoint)
+    # Games committed by an interrupted run are in the db and skipped here.
+    game_ids = get_game_ids_not_currently_in_db(owned_game_ids)
+    print(
+        f"{len(checkpoint['collections'])} collections own {len(owned_game_ids)} "
+        f"distinct games, {len(game_ids)} of them are not in the db yet"
+    )
+    if game_ids:
+        import_games(game_ids, workers)
+    sync_users(checkpoint, checkpoint_file)
+
+    if checkpoint["invalid_users"]:
+        print(f"Invalid usernames: {', '.join(checkpoint['invalid_users'])}")
+    if not_ready:
+        print(f"Not ready on boardgamegeek, run again: {', '.join(not_ready)}")
+    return not_ready
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import the collections of every username in a file."
+    )
+    parser.add_argument("usernames_file", help="one boardgamegeek username per line")
+    parser.add_argument("db_file", nargs="?", default="boardgames/db/db.sqlite")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--checkpoint", help="defaults to bulk_import_checkpoint.json next to the db"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    args = parser.parse_args()
+
+    checkpoint_file = args.checkpoint or os.path.join(
+        os.path.dirname(os.path.abspath(args.db_file)), "bulk_import_checkpoint.json"
+    )
+    if args.restart and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    db_session.global_init(args.db_file)
+    migrations.upgrade()
+    bulk_import(read_usernames(args.usernames_file), checkpoint_file, args.workers)
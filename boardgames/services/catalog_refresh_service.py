@@ -0,0 +1,242 @@
+import argparse
+import datetime
+import os
+import time
+from collections import namedtuple
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from boardgames.data.tags import GameTag
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from . import metrics, migrations
+from .bgg_fetcher import MAX_ITEMS_PER_REQUEST, get_default_fetcher
+from .collection_service import (
+    get_game_columns,
+    get_general_game_data_from_boardgamegeek,
+)
+from .search_service import index_games
+from .tag_service import insert_game_tags
+
+# Games are refreshed once they are older than this.
+STALE_AFTER = datetime.timedelta(days=int(os.environ.get("CATALOG_STALE_DAYS", 30)))
+# At most this many bgg requests per window, each refreshes up to 20 games.
+REFRESH_BUDGET = int(os.environ.get("CATALOG_REFRESH_BUDGET", 60))
+REFRESH_WINDOW_SECONDS = int(os.environ.get("CATALOG_REFRESH_WINDOW_SECONDS", 3600))
+
+# Upper bounds of the age buckets reported by get_catalog_staleness.
+STALENESS_BUCKETS = [
+    ("1d", datetime.timedelta(days=1)),
+    ("7d", datetime.timedelta(days=7)),
+    ("30d", datetime.timedelta(days=30)),
+    ("90d", datetime.timedelta(days=90)),
+]
+
+CatalogStaleness = namedtuple(
+    "CatalogStaleness",
+    [
+        "total_games",
+        "never_fetched",
+        "stale_games",
+        "oldest_fetched_at",
+        "games_by_age",
+    ],
+)
+
+
+def get_stale_game_ids(session, limit, stale_after=STALE_AFTER):
+    cutoff = datetime.datetime.utcnow() - stale_after
+    owners = (
+        sa.select(UserGame.bgg_game_id, sa.func.count().label("owner_count"))
+        .group_by(UserGame.bgg_game_id)
+        .subquery()
+    )
+    stale_games = (
+        session.query(Game.bgg_game_id)
+        .outerjoin(owners, owners.c.bgg_game_id == Game.bgg_game_id)
+        .filter(sa.or_(Game.fetched_at.is_(None), Game.fetched_at < cutoff))
+        .order_by(
+            sa.func.coalesce(owners.c.owner_count, 0).desc(),
+            Game.fetched_at.isnot(None),
+            Game.fetched_at,
+        )
+        .limit(limit)
+    )
+    return [game[0] for game in stale_games]
+
+
+def update_games(session, parsed_games, fetched_at):
+    columns = [
+        column
+        for column in get_game_columns(parsed_games[0])
+        if column != "bgg_game_id"
+    ]
+    session.execute(
+        sa.update(Game)
+        .where(Game.bgg_game_id == sa.bindparam("b_bgg_game_id"))
+        .values(
+            fetched_at=fetched_at,
+            # The cached copies are only kept while the image stays the same.
+            thumbnail_file=sa.case(
+                (
+                    Game.thumbnail_url == sa.bindparam("b_thumbnail_url"),
+                    Game.thumbnail_file,
+                ),
+                else_=None,
+            ),
+            **{column: sa.bindparam(f"b_{column}") for column in columns},
+        ),
+        [
+            {f"b_{column}": value for column, value in get_game_columns(bg).items()}
+            for bg in parsed_games
+        ],
+    )
+    game_ids = [int(bg.id) for bg in parsed_games]
+    session.query(GameTag).filter(GameTag.bgg_game_id.in_(game_ids)).delete(
+        synchronize_session=False
+    )
+    insert_game_tags(session, [(bg.id, bg) for bg in parsed_games])
+    index_games(session, [(bg.id, bg) for bg in parsed_games])
+
+
+def refresh_games(game_ids):
+    if not game_ids:
+        return 0
+    fetched_at = datetime.datetime.utcnow()
+    parsed_games = list(get_general_game_data_from_boardgamegeek(game_ids))
+
+    with db_session.create_session() as session:
+        if parsed_games:
+            update_games(session, parsed_games, fetched_at)
+        # Games bgg did not return are marked too, so they don't block the queue.
+        session.query(Game).filter(Game.bgg_game_id.in_(game_ids)).filter(
+            sa.or_(Game.fetched_at.is_(None), Game.fetched_at < fetched_at)
+        ).update({Game.fetched_at: fetched_at}, synchronize_session=False)
+        # Invalidates the cached collections of everyone owning a refreshed game.
+        owners = sa.select(UserGame.user_id).where(UserGame.bgg_game_id.in_(game_ids))
+        session.query(User).filter(User.id.in_(owners)).update(
+            {User.collection_version: User.collection_version + 1},
+            synchronize_session=False,
+        )
+        session.commit()
+    return len(parsed_games)
+
+
+def refresh_stale_games(budget=REFRESH_BUDGET, stale_after=STALE_AFTER):
+    with db_session.create_session() as session:
+        game_ids = get_stale_game_ids(
+            session, budget * MAX_ITEMS_PER_REQUEST, stale_after
+        )
+    refreshed = 0
+    fetcher = get_default_fetcher()
+    requests_sent = fetcher.requests_sent
+    # Committed per request sized batch, a failing request only loses its batch.
+    # Its games stay stale and are tried again in the next window.
+    for i in range(0, len(game_ids), MAX_ITEMS_PER_REQUEST):
+        # Retries count against the budget too, while bgg keeps answering
+        # 202 fewer games are refreshed.
+        if fetcher.requests_sent - requests_sent >= budget:
+            print(f"Used the budget, {len(game_ids) - i} games wait for a window")
+            break
+        batch = game_ids[i : i + MAX_ITEMS_PER_REQUEST]
+        try:
+            refreshed += refresh_games(batch)
+        except Exception as e:
+            print(f"Refreshing games {batch[0]} to {batch[-1]} failed: {e}")
+    return refreshed
+
+
+def get_catalog_staleness(session, stale_after=STALE_AFTER):
+    now = datetime.datetime.utcnow()
+    total_games, never_fetched, stale_games, oldest_fetched_at = session.query(
+        sa.func.count(),
+        sa.func.count().filter(Game.fetched_at.is_(None)),
+        sa.func.count().filter(Game.fetched_at < now - stale_after),
+        sa.func.min(Game.fetched_at),
+    ).one()
+    games_by_age = {}
+    newer_than = now
+    for bucket, age in STALENESS_BUCKETS:
+        games_by_age[bucket] = (
+            session.query(sa.func.count())
+            .filter(Game.fetched_at <= newer_than)
+            .filter(Game.fetched_at > now - age)
+            .scalar()
+        )
+        newer_than = now - age
+    games_by_age["older"] = (
+        session.query(sa.func.count()).filter(Game.fetched_at <= newer_than).scalar()
+    )
+    return CatalogStaleness(
+        total_games,
+        never_fetched,
+        stale_games + never_fetched,
+        oldest_fetched_at,
+        games_by_age,
+    )
+
+
+def observe_catalog_staleness(session, stale_after=STALE_AFTER):
+    staleness = get_catalog_staleness(session, stale_after)
+    metrics.CATALOG_GAMES.set(staleness.total_games)
+    metrics.CATALOG_STALE_GAMES.set(staleness.stale_games)
+    metrics.CATALOG_NEVER_FETCHED_GAMES.set(staleness.never_fetched)
+    oldest_fetch_age = 0.0
+    if staleness.oldest_fetched_at is not None:
+        oldest_fetch_age = (
+            datetime.datetime.utcnow() - staleness.oldest_fetched_at
+        ).total_seconds()
+    metrics.CATALOG_OLDEST_FETCH_AGE_SECONDS.set(oldest_fetch_age)
+    for bucket, count in staleness.games_by_age.items():
+        metrics.CATALOG_GAMES_BY_AGE.set(count, age=bucket)
+
+
+def print_catalog_staleness(stale_after):
+    with db_session.create_session() as session:
+        staleness = get_catalog_staleness(session, stale_after)
+    print(
+        f"{staleness.total_games} games, {staleness.stale_games} stale "
+        f"({staleness.never_fetched} never fetched), "
+        f"oldest fetched at {staleness.oldest_fetched_at}"
+    )
+    for bucket, count in staleness.games_by_age.items():
+        print(f"  {bucket}: {count}")
+
+
+def run_scheduler(budget, window_seconds, stale_after, once=False):
+    while True:
+        window_started = time.monotonic()
+        # A window that fails as a whole, like on a locked db, is tried again
+        # in the next one instead of stopping the scheduler.
+        try:
+            refreshed = refresh_stale_games(budget, stale_after)
+            print(f"Refreshed {refreshed} games")
+            print_catalog_staleness(stale_after)
+        except Exception as e:
+            print(f"Refreshing the catalog failed: {e}")
+        if once:
+            return
+        time.sleep(max(0, window_seconds - (time.monotonic() - window_started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-fetch the stalest games from boardgamegeek."
+    )
+    parser.add_argument("db_file", nargs="?", default="boardgames/db/db.sqlite")
+    parser.add_argument("--budget", type=int, default=REFRESH_BUDGET)
+    parser.add_argument("--window", type=int, default=REFRESH_WINDOW_SECONDS)
+    parser.add_argument("--stale-days", type=int, default=STALE_AFTER.days)
+    parser.add_argument("--once", action="store_true")
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    db_session.global_init(args.db_file)
+    migrations.upgrade()
+    stale_after = datetime.timedelta(days=args.stale_days)
+    if args.stats:
+        print_catalog_staleness(stale_after)
+    else:
+        run_scheduler(args.budget, args.window, stale_after, once=args.once)
@@ -0,0 +1,302 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import boardgames.data.db_session as db_session
+from boardgames.data.users import User
+from . import filtered_games_service as fgs
+from . import metrics
+from .player_count_poll import get_player_count_bit
+from .tag_service import TAG_KINDS, split_tags
+
+# Upper bound for the number of games kept in memory over all cached users,
+# collections bigger than this on their own are always served from sql.
+MAX_CACHED_GAMES = int(os.environ.get("COLLECTION_CACHE_MAX_GAMES", 100000))
+
+# Columns kept as numpy arrays so filters and sorting run vectorized, the
+# rest are only needed for rendering and are kept as plain lists.
+ARRAY_COLUMNS = {
+    "bgg_game_id": np.int64,
+    "title": str,
+    "type": str,
+    "year_published": np.int64,
+    "min_players": np.int64,
+    "max_players": np.int64,
+    "min_playing_time": np.int64,
+    "max_playing_time": np.int64,
+    "average_weight": np.float64,
+    "average_rating": np.float64,
+    "user_suggested_best_player_count_mask": np.int64,
+    "user_suggested_recommended_player_count_mask": np.int64,
+}
+
+PLAYER_COUNT_MASK_COLUMNS = {
+    "Recommended": "user_suggested_recommended_player_count_mask",
+    "Best": "user_suggested_best_player_count_mask",
+}
+
+ALL_GAMES_FILTERS = fgs.DEFAULT_COLLECTION_FILTERS._replace(include_expansions=True)
+
+CacheStats = namedtuple(
+    "CacheStats",
+    [
+        "hits",
+        "misses",
+        "evictions",
+        "cached_collections",
+        "cached_games",
+    ],
+)
+
+
+class CachedCollection:
+    def __init__(self, version, games):
+        self.version = version
+        self.size = len(games)
+        self.keys = list(games[0].keys()) if games else []
+        self.row_type = namedtuple("CollectionGame", self.keys)
+        self.columns = {}
+        for i, key in enumerate(self.keys):
+            values = [game[i] for game in games]
+            if key in ARRAY_COLUMNS:
+                values = np.array(values, dtype=ARRAY_COLUMNS[key])
+            self.columns[key] = values
+        self.tag_rows = {kind: self._get_tag_rows(kind) for kind in TAG_KINDS}
+        self.facet_index = {kind: self._get_facet_index(kind) for kind in TAG_KINDS}
+
+    def _get_tag_rows(self, kind):
+        tag_rows = {}
+        for row, pipe_joined_tags in enumerate(self.columns.get(kind, [])):
+            for tag in split_tags(pipe_joined_tags):
+                tag_rows.setdefault(tag, []).append(row)
+        return {tag: np.array(rows) for tag, rows in tag_rows.items()}
+
+    def _get_facet_index(self, kind):
+        # Every (row, tag) pair flattened, so all tags of a kind are counted
+        # with a single bincount.
+        names = sorted(tag for tag in self.tag_rows[kind] if tag.strip() != "")
+        rows = [self.tag_rows[kind][name] for name in names]
+        tag_positions = np.repeat(np.arange(len(names)), [len(r) for r in rows])
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        return names, rows, tag_positions
+
+    def filter_games(self, filters):
+        return np.flatnonzero(self.select_games(filters))
+
+    def select_games(self, filters):
+        default = fgs.DEFAULT_COLLECTION_FILTERS
+        selected = np.ones(self.size, dtype=bool)
+        if self.size == 0:
+            return selected
+
+        if not filters.include_expansions:
+            selected &= self.columns["type"] != "boardgameexpansion"
+
+        if filters.player_count != default.player_count:
+            if filters.player_count_filter_type == "Possible":
+                player_count = float(filters.player_count)
+                selected &= self.columns["min_players"] <= player_count
+                selected &= self.columns["max_players"] >= player_count
+            else:
+                mask_column = PLAYER_COUNT_MASK_COLUMNS[
+                    filters.player_count_filter_type
+                ]
+                player_count_bit = get_player_count_bit(filters.player_count)
+                selected &= (self.columns[mask_column] & player_count_bit) != 0
+
+        for value, default_value, column, is_min in [
+            (
+                filters.min_playing_time,
+                default.min_playing_time,
+                "min_playing_time",
+                True,
+            ),
+            (
+                filters.max_playing_time,
+                default.max_playing_time,
+                "max_playing_time",
+                False,
+            ),
+            (filters.min_weight, default.min_weight, "average_weight", True),
+            (filters.max_weight, default.max_weight, "average_weight", False),
+        ]:
+            if value == default_value:
+                continue
+            if is_min:
+                selected &= self.columns[column] >= float(value)
+            else:
+                selected &= self.columns[column] <= float(value)
+
+        for kind, value, default_value in [
+            ("mechanics", filters.mechanic, default.mechanic),
+            ("categories", filters.category, default.category),
+            ("designers", filters.designer, default.designer),
+        ]:
+            if value == default_value:
+                continue
+            tagged = np.zeros(self.size, dtype=bool)
+            tagged[self.tag_rows[kind].get(value, [])] = True
+            selected &= tagged
+
+        return selected
+
+    def sort_games(self, indices, field_to_sort_by, sort_type):
+        if len(indices) == 0:
+            return indices
+        sort_column = self.columns[fgs.SORTING_FIELDS[field_to_sort_by]][indices]
+        # bgg_game_id breaks ties so the order is stable between requests.
+        order = np.lexsort((self.columns["bgg_game_id"][indices], sort_column))
+        if sort_type == "desc":
+            order = order[::-1]
+        return indices[order]
+
+    def get_games_page(
+        self, sorted_indices, field_to_sort_by, sort_type, after, page_size
+    ):
+        if after is not None:
+            sort_column = self.columns[fgs.SORTING_FIELDS[field_to_sort_by]]
+            sort_values = sort_column[sorted_indices]
+            bgg_game_ids = self.columns["bgg_game_id"][sorted_indices]
+            if sort_type == "desc":
+                comes_after = (sort_values < after.sort_value) | (
+                    (sort_values == after.sort_value)
+                    & (bgg_game_ids < after.bgg_game_id)
+                )
+            else:
+                comes_after = (sort_values > after.sort_value) | (
+                    (sort_values == after.sort_value)
+                    & (bgg_game_ids > after.bgg_game_id)
+                )
+            sorted_indices = sorted_indices[comes_after]
+        games = self.get_games(sorted_indices[: page_size + 1])
+        return fgs.create_games_page(games, field_to_sort_by, page_size)
+
+    def get_games(self, indices):
+        columns = []
+        for key in self.keys:
+            column = self.columns[key]
+            if isinstance(column, np.ndarray):
+                columns.append(column[indices].tolist())
+            else:
+                columns.append([column[i] for i in indices])
+        return [self.row_type._make(row) for row in zip(*columns)]
+
+    def get_collection_stats(self, indices):
+        if len(indices) == 0:
+            return fgs.CollectionStats(0, 0, 0)
+        expansions = int(
+            np.count_nonzero(self.columns["type"][indices] == "boardgameexpansion")
+        )
+        return fgs.CollectionStats(len(indices), len(indices) - expansions, expansions)
+
+    def get_facet_values(self, kind, filters):
+        names, rows, tag_positions = self.facet_index[kind]
+        selected = self.select_games(fgs.get_facet_filters(filters, kind))
+        counts = np.bincount(tag_positions[selected[rows]], minlength=len(names))
+        return [
+            fgs.FacetValue(name, int(count))
+            for name, count in zip(names, counts)
+            if count > 0
+        ]
+
+
+__cache: OrderedDict[str, CachedCollection] = OrderedDict()
+__cache_lock = threading.Lock()
+__cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+# Collection version of users with too many games to cache, so they are not
+# loaded again on every request only to be thrown away.
+__uncacheable_versions: dict[str, int] = {}
+
+
+def get_collection_version(username):
+    # Looked up once per session, a page view asks for it for the rendered
+    # page, the games and the facets, and should see one version throughout.
+    session = db_session.get_current_session()
+    versions = session.info.setdefault("collection_versions", {})
+    if username not in versions:
+        version = (
+            session.query(User.collection_version).filter(User.name == username).first()
+        )
+        versions[username] = version[0] if version else None
+    return versions[username]
+
+
+def get_collection(username):
+    version = get_collection_version(username)
+    if version is None:
+        return None
+
+    with __cache_lock:
+        collection = __cache.get(username)
+        if collection is not None and collection.version == version:
+            __cache.move_to_end(username)
+            __cache_counters["hits"] += 1
+            metrics.COLLECTION_CACHE_LOOKUPS.inc(result="hit")
+            return collection
+        if __uncacheable_versions.get(username) == version:
+            return None
+        __cache_counters["misses"] += 1
+        metrics.COLLECTION_CACHE_LOOKUPS.inc(result="miss")
+
+    games = fgs.get_games(username, ALL_GAMES_FILTERS)
+    if len(games) > MAX_CACHED_GAMES:
+        with __cache_lock:
+            __uncacheable_versions[username] = version
+        return None
+    collection = CachedCollection(version, games)
+
+    with __cache_lock:
+        __cache[username] = collection
+        __cache.move_to_end(username)
+        while get_cached_games() > MAX_CACHED_GAMES:
+            __cache.popitem(last=False)
+            __cache_counters["evictions"] += 1
+            metrics.COLLECTION_CACHE_EVICTIONS.inc()
+    return collection
+
+
+def get_cached_games():
+    return sum(collection.size for collection in __cache.values())
+
+
+def get_cache_stats():
+    with __cache_lock:
+        return CacheStats(
+            __cache_counters["hits"],
+            __cache_counters["misses"],
+            __cache_counters["evictions"],
+            len(__cache),
+            get_cached_games(),
+        )
+
+
+def find_games(username, filters, after=None, page_size=fgs.GAMES_PAGE_SIZE):
+    # Stats are only needed for the first page, later pages keep the banner.
+    # Searches are matched and ranked by fts5 so they always go to sqlite.
+    filters = fgs.normalize_filters(filters)
+    collection = None if filters.search else get_collection(username)
+    if collection is None:
+        page = fgs.get_games_page(username, filters, after, page_size)
+        if after is not None:
+            return page, None
+        return page, fgs.get_collection_stats(username, filters)
+
+    indices = collection.filter_games(filters)
+    sorted_indices = collection.sort_games(
+        indices, filters.sort_field, filters.sort_type
+    )
+    page = collection.get_games_page(
+        sorted_indices, filters.sort_field, filters.sort_type, after, page_size
+    )
+    if after is not None:
+        return page, None
+    return page, collection.get_collection_stats(indices)
+
+
+def get_facets(username, filters=fgs.DEFAULT_COLLECTION_FILTERS):
+    collection = None if filters.search else get_collection(username)
+    if collection is None:
+        return fgs.get_facets(username, filters)
+    return {kind: collection.get_facet_values(kind, filters) for kind in TAG_KINDS}
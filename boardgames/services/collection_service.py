@@ -1,197 +1,250 @@
+import datetime
+import os
 import time
-import xml.etree.ElementTree as ET
+from collections import namedtuple
 
-import requests
+import sqlalchemy as sa
 
-from .boardgame_xml_parser import BoardgameXMLParser
+from . import metrics
+from .bgg_fetcher import get_default_fetcher
+from .bgg_xml_stream import BoardgamegeekMessage, iterparse_games, iterparse_response
+from .search_service import index_games
+from .similar_games_service import update_index
+from .tag_service import insert_game_tags
 import boardgames.data.db_session as db_session
+import boardgames.data.import_jobs as import_jobs
 from boardgames.data.games import Game
 from boardgames.data.users import User
 from boardgames.data.user_games import UserGame
 
-BASE_URI = "https://www.boardgamegeek.com/xmlapi2/"
+INSERT_BATCH_SIZE = 200
+MODIFIED_SINCE_FORMAT = "%y-%m-%d %H:%M:%S"
+# bgg does not report games that were deleted from a collection, only ones
+# whose status changed, so every now and then the whole collection is synced.
+FULL_SYNC_INTERVAL = datetime.timedelta(
+    days=int(os.environ.get("FULL_SYNC_INTERVAL_DAYS", 7))
+)
+# Covers clock differences with bgg, games synced twice are simply unchanged.
+SYNC_OVERLAP = datetime.timedelta(days=1)
 
+CollectionItem = namedtuple("CollectionItem", ["bgg_game_id", "user_rating", "owned"])
 
-def get_users_collection(username):
-    collections_endpoint = BASE_URI + "collection?"
-    parameters = f"username={username}&stats=1&own=1"
-    return requests.get(collections_endpoint + parameters)
+# to_insert and to_update map bgg_game_id to rating, to_delete is a set of ids.
+UserGamesDiff = namedtuple("UserGamesDiff", ["to_insert", "to_delete", "to_update"])
 
 
-def get_xml_string_from_response(response):
-    return ET.fromstring(response.text)
-
-
-def get_game_ids_from_collection(collection_element_tree):
-    return [child.attrib["objectid"] for child in collection_element_tree]
-
-
-def get_user_ratings_from_collection(collection_element_tree):
-    user_ratings_from_xml = [
-        child.find(".//rating").get("value") for child in collection_element_tree
-    ]
-    return [
-        None if user_rating == "N/A" else user_rating
-        for user_rating in user_ratings_from_xml
-    ]
-
-
-def get_games_from_game_ids(game_ids):
-    comma_seperated_game_ids = ",".join(game_ids)
-    thing_endpoint = BASE_URI + "thing?"
-    parameters = f"id={comma_seperated_game_ids}&stats=1"
-    return requests.get(thing_endpoint + parameters)
+def get_users_collection(username, modified_since=None):
+    parameters = {"username": username, "stats": 1}
+    if modified_since is None:
+        parameters["own"] = 1
+    else:
+        # Without the own filter games removed from the collection since the
+        # last sync are included too, with own="0".
+        parameters["modifiedsince"] = modified_since.strftime(MODIFIED_SINCE_FORMAT)
+    return get_default_fetcher().open("collection", parameters)
+
+
+def get_user_game_from_collection_item(collection_item):
+    user_rating = collection_item.find(".//rating").get("value")
+    return CollectionItem(
+        int(collection_item.get("objectid")),
+        None if user_rating == "N/A" else user_rating,
+        collection_item.find("status").get("own") == "1",
+    )
 
 
 def insert_user_into_database(username):
-    session = db_session.create_session()
-    user = User(name=username)
-    session.add(user)
-    session.commit()
+    with db_session.create_session() as session:
+        user = User(name=username)
+        session.add(user)
+        session.commit()
 
 
 def check_user_in_database(username):
-    session = db_session.create_session()
-    user_in_database = session.query(User).filter(User.name == username).first()
-    return user_in_database is not None
-
-
-def insert_user_games_into_database(username, user_games):
-    session = db_session.create_session()
-    user_id_from_name = session.query(User.id).filter(User.name == username).first()
-    user_games_to_be_inserted = []
-    for user_game in user_games:
-        ug = UserGame(
-            user_id=user_id_from_name[0],
-            bgg_game_id=user_game[0],
-            user_rating=user_game[1],
-        )
-        user_games_to_be_inserted.append(ug)
-    session.bulk_save_objects(user_games_to_be_inserted)
+    with db_session.create_session() as session:
+        user_in_database = session.query(User).filter(User.name == username).first()
+        return user_in_database is not None
+
+
+def get_user_games_from_boardgamegeek(username, modified_since=None):
+    # A game shows up once per copy, it is owned if any of the copies is.
+    collection_items = {}
+    with get_users_collection(username, modified_since) as collection:
+        try:
+            for collection_item in iterparse_response(collection):
+                item = get_user_game_from_collection_item(collection_item)
+                known_item = collection_items.get(item.bgg_game_id)
+                if known_item is not None:
+                    item = CollectionItem(
+                        item.bgg_game_id,
+                        known_item.user_rating or item.user_rating,
+                        known_item.owned or item.owned,
+                    )
+                collection_items[item.bgg_game_id] = item
+        except BoardgamegeekMessage as message:
+            print(message)
+            if str(message) == "Invalid username specified":
+                return "invalid username"
+            if (
+                str(message)
+                == "Your request for this collection has been accepted and will be processed.  Please try again later for access."
+            ):
+                return "waiting"
+            raise
+    return list(collection_items.values())
 
-    session.commit()
 
+def get_game_ids_not_currently_in_db(game_ids):
+    with db_session.create_session() as session:
+        games_already_in_db = {
+            game[0]
+            for game in session.query(Game.bgg_game_id)
+            .filter(Game.bgg_game_id.in_(game_ids))
+            .all()
+        }
 
-def get_user_games_from_boardgamegeek(username):
-    collection = get_users_collection(username)
-    collection_et = get_xml_string_from_response(collection)
-    print(collection_et.text.strip())
-    try:
-        if collection_et.find(".//message").text == "Invalid username specified":
-            return "invalid username"
-    except AttributeError:
-        pass
-    try:
-        if (
-            collection_et.text.strip()
-            == "Your request for this collection has been accepted and will be processed.  Please try again later for access."
-        ):
-            return "waiting"
-    except AttributeError:
-        pass
-    user_game_ids = get_game_ids_from_collection(collection_et)
-    user_ratings = get_user_ratings_from_collection(collection_et)
-    return list(set(zip(user_game_ids, user_ratings)))
+    return [game_id for game_id in game_ids if int(game_id) not in games_already_in_db]
 
 
-def get_game_ids_not_currently_in_db(game_ids):
-    session = db_session.create_session()
-    games_already_in_db = (
-        session.query(Game.bgg_game_id).filter(Game.bgg_game_id.in_(game_ids)).all()
-    )
-    games_already_in_db = [game[0] for game in games_already_in_db]
+def get_modified_since(username):
+    with db_session.create_session() as session:
+        last_synced_at = (
+            session.query(User.last_synced_at).filter(User.name == username).scalar()
+        )
+        if last_synced_at is None:
+            return None
+        if datetime.datetime.utcnow() - last_synced_at > FULL_SYNC_INTERVAL:
+            return None
+        return last_synced_at - SYNC_OVERLAP
 
-    return [game_id for game_id in game_ids if int(game_id) not in games_already_in_db]
 
+def parse_user_rating(user_rating):
+    return None if user_rating is None else float(user_rating)
 
-def get_user_games_not_currently_in_db(username, user_games):
-    session = db_session.create_session()
-    bgg_game_ids = [int(user_game[0]) for user_game in user_games]
 
-    user_id = session.query(User.id).filter(User.name == username).first()[0]
+def diff_user_games(session, user_id, collection_items, full_sync):
+    owned = {
+        item.bgg_game_id: parse_user_rating(item.user_rating)
+        for item in collection_items
+        if item.owned
+    }
+    user_games_query = session.query(UserGame.bgg_game_id, UserGame.user_rating).filter(
+        UserGame.user_id == user_id
+    )
+    if not full_sync:
+        user_games_query = user_games_query.filter(
+            UserGame.bgg_game_id.in_([item.bgg_game_id for item in collection_items])
+        )
+    in_db = {
+        bgg_game_id: parse_user_rating(user_rating)
+        for bgg_game_id, user_rating in user_games_query
+    }
+
+    to_insert = {
+        bgg_game_id: owned[bgg_game_id] for bgg_game_id in owned.keys() - in_db.keys()
+    }
+    # A full sync lists every owned game, an incremental one only what changed.
+    to_delete = in_db.keys() - owned.keys()
+    to_update = {
+        bgg_game_id: owned[bgg_game_id]
+        for bgg_game_id in owned.keys() & in_db.keys()
+        if owned[bgg_game_id] != in_db[bgg_game_id]
+    }
+    return UserGamesDiff(to_insert, to_delete, to_update)
+
+
+def sync_user_games(username, collection_items, full_sync, synced_at):
+    with db_session.create_session() as session:
+        user_id = session.query(User.id).filter(User.name == username).scalar()
+        diff = diff_user_games(session, user_id, collection_items, full_sync)
+
+        if diff.to_insert:
+            session.execute(
+                sa.insert(UserGame),
+                [
+                    {
+                        "user_id": user_id,
+                        "bgg_game_id": bgg_game_id,
+                        "user_rating": rating,
+                    }
+                    for bgg_game_id, rating in diff.to_insert.items()
+                ],
+            )
+        if diff.to_delete:
+            session.query(UserGame).filter(UserGame.user_id == user_id).filter(
+                UserGame.bgg_game_id.in_(diff.to_delete)
+            ).delete(synchronize_session=False)
+        if diff.to_update:
+            session.execute(
+                sa.update(UserGame)
+                .where(UserGame.user_id == user_id)
+                .where(UserGame.bgg_game_id == sa.bindparam("b_bgg_game_id"))
+                .values(user_rating=sa.bindparam("b_user_rating")),
+                [
+                    {"b_bgg_game_id": bgg_game_id, "b_user_rating": rating}
+                    for bgg_game_id, rating in diff.to_update.items()
+                ],
+            )
+        if diff.to_insert or diff.to_delete or diff.to_update:
+            bump_collection_version(session, username)
+        session.query(User).filter(User.id == user_id).update(
+            {User.last_synced_at: synced_at}, synchronize_session=False
+        )
 
-    user_games_bgg_id_in_db = (
-        session.query(UserGame.bgg_game_id)
-        .filter(UserGame.user_id == user_id)
-        .filter(UserGame.bgg_game_id.in_(bgg_game_ids))
-        .all()
+        session.commit()
+    print(
+        f"Synced {username}: {len(diff.to_insert)} added, "
+        f"{len(diff.to_delete)} removed, {len(diff.to_update)} ratings updated"
     )
-    print(user_games_bgg_id_in_db)
-    user_games_bgg_id_in_db = [game[0] for game in user_games_bgg_id_in_db]
-    user_game_ids_in_db_but_not_in_collection = [
-        db_user_game_id
-        for db_user_game_id in user_games_bgg_id_in_db
-        if db_user_game_id not in bgg_game_ids
-    ]
-    user_games_not_in_db = [
-        user_game
-        for user_game in user_games
-        if int(user_game[0]) not in user_games_bgg_id_in_db
-    ]
-    return (user_games_not_in_db, user_game_ids_in_db_but_not_in_collection)
+    return diff
 
 
-def remove_user_games_in_database(username, user_game_ids_to_remove):
-    session = db_session.create_session()
-    user_id = session.query(User.id).filter(User.name == username).first()[0]
+def bump_collection_version(session, username):
+    session.query(User).filter(User.name == username).update(
+        {User.collection_version: User.collection_version + 1},
+        synchronize_session=False,
+    )
 
-    session.query(UserGame).filter(UserGame.user_id == user_id).filter(
-        UserGame.bgg_game_id.in_(user_game_ids_to_remove)
-    ).delete(synchronize_session=False)
 
-    session.commit()
+def get_general_game_data_from_boardgamegeek(game_ids):
+    for games_content in get_default_fetcher().fetch_things(game_ids):
+        yield from iterparse_games(games_content)
 
 
-def get_general_game_data_from_boardgamegeek(game_ids):
-    max_items_to_get = 20 # limitation in bgg, how many items to get per api call.
-    if len(game_ids) > max_items_to_get:
-        game_ids_in_sublists = [
-            game_ids[i : i + max_items_to_get] for i in range(0, len(game_ids), max_items_to_get)
-        ]
-        game_objects = []
-        for sublist in game_ids_in_sublists:
-            games_request = get_games_from_game_ids(sublist)
-            games_et = get_xml_string_from_response(games_request)
-            game_objects += [BoardgameXMLParser(game) for game in games_et]
-        return game_objects
-    else:
-        games_request = get_games_from_game_ids(game_ids)
-        games_et = get_xml_string_from_response(games_request)
-        return [BoardgameXMLParser(game) for game in games_et]
+def report_no_progress(status, games_fetched=0, games_total=0):
+    pass
 
 
-def add_new_users_collection_to_db(username, user_exists=False):
-    num_tries = 5
+def add_new_users_collection_to_db(
+    username, user_exists=False, num_tries=5, report_progress=report_no_progress
+):
+    synced_at = datetime.datetime.utcnow()
+    modified_since = get_modified_since(username) if user_exists else None
     for try_ in range(num_tries):
-        user_games = get_user_games_from_boardgamegeek(username)
-        if user_games == "invalid username":
+        collection_items = get_user_games_from_boardgamegeek(username, modified_since)
+        if collection_items == "invalid username":
             return "invalid username"
-        elif user_games == "waiting":
+        elif collection_items == "waiting":
+            metrics.BGG_COLLECTION_NOT_READY.inc()
+            report_progress(import_jobs.WAITING_ON_BGG)
             time.sleep(5)
             print("waiting for boardgamegeek")
         else:
             break
+    else:
+        return "waiting"
 
-    if user_exists:
-        (
-            user_games_not_in_db,
-            user_game_ids_in_db_but_not_in_collection,
-        ) = get_user_games_not_currently_in_db(username, user_games)
-
-    game_ids = [game_id for game_id, _ in user_games]
+    game_ids = [item.bgg_game_id for item in collection_items if item.owned]
     unique_game_ids_not_already_in_database = prepare_set_of_games_not_already_in_db(
         game_ids
     )
 
-    insert_board_game_info(unique_game_ids_not_already_in_database)
+    insert_board_game_info(unique_game_ids_not_already_in_database, report_progress)
     if not user_exists:
         insert_user_into_database(username)
-        insert_user_games_into_database(username, user_games)
-    else:
-        insert_user_games_into_database(username, user_games_not_in_db)
-        remove_user_games_in_database(
-            username, user_game_ids_in_db_but_not_in_collection
-        )
+    sync_user_games(
+        username, collection_items, modified_since is None, synced_at=synced_at
+    )
 
 
 def prepare_set_of_games_not_already_in_db(game_ids):
@@ -199,44 +252,69 @@ def prepare_set_of_games_not_already_in_db(game_ids):
     return list(set(game_ids_not_already_in_database))
 
 
-def insert_board_game_info(game_ids):
+def get_game_columns(bg):
+    return {
+        "bgg_game_id": bg.id,
+        "title": bg.title,
+        "type": bg.type,
+        "description": bg.description,
+        "year_published": bg.year_published,
+        "image_url": bg.image,
+        "thumbnail_url": bg.thumbnail,
+        "min_players": bg.min_players_from_creators,
+        "max_players": bg.max_players_from_creators,
+        "playing_time": bg.playing_time,
+        "min_playing_time": bg.min_playing_time,
+        "max_playing_time": bg.max_playing_time,
+        "min_age": bg.min_age,
+        "average_rating": bg.average_rating,
+        "bayes_average_rating": bg.bayes_average_rating,
+        "board_game_rank": bg.board_game_rank,
+        "average_weight": bg.average_weight,
+        "weight_votes": bg.weight_votes,
+        "designers": bg.designers,
+        "mechanics": bg.mechanics,
+        "categories": bg.categories,
+        "user_suggested_best_number_of_players": bg.user_suggested_best_number_of_players,
+        "user_suggested_recommended_number_of_players": bg.user_suggested_recommended_number_of_players,
+        "user_suggested_recommended_not_best_number_of_players": bg.user_suggested_recommended_not_best_number_of_players,
+        "user_suggested_best_player_count_mask": bg.user_suggested_best_player_count_mask,
+        "user_suggested_recommended_player_count_mask": bg.user_suggested_recommended_player_count_mask,
+    }
+
+
+def insert_board_game_info(game_ids, report_progress=report_no_progress):
     if game_ids is None:
         return
+    games_fetched = 0
+    report_progress(import_jobs.FETCHING, games_fetched, len(game_ids))
     general_game_data_for_user_games = get_general_game_data_from_boardgamegeek(
         game_ids
     )
-    session = db_session.create_session()
-    games_to_be_inserted = []
-    for i, bg in enumerate(general_game_data_for_user_games):
-
-        bg_sql = Game(
-            bgg_game_id=bg.id,
-            title=bg.title,
-            type=bg.type,
-            description=bg.description,
-            year_published=bg.year_published,
-            image_url=bg.image,
-            thumbnail_url=bg.thumbnail,
-            min_players=bg.min_players_from_creators,
-            max_players=bg.max_players_from_creators,
-            playing_time=bg.playing_time,
-            min_playing_time=bg.min_playing_time,
-            max_playing_time=bg.max_playing_time,
-            min_age=bg.min_age,
-            average_rating=bg.average_rating,
-            bayes_average_rating=bg.bayes_average_rating,
-            board_game_rank=bg.board_game_rank,
-            average_weight=bg.average_weight,
-            weight_votes=bg.weight_votes,
-            designers=bg.designers,
-            mechanics=bg.mechanics,
-            categories=bg.categories,
-            user_suggested_best_number_of_players=bg.user_suggested_best_number_of_players,
-            user_suggested_recommended_number_of_players=bg.user_suggested_recommended_number_of_players,
-            user_suggested_recommended_not_best_number_of_players=bg.user_suggested_recommended_not_best_number_of_players,
-        )
-        games_to_be_inserted.append(bg_sql)
-
-    session.bulk_save_objects(games_to_be_inserted)
-
-    session.commit()
+    with db_session.create_session() as session:
+        games_to_be_inserted = []
+        parsed_games = []
+        for bg in general_game_data_for_user_games:
+            bg_sql = Game(**get_game_columns(bg))
+            games_to_be_inserted.append(bg_sql)
+            parsed_games.append((bg.id, bg))
+            if len(games_to_be_inserted) >= INSERT_BATCH_SIZE:
+                session.bulk_save_objects(games_to_be_inserted)
+                insert_game_tags(session, parsed_games)
+                index_games(session, parsed_games)
+                # Commit so the write lock is released while the next batch is
+                # fetched and progress can be written from the job's session.
+                session.commit()
+                metrics.IMPORTED_GAMES.inc(len(games_to_be_inserted))
+                games_fetched += len(games_to_be_inserted)
+                report_progress(import_jobs.FETCHING, games_fetched, len(game_ids))
+                games_to_be_inserted = []
+                parsed_games = []
+
+        session.bulk_save_objects(games_to_be_inserted)
+        insert_game_tags(session, parsed_games)
+        index_games(session, parsed_games)
+
+        session.commit()
+    metrics.IMPORTED_GAMES.inc(len(games_to_be_inserted))
+    update_index()
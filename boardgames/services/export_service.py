@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from . import filtered_games_service as fgs
+from .tag_service import split_tags
+
+# pyarrow is big and only needed for the parquet and arrow exports, which are
+# turned away without it.
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows fetched from the cursor and written out at a time.
+EXPORT_BATCH_SIZE = 1000
+# Rows per parquet row group or arrow record batch, one is held in memory.
+ARROW_BATCH_SIZE = 10000
+
+# (column, exported type) pairs. The types are not taken from the models, sqlite
+# keeps whatever it is given and the ratings are floats in Integer columns,
+# the rank is "Not Ranked" for unranked games. Values that are not numbers
+# are exported as nulls. Lists are pipe joined in the db, they stay that way
+# in csv and are lists elsewhere.
+EXPORT_COLUMNS = [
+    (Game.bgg_game_id, "int"),
+    (Game.title, "str"),
+    (Game.type, "str"),
+    (Game.year_published, "int"),
+    (Game.min_players, "int"),
+    (Game.max_players, "int"),
+    (Game.min_playing_time, "int"),
+    (Game.max_playing_time, "int"),
+    (Game.min_age, "int"),
+    (Game.average_weight, "float"),
+    (Game.average_rating, "float"),
+    (Game.board_game_rank, "int"),
+    (UserGame.user_rating, "float"),
+    (Game.designers, "list"),
+    (Game.mechanics, "list"),
+    (Game.categories, "list"),
+    (Game.user_suggested_best_number_of_players, "list"),
+    (Game.user_suggested_recommended_number_of_players, "list"),
+    (Game.thumbnail_url, "str"),
+]
+COLUMN_NAMES = [column.key for column, _ in EXPORT_COLUMNS]
+COLUMN_TYPES = [column_type for _, column_type in EXPORT_COLUMNS]
+
+# Format: (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+ARROW_FORMATS = {"parquet", "arrow"}
+# Offered on the collection page, arrow is left to clients that ask for it.
+LINKED_FORMATS = ["csv", "ndjson", "parquet"]
+
+
+def is_format_available(export_format):
+    return export_format in EXPORT_FORMATS and (
+        export_format not in ARROW_FORMATS or pyarrow is not None
+    )
+
+
+def get_linked_formats():
+    return [
+        export_format
+        for export_format in LINKED_FORMATS
+        if is_format_available(export_format)
+    ]
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    number = to_float(value)
+    return None if number is None else int(number)
+
+
+def to_str(value):
+    return None if value is None else str(value)
+
+
+def to_pipe_joined(value):
+    return value or ""
+
+
+CONVERTERS = {"int": to_int, "float": to_float, "str": to_str, "list": to_pipe_joined}
+
+
+def convert_game(game):
+    return [
+        CONVERTERS[column_type](value) for column_type, value in zip(COLUMN_TYPES, game)
+    ]
+
+
+def get_export_query(session, username, filters):
+    filters = fgs.normalize_filters(filters)
+    query = (
+        session.query(*[column for column, _ in EXPORT_COLUMNS])
+        .select_from(Game)
+        .join(UserGame, UserGame.bgg_game_id == Game.bgg_game_id)
+        .join(User, User.id == UserGame.user_id)
+        .filter(User.name == username)
+    )
+    query = fgs.filter_games_query(query, filters)
+    query = fgs.apply_sorting(query, filters.sort_field, filters.sort_type)
+    # Rows are read off the cursor as they are written instead of all at once.
+    return query.yield_per(EXPORT_BATCH_SIZE)
+
+
+def iterate_batches(query):
+    batch = []
+    for game in query:
+        # A search adds its rank column, zip only keeps the export columns.
+        batch.append(convert_game(game))
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_records(batch):
+    return [
+        {
+            name: split_tags(value) if column_type == "list" else value
+            for name, column_type, value in zip(COLUMN_NAMES, COLUMN_TYPES, game)
+        }
+        for game in batch
+    ]
+
+
+def to_columns(rows):
+    return {
+        name: (
+            [split_tags(value) for value in values]
+            if column_type == "list"
+            else list(values)
+        )
+        for name, column_type, values in zip(COLUMN_NAMES, COLUMN_TYPES, zip(*rows))
+    }
+
+
+def export_csv(batches):
+    content = io.StringIO()
+    writer = csv.writer(content)
+    writer.writerow(COLUMN_NAMES)
+    for batch in batches:
+        writer.writerows(batch)
+        yield content.getvalue()
+        content.seek(0)
+        content.truncate()
+    yield content.getvalue()
+
+
+def export_ndjson(batches):
+    for batch in batches:
+        yield "".join(json.dumps(record) + "\n" for record in to_records(batch))
+
+
+def get_arrow_schema():
+    types = {
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "str": pyarrow.string(),
+        "list": pyarrow.list_(pyarrow.string()),
+    }
+    return pyarrow.schema(
+        [
+            (name, types[column_type])
+            for name, column_type in zip(COLUMN_NAMES, COLUMN_TYPES)
+        ]
+    )
+
+
+class StreamingSink:
+    # Collects what a writer wrote until it is sent, counting every byte so
+    # the writer sees the file positions it expects.
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_arrow(batches, export_format):
+    schema = get_arrow_schema()
+    sink = StreamingSink()
+    output = pyarrow.PythonFile(sink, mode="w")
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(output, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(output, schema)
+    rows = []
+    for batch in batches:
+        rows.extend(batch)
+        if len(rows) >= ARROW_BATCH_SIZE:
+            writer.write_table(pyarrow.Table.from_pydict(to_columns(rows), schema))
+            rows = []
+            yield sink.drain()
+    if rows:
+        writer.write_table(pyarrow.Table.from_pydict(to_columns(rows), schema))
+    writer.close()
+    yield sink.drain()
+
+
+def export_games(username, filters, export_format):
+    # The query is built before the response starts, only running it is
+    # streamed.
+    session = db_session.get_current_session()
+    batches = iterate_batches(get_export_query(session, username, filters))
+    if export_format == "csv":
+        return export_csv(batches)
+    if export_format == "ndjson":
+        return export_ndjson(batches)
+    return export_arrow(batches, export_format)
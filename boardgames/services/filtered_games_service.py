@@ -1,11 +1,17 @@
-import pandas as pd
 from collections import namedtuple
 
+import json
+
+import sqlalchemy as sa
+
 import boardgames.data.db_session as db_session
 from boardgames.data.games import Game
+from boardgames.data.tags import GameTag, Tag
 from boardgames.data.user_games import UserGame
 from boardgames.data.users import User
-
+from .player_count_poll import get_player_count_bit
+from .search_service import create_match_query, games_fts
+from .tag_service import TAG_KINDS, get_games_tagged_with
 
 GameCollectionFilters = namedtuple(
     "GameCollectionFilters",
@@ -20,6 +26,7 @@ GameCollectionFilters = namedtuple(
         "category",
         "designer",
         "include_expansions",
+        "search",
         "sort_field",
         "sort_type",
     ],
@@ -33,8 +40,33 @@ SORTING_FIELDS = {
     "BGG rating": "average_rating",
     "Year Published": "year_published",
     "Title": "title",
+    "Relevance": "search_rank",
+}
+
+# Sorts by the bm25 rank of the search, best matches first when ascending.
+RELEVANCE_SORT_FIELD = "Relevance"
+
+SORT_TYPES = ["asc", "desc"]
+PLAYER_COUNT_FILTER_TYPES = ["Possible", "Recommended", "Best"]
+
+
+# Tag kind: filter field selecting one of its tags
+FACET_FILTER_FIELDS = {
+    "mechanics": "mechanic",
+    "categories": "category",
+    "designers": "designer",
 }
 
+FacetValue = namedtuple("FacetValue", ["name", "count"])
+
+
+GAMES_PAGE_SIZE = 50
+
+# Sort column value and bgg_game_id of the last game on the previous page.
+PageCursor = namedtuple("PageCursor", ["sort_value", "bgg_game_id"])
+
+GamesPage = namedtuple("GamesPage", ["games", "next_cursor"])
+
 
 CollectionStats = namedtuple(
     "CollectionStats",
@@ -57,46 +89,164 @@ DEFAULT_COLLECTION_FILTERS = GameCollectionFilters(
     designer="Any",
     category="Any",
     include_expansions=False,
+    search="",
     sort_field="Title",
     sort_type="asc",
 )
 
 
-def get_user_id_from_username(username):
-    session = db_session.create_session()
-    return session.query(User.id).filter(User.name == username).first()[0]
+def normalize_filters(filters):
+    # There is nothing to rank by without a search, the default order is used.
+    if (
+        filters.sort_field == RELEVANCE_SORT_FIELD
+        and create_match_query(filters.search) is None
+    ):
+        return filters._replace(sort_field=DEFAULT_COLLECTION_FILTERS.sort_field)
+    return filters
+
+
+def is_number(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def are_valid_filters(filters):
+    # For filters that don't come from the form, like the ones of an export url.
+    default = DEFAULT_COLLECTION_FILTERS
+    if filters.sort_field not in SORTING_FIELDS or filters.sort_type not in SORT_TYPES:
+        return False
+    if filters.player_count_filter_type not in PLAYER_COUNT_FILTER_TYPES:
+        return False
+    if filters.player_count != default.player_count and not (
+        str(filters.player_count).isdigit()
+    ):
+        return False
+    return all(
+        value == default_value or is_number(value)
+        for value, default_value in [
+            (filters.min_playing_time, default.min_playing_time),
+            (filters.max_playing_time, default.max_playing_time),
+            (filters.min_weight, default.min_weight),
+            (filters.max_weight, default.max_weight),
+        ]
+    )
 
 
 def get_games(username, filters=DEFAULT_COLLECTION_FILTERS):
-    session = db_session.create_session()
-    user_id = get_user_id_from_username(username)
-    base_query = (
-        session.query(
-            Game.thumbnail_url,
-            Game.bgg_game_id,
-            Game.title,
-            Game.type,
-            Game.year_published,
-            Game.description,
-            Game.designers,
-            Game.min_players,
-            Game.max_players,
-            Game.min_playing_time,
-            Game.max_playing_time,
-            Game.mechanics,
-            Game.categories,
-            Game.average_weight,
-            Game.average_rating,
-            Game.board_game_rank,
-            Game.user_suggested_best_number_of_players,
-            Game.user_suggested_recommended_number_of_players,
-            Game.user_suggested_recommended_not_best_number_of_players,
-        )
+    filters = normalize_filters(filters)
+    session = db_session.get_current_session()
+    query = get_filtered_games_query(session, username, filters)
+    return apply_sorting(query, filters.sort_field, filters.sort_type).all()
+
+
+def get_games_page(
+    username, filters=DEFAULT_COLLECTION_FILTERS, after=None, page_size=GAMES_PAGE_SIZE
+):
+    session = db_session.get_current_session()
+    base_query = get_user_games_query(session, username)
+    return query_games_page(base_query, filters, after, page_size)
+
+
+def query_games_page(base_query, filters, after, page_size):
+    filters = normalize_filters(filters)
+    query = filter_games_query(base_query, filters)
+    if after is not None:
+        query = apply_keyset(query, filters.sort_field, filters.sort_type, after)
+    query = apply_sorting(query, filters.sort_field, filters.sort_type)
+    games = query.limit(page_size + 1).all()
+    return create_games_page(games, filters.sort_field, page_size)
+
+
+def create_games_page(games, field_to_sort_by, page_size):
+    if len(games) <= page_size:
+        return GamesPage(games, None)
+    last_game = games[page_size - 1]
+    next_cursor = PageCursor(
+        getattr(last_game, SORTING_FIELDS[field_to_sort_by]), last_game.bgg_game_id
+    )
+    return GamesPage(games[:page_size], next_cursor)
+
+
+def parse_page_cursor(field_to_sort_by, sort_value, bgg_game_id):
+    if SORTING_FIELDS[field_to_sort_by] != "title":
+        sort_value = float(sort_value)
+    return PageCursor(sort_value, int(bgg_game_id))
+
+
+def get_filtered_games_query(session, username, filters):
+    return filter_games_query(get_user_games_query(session, username), filters)
+
+
+def get_user_games_query(session, username):
+    return (
+        get_games_query(session)
         .join(UserGame, UserGame.bgg_game_id == Game.bgg_game_id)
-        .filter(UserGame.user_id == user_id)
+        .join(User, User.id == UserGame.user_id)
+        .filter(User.name == username)
+    )
+
+
+def get_group_games_query(session, game_ids):
+    # The ids are passed as one json array, a group can own more games than
+    # sqlite allows bound parameters.
+    ids = sa.func.json_each(json.dumps([int(game_id) for game_id in game_ids]))
+    ids = ids.table_valued("value")
+    return get_games_query(session).filter(Game.bgg_game_id.in_(sa.select(ids.c.value)))
+
+
+def get_games_query(session):
+    # Descriptions are most of a game's bytes and only shown once a game is
+    # expanded, they are loaded then with get_game_details.
+    return session.query(
+        Game.thumbnail_url,
+        Game.bgg_game_id,
+        Game.title,
+        Game.type,
+        Game.year_published,
+        Game.designers,
+        Game.min_players,
+        Game.max_players,
+        Game.min_playing_time,
+        Game.max_playing_time,
+        Game.mechanics,
+        Game.categories,
+        Game.average_weight,
+        Game.average_rating,
+        Game.board_game_rank,
+        Game.user_suggested_best_number_of_players,
+        Game.user_suggested_recommended_number_of_players,
+        Game.user_suggested_recommended_not_best_number_of_players,
+        Game.user_suggested_best_player_count_mask,
+        Game.user_suggested_recommended_player_count_mask,
+    )
+
+
+def get_game_details(bgg_game_id):
+    session = db_session.get_current_session()
+    return (
+        session.query(Game.bgg_game_id, Game.title, Game.description)
+        .filter(Game.bgg_game_id == bgg_game_id)
+        .first()
+    )
+
+
+def filter_games_query(query, filters):
+    query = apply_search(query, filters.search)
+    return apply_filters_to_get_games(query, filters)
+
+
+def apply_search(query, search):
+    match_query = create_match_query(search)
+    if match_query is None:
+        return query
+    return (
+        query.add_columns(games_fts.c.rank.label("search_rank"))
+        .join(games_fts, games_fts.c.rowid == Game.bgg_game_id)
+        .filter(games_fts.c.games_fts.op("MATCH")(match_query))
     )
-    query = apply_filters_to_get_games(base_query, filters)
-    return query.all()
 
 
 def apply_filters_to_get_games(query, filters):
@@ -140,27 +290,22 @@ def apply_filters_to_get_games(query, filters):
         "less or equal",
     )
 
-    query = apply_filter_for_list_field(
-        query, Game.mechanics, DEFAULT_COLLECTION_FILTERS.mechanic, filters.mechanic
+    query = apply_tag_filter(
+        query, "mechanics", DEFAULT_COLLECTION_FILTERS.mechanic, filters.mechanic
     )
-    query = apply_filter_for_list_field(
-        query, Game.categories, DEFAULT_COLLECTION_FILTERS.category, filters.category
+    query = apply_tag_filter(
+        query, "categories", DEFAULT_COLLECTION_FILTERS.category, filters.category
     )
-    query = apply_filter_for_list_field(
-        query, Game.designers, DEFAULT_COLLECTION_FILTERS.designer, filters.designer
+    query = apply_tag_filter(
+        query, "designers", DEFAULT_COLLECTION_FILTERS.designer, filters.designer
     )
     return query
 
 
-def apply_filter_for_list_field(query, field, default_filter_value, value):
+def apply_tag_filter(query, kind, default_filter_value, value):
     if value == default_filter_value:
         return query
-    return query.filter(
-        (field.like(f"%|{value}|%"))
-        | (field.like(f"%|{value}"))
-        | (field.like(f"{value}|%"))
-        | (field == f"{value}")
-    )
+    return query.filter(Game.bgg_game_id.in_(get_games_tagged_with(kind, value)))
 
 
 def apply_player_count_filter(query, filters):
@@ -171,22 +316,25 @@ def apply_player_count_filter(query, filters):
             Game.max_players >= filters.player_count
         )
     if filters.player_count_filter_type == "Recommended":
-        return apply_filter_for_list_field(
+        return apply_player_count_mask_filter(
             query,
-            Game.user_suggested_recommended_number_of_players,
-            DEFAULT_COLLECTION_FILTERS.player_count,
+            Game.user_suggested_recommended_player_count_mask,
             filters.player_count,
         )
 
     if filters.player_count_filter_type == "Best":
-        return apply_filter_for_list_field(
+        return apply_player_count_mask_filter(
             query,
-            Game.user_suggested_best_number_of_players,
-            DEFAULT_COLLECTION_FILTERS.player_count,
+            Game.user_suggested_best_player_count_mask,
             filters.player_count,
         )
 
 
+def apply_player_count_mask_filter(query, mask_field, player_count):
+    player_count_bit = get_player_count_bit(player_count)
+    return query.filter(mask_field.op("&")(player_count_bit) != 0)
+
+
 def apply_size_comparison_filter(
     query, filters_value, game_value, default_value, filter_type
 ):
@@ -205,40 +353,91 @@ def apply_expansion_filter(query, filters):
         return query
 
 
-def get_collection_stats(games_query_result):
-    games = pd.DataFrame(games_query_result)
-    if games.shape[0] == 0:
-        return CollectionStats(0, 0, 0)
-    games.columns = games_query_result[0].keys()
-    all_games = games.shape[0]
-    base_games = games[games["type"] != "boardgameexpansion"].shape[0]
-    expansions = games[games["type"] == "boardgameexpansion"].shape[0]
+def get_sort_column(field_to_sort_by):
+    if field_to_sort_by == RELEVANCE_SORT_FIELD:
+        return games_fts.c.rank
+    return getattr(Game, SORTING_FIELDS[field_to_sort_by])
 
-    return CollectionStats(all_games, base_games, expansions)
 
+def apply_sorting(query, field_to_sort_by, sort_type):
+    sort_column = get_sort_column(field_to_sort_by)
+    # Nulls go last in both directions, bgg_game_id makes the order stable.
+    if sort_type == "desc":
+        return query.order_by(
+            sort_column.is_(None), sort_column.desc(), Game.bgg_game_id.desc()
+        )
+    return query.order_by(sort_column.is_(None), sort_column, Game.bgg_game_id)
 
-def sort_filtered_games(filtered_games, field_to_sort_by, sort_type):
-    if len(filtered_games) == 0:
-        return filtered_games
 
-    if sort_type == "asc":
-        asc = True
-    elif sort_type == "desc":
-        asc = False
-    games = pd.DataFrame(filtered_games)
-    games.columns = filtered_games[0].keys()
-    sort_column_name = SORTING_FIELDS[field_to_sort_by]
-    return games.sort_values(by=sort_column_name, ascending=asc).itertuples(index=False)
+def apply_keyset(query, field_to_sort_by, sort_type, after):
+    sort_column = get_sort_column(field_to_sort_by)
+    if sort_type == "desc":
+        comes_after = (sort_column < after.sort_value) | (
+            (sort_column == after.sort_value) & (Game.bgg_game_id < after.bgg_game_id)
+        )
+    else:
+        comes_after = (sort_column > after.sort_value) | (
+            (sort_column == after.sort_value) & (Game.bgg_game_id > after.bgg_game_id)
+        )
+    # Nulls are sorted last so they always come after a non null cursor.
+    return query.filter(comes_after | sort_column.is_(None))
+
+
+def get_collection_stats(username, filters=DEFAULT_COLLECTION_FILTERS):
+    session = db_session.get_current_session()
+    base_query = get_user_games_query(session, username)
+    return count_collection_stats(session, base_query, filters)
+
+
+def count_collection_stats(session, base_query, filters):
+    filtered_games = filter_games_query(base_query, filters).subquery()
+    is_expansion = filtered_games.c.type == "boardgameexpansion"
+    all_games, expansions = session.query(
+        sa.func.count(),
+        sa.func.coalesce(sa.func.sum(sa.case((is_expansion, 1), else_=0)), 0),
+    ).one()
+    return CollectionStats(all_games, all_games - expansions, expansions)
 
 
-def get_unique_from_sperated_pipe_seperatedcolumns(filtered_games, field):
-    lists_out_of_pipe_seperated = [game[field].split("|") for game in filtered_games]
+def get_facet_filters(filters, kind):
+    # A facet is counted under every filter but its own, so the other values
+    # of a facet stay visible with the number of games picking them would give.
+    filter_field = FACET_FILTER_FIELDS[kind]
+    return filters._replace(
+        **{filter_field: getattr(DEFAULT_COLLECTION_FILTERS, filter_field)}
+    )
+
 
-    unique_possible = set()
+def get_facets(username, filters=DEFAULT_COLLECTION_FILTERS):
+    session = db_session.get_current_session()
+    base_query = get_user_games_query(session, username)
+    return {
+        kind: get_facet_values(session, base_query, filters, kind) for kind in TAG_KINDS
+    }
 
-    for _list in lists_out_of_pipe_seperated:
-        unique_possible.update(_list)
-    unique_possible = list(unique_possible)
-    unique_possible = [x for x in unique_possible if x.strip() != ""]
-    unique_possible.sort()
-    return unique_possible
+
+def get_facet_values(session, base_query, filters, kind):
+    filtered_games = (
+        filter_games_query(base_query, get_facet_filters(filters, kind))
+        .with_entities(Game.bgg_game_id)
+        .subquery()
+    )
+    # Counted per tag id in a subquery of its own, sqlite can't flatten an
+    # aggregate so counting always starts from the filtered games instead of
+    # probing them once for every tag of the kind.
+    tag_counts = (
+        session.query(GameTag.tag_id, sa.func.count().label("game_count"))
+        .select_from(filtered_games)
+        .join(GameTag, GameTag.bgg_game_id == filtered_games.c.bgg_game_id)
+        .group_by(GameTag.tag_id)
+        .subquery()
+    )
+    facet_values = (
+        session.query(Tag.name, tag_counts.c.game_count)
+        .join(tag_counts, tag_counts.c.tag_id == Tag.id)
+        .filter(Tag.kind == kind)
+        .order_by(Tag.name)
+    )
+    return [
+        FacetValue(name, count) for name, count in facet_values if name.strip() != ""
+    ]
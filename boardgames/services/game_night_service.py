@@ -0,0 +1,134 @@
+import functools
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import boardgames.data.db_session as db_session
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from . import filtered_games_service as fgs
+from .tag_service import TAG_KINDS
+
+# Upper bound for the number of owned game ids indexed over all users.
+MAX_INDEXED_GAME_IDS = int(os.environ.get("GAME_NIGHT_INDEX_MAX_GAMES", 2000000))
+MAX_GROUP_SIZE = 12
+
+# game_ids are sorted and unique, so groups are combined with merges.
+OwnedGames = namedtuple("OwnedGames", ["version", "game_ids"])
+
+# game_ids are sorted, owners holds one row per user of usernames telling
+# whether they own the game at the same position of game_ids.
+GroupGames = namedtuple("GroupGames", ["usernames", "game_ids", "owners"])
+
+__index: OrderedDict[str, OwnedGames] = OrderedDict()
+__index_lock = threading.Lock()
+
+
+def parse_usernames(users):
+    usernames = []
+    for username in re.split(r"[,\n]", users.lower()):
+        username = username.strip()
+        if username and username not in usernames:
+            usernames.append(username)
+    return usernames[:MAX_GROUP_SIZE]
+
+
+def load_owned_game_ids(session, usernames):
+    game_ids = {username: [] for username in usernames}
+    user_games = (
+        session.query(User.name, UserGame.bgg_game_id)
+        .join(UserGame, UserGame.user_id == User.id)
+        .filter(User.name.in_(usernames))
+        .order_by(User.name, UserGame.bgg_game_id)
+    )
+    for username, bgg_game_id in user_games:
+        game_ids[username].append(bgg_game_id)
+    return {
+        username: np.array(user_game_ids, dtype=np.int64)
+        for username, user_game_ids in game_ids.items()
+    }
+
+
+def get_indexed_game_ids():
+    return sum(len(owned.game_ids) for owned in __index.values())
+
+
+def get_owned_game_ids(usernames):
+    # Users that are not in the db are left out.
+    session = db_session.get_current_session()
+    versions = dict(
+        session.query(User.name, User.collection_version).filter(
+            User.name.in_(usernames)
+        )
+    )
+    owned = {}
+    with __index_lock:
+        for username, version in versions.items():
+            indexed = __index.get(username)
+            if indexed is not None and indexed.version == version:
+                __index.move_to_end(username)
+                owned[username] = indexed.game_ids
+
+    missing = [username for username in versions if username not in owned]
+    if missing:
+        loaded = load_owned_game_ids(session, missing)
+        owned.update(loaded)
+        with __index_lock:
+            for username, game_ids in loaded.items():
+                __index[username] = OwnedGames(versions[username], game_ids)
+                __index.move_to_end(username)
+            while get_indexed_game_ids() > MAX_INDEXED_GAME_IDS and len(__index) > 1:
+                __index.popitem(last=False)
+    return {username: owned[username] for username in usernames if username in owned}
+
+
+def get_group_games(usernames, owned_by_all=False):
+    owned = get_owned_game_ids(usernames)
+    arrays = list(owned.values())
+    if not arrays:
+        game_ids = np.array([], dtype=np.int64)
+    elif owned_by_all:
+        # Starting from the smallest collection keeps every step small.
+        game_ids = functools.reduce(
+            lambda left, right: np.intersect1d(left, right, assume_unique=True),
+            sorted(arrays, key=len),
+        )
+    else:
+        game_ids = np.unique(np.concatenate(arrays))
+    owners = np.zeros((len(arrays), len(game_ids)), dtype=bool)
+    for i, user_game_ids in enumerate(arrays):
+        owners[i] = np.isin(game_ids, user_game_ids, assume_unique=True)
+    return GroupGames(list(owned), game_ids, owners)
+
+
+def get_game_owners(group, game_ids):
+    positions = np.searchsorted(group.game_ids, np.array(game_ids, dtype=np.int64))
+    return {
+        game_id: [group.usernames[i] for i in np.flatnonzero(group.owners[:, position])]
+        for game_id, position in zip(game_ids, positions)
+    }
+
+
+def find_group_games(group, filters, after=None, page_size=fgs.GAMES_PAGE_SIZE):
+    # Filtering and sorting are left to sqlite, only the ids of the group
+    # are handed over.
+    session = db_session.get_current_session()
+    base_query = fgs.get_group_games_query(session, group.game_ids)
+    page = fgs.query_games_page(base_query, filters, after, page_size)
+    owners = get_game_owners(group, [game.bgg_game_id for game in page.games])
+    if after is not None:
+        return page, None, owners
+    stats = fgs.count_collection_stats(session, base_query, filters)
+    return page, stats, owners
+
+
+def get_group_facets(group, filters=fgs.DEFAULT_COLLECTION_FILTERS):
+    session = db_session.get_current_session()
+    base_query = fgs.get_group_games_query(session, group.game_ids)
+    return {
+        kind: fgs.get_facet_values(session, base_query, filters, kind)
+        for kind in TAG_KINDS
+    }
@@ -0,0 +1,182 @@
+import datetime
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boardgames.data.db_session as db_session
+import boardgames.data.import_jobs as import_jobs
+from boardgames.data.import_jobs import ImportJob
+from . import metrics, migrations
+from .collection_service import add_new_users_collection_to_db
+
+# "thread" runs imports on a pool inside the web process, "worker" only queues
+# them for a separate `python -m boardgames.services.import_job_service` process.
+IMPORT_JOBS_MODE = os.environ.get("IMPORT_JOBS_MODE", "thread")
+MAX_IMPORT_WORKERS = int(os.environ.get("MAX_IMPORT_WORKERS", 2))
+# bgg can take minutes to prepare a collection, keep asking for a while.
+NUM_COLLECTION_TRIES = 24
+# Jobs that have not reported progress for this long are considered dead.
+JOB_TIMEOUT = datetime.timedelta(minutes=15)
+WORKER_POLL_SECONDS = 2
+
+__executor = None
+__executor_lock = threading.Lock()
+
+
+def get_executor():
+    global __executor
+    with __executor_lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(max_workers=MAX_IMPORT_WORKERS)
+        return __executor
+
+
+def get_job(job_id):
+    session = db_session.get_current_session()
+    fail_dead_job(session, job_id)
+    return session.query(ImportJob).filter(ImportJob.id == job_id).first()
+
+
+def fail_dead_job(session, job_id):
+    # Jobs of a process that was restarted are never picked up again, without
+    # this their status page would keep polling forever.
+    oldest_alive = datetime.datetime.utcnow() - JOB_TIMEOUT
+    failed = (
+        session.query(ImportJob)
+        .filter(ImportJob.id == job_id)
+        .filter(ImportJob.status.in_(import_jobs.ACTIVE_STATUSES))
+        .filter(ImportJob.updated_at <= oldest_alive)
+        .update(
+            {
+                ImportJob.status: import_jobs.FAILED,
+                ImportJob.error: "The import stopped before it was done.",
+            },
+            synchronize_session=False,
+        )
+    )
+    if failed:
+        session.commit()
+
+
+def get_active_job(session, username):
+    oldest_alive = datetime.datetime.utcnow() - JOB_TIMEOUT
+    return (
+        session.query(ImportJob)
+        .filter(ImportJob.username == username)
+        .filter(ImportJob.status.in_(import_jobs.ACTIVE_STATUSES))
+        .filter(ImportJob.updated_at > oldest_alive)
+        .order_by(ImportJob.id.desc())
+        .first()
+    )
+
+
+def enqueue_import(username, user_exists=False):
+    session = db_session.get_current_session()
+    active_job = get_active_job(session, username)
+    if active_job is not None:
+        return active_job.id
+
+    job = ImportJob(username=username, user_exists=user_exists)
+    session.add(job)
+    session.commit()
+    if IMPORT_JOBS_MODE == "thread":
+        get_executor().submit(run_import_job, job.id)
+    return job.id
+
+
+def claim_job(session, job_id):
+    claimed = (
+        session.query(ImportJob)
+        .filter(ImportJob.id == job_id)
+        .filter(ImportJob.status == import_jobs.QUEUED)
+        .update({ImportJob.status: import_jobs.FETCHING}, synchronize_session=False)
+    )
+    session.commit()
+    return claimed == 1
+
+
+def claim_job_in_new_session(job_id):
+    with db_session.create_session() as session:
+        return claim_job(session, job_id)
+
+
+def run_import_job(job_id):
+    with db_session.create_session() as session:
+        if claim_job(session, job_id):
+            import_collection(session, job_id)
+
+
+def run_claimed_import_job(job_id):
+    with db_session.create_session() as session:
+        import_collection(session, job_id)
+
+
+def import_collection(session, job_id):
+    started = time.perf_counter()
+    job = session.query(ImportJob).filter(ImportJob.id == job_id).one()
+
+    def report_progress(status, games_fetched=0, games_total=0):
+        job.status = status
+        job.games_fetched = games_fetched
+        job.games_total = games_total
+        session.commit()
+
+    try:
+        result = add_new_users_collection_to_db(
+            job.username,
+            user_exists=job.user_exists,
+            num_tries=NUM_COLLECTION_TRIES,
+            report_progress=report_progress,
+        )
+    except Exception as e:
+        session.rollback()
+        print(f"Import job {job_id} for {job.username} failed: {e}")
+        job.status = import_jobs.FAILED
+        job.error = "Something went wrong while importing the collection."
+    else:
+        if result == "invalid username":
+            job.status = import_jobs.FAILED
+            job.error = "Invalid username specified."
+        elif result == "waiting":
+            job.status = import_jobs.FAILED
+            job.error = "Boardgamegeek is still preparing the collection."
+        else:
+            job.status = import_jobs.DONE
+            job.games_fetched = job.games_total
+    session.commit()
+    metrics.IMPORT_JOBS.inc(status=job.status)
+    metrics.IMPORT_JOB_SECONDS.observe(time.perf_counter() - started, status=job.status)
+
+
+def get_next_queued_job_id():
+    with db_session.create_session() as session:
+        job = (
+            session.query(ImportJob.id)
+            .filter(ImportJob.status == import_jobs.QUEUED)
+            .order_by(ImportJob.id)
+            .first()
+        )
+    return job[0] if job else None
+
+
+def run_worker():
+    free_workers = threading.BoundedSemaphore(MAX_IMPORT_WORKERS)
+    with ThreadPoolExecutor(max_workers=MAX_IMPORT_WORKERS) as pool:
+        while True:
+            free_workers.acquire()
+            job_id = get_next_queued_job_id()
+            if job_id is None or not claim_job_in_new_session(job_id):
+                free_workers.release()
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+            future = pool.submit(run_claimed_import_job, job_id)
+            future.add_done_callback(lambda _: free_workers.release())
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "boardgames/db/db.sqlite"
+    db_session.global_init(db_file)
+    migrations.upgrade()
+    run_worker()
@@ -0,0 +1,337 @@
+import bisect
+import threading
+import time
+
+import flask
+import jinja2
+import sqlalchemy as sa
+
+# Every process keeps its own metrics, with several gunicorn workers each
+# scrape only sees the worker that answered it.
+
+DURATION_BUCKETS = [
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+]
+COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+__registry: list["Counter | Gauge | Histogram"] = []
+__request_state = threading.local()
+
+
+def get_label_key(label_names, labels):
+    # Label values are kept as strings, so values of several types, like bgg's
+    # statuses and "error", are sorted together when collected.
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def inc(self, amount=1, **labels):
+        key = get_label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = format_labels(self.label_names, key)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def set(self, value, **labels):
+        key = get_label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+        ]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = format_labels(self.label_names, key)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = list(buckets)
+        # label values: (count per bucket, +Inf last, sum)
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def observe(self, value, **labels):
+        key = get_label_key(self.label_names, labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            bucket_counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0)
+            )
+            bucket_counts[bucket] += 1
+            self._values[key] = (bucket_counts, total + value)
+
+    def collect(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for key, (bucket_counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for upper_bound, count in zip(self.buckets + ["+Inf"], bucket_counts):
+                    cumulative += count
+                    labels = format_labels(self.label_names, key, [("le", upper_bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register(metric):
+    __registry.append(metric)
+
+
+def render_metrics():
+    lines = []
+    for metric in __registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to answer a request.",
+    ["endpoint", "method", "status"],
+)
+HTTP_REQUEST_PHASE_SECONDS = Histogram(
+    "http_request_phase_seconds",
+    "Time spent per request in sql, bgg calls, template rendering and the rest.",
+    ["endpoint", "phase"],
+)
+HTTP_REQUEST_SQL_QUERIES = Histogram(
+    "http_request_sql_queries",
+    "Number of sql queries run for a request.",
+    ["endpoint"],
+    buckets=COUNT_BUCKETS,
+)
+SQL_QUERY_SECONDS = Histogram(
+    "sql_query_duration_seconds",
+    "Time to execute a sql statement.",
+    ["statement"],
+)
+BGG_REQUEST_SECONDS = Histogram(
+    "bgg_request_duration_seconds",
+    "Time until boardgamegeek answered, 202 is bgg's accepted, try later.",
+    ["endpoint", "status"],
+)
+BGG_CACHE_LOOKUPS = Counter(
+    "bgg_response_cache_lookups_total",
+    "Lookups in the bgg response cache.",
+    ["endpoint", "result"],
+)
+COLLECTION_CACHE_LOOKUPS = Counter(
+    "collection_cache_lookups_total",
+    "Lookups in the per-user collection cache.",
+    ["result"],
+)
+COLLECTION_CACHE_EVICTIONS = Counter(
+    "collection_cache_evictions_total",
+    "Collections evicted from the collection cache to stay under its size.",
+)
+BGG_COLLECTION_NOT_READY = Counter(
+    "bgg_collection_not_ready_total",
+    "Collections bgg was still preparing when they were asked for.",
+)
+BGG_PARSE_SECONDS = Histogram(
+    "bgg_parse_duration_seconds",
+    "Time to parse one bgg response.",
+    ["endpoint"],
+)
+IMPORTED_GAMES = Counter(
+    "import_games_total",
+    "Games fetched from bgg and inserted, its rate is the import throughput.",
+)
+IMPORT_JOBS = Counter(
+    "import_jobs_total",
+    "Finished collection imports.",
+    ["status"],
+)
+IMPORT_JOB_SECONDS = Histogram(
+    "import_job_duration_seconds",
+    "Time to run a collection import.",
+    ["status"],
+)
+# Set from the db on every scrape, the refresh scheduler runs in its own process.
+CATALOG_GAMES = Gauge(
+    "catalog_games",
+    "Games in the catalog.",
+)
+CATALOG_STALE_GAMES = Gauge(
+    "catalog_stale_games",
+    "Games due for a refresh, including the never fetched ones.",
+)
+CATALOG_NEVER_FETCHED_GAMES = Gauge(
+    "catalog_never_fetched_games",
+    "Games that were never fetched by the catalog refresh.",
+)
+CATALOG_OLDEST_FETCH_AGE_SECONDS = Gauge(
+    "catalog_oldest_fetch_age_seconds",
+    "Time since the least recently fetched game was fetched.",
+)
+CATALOG_GAMES_BY_AGE = Gauge(
+    "catalog_games_by_age",
+    "Fetched games by the age bucket of their last fetch.",
+    ["age"],
+)
+
+
+def start_request():
+    __request_state.started = time.perf_counter()
+    __request_state.phases = {"sql": 0.0, "bgg": 0.0, "render": 0.0}
+    __request_state.sql_queries = 0
+    __request_state.render_depth = 0
+
+
+def add_to_request_phase(phase, seconds):
+    phases = getattr(__request_state, "phases", None)
+    if phases is not None:
+        phases[phase] += seconds
+
+
+def finish_request(endpoint, method, status):
+    phases = getattr(__request_state, "phases", None)
+    if phases is None:
+        return
+    total = time.perf_counter() - __request_state.started
+    HTTP_REQUEST_SECONDS.observe(total, endpoint=endpoint, method=method, status=status)
+    for phase, seconds in phases.items():
+        HTTP_REQUEST_PHASE_SECONDS.observe(seconds, endpoint=endpoint, phase=phase)
+    HTTP_REQUEST_PHASE_SECONDS.observe(
+        max(0.0, total - sum(phases.values())), endpoint=endpoint, phase="other"
+    )
+    HTTP_REQUEST_SQL_QUERIES.observe(__request_state.sql_queries, endpoint=endpoint)
+    __request_state.phases = None
+
+
+def observe_sql_query(statement, seconds):
+    SQL_QUERY_SECONDS.observe(seconds, statement=statement.split(None, 1)[0].upper())
+    if getattr(__request_state, "phases", None) is not None:
+        __request_state.sql_queries += 1
+        __request_state.phases["sql"] += seconds
+
+
+def observe_bgg_request(endpoint, status, seconds):
+    BGG_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+    add_to_request_phase("bgg", seconds)
+
+
+def start_render():
+    # Partials render inside their page, only the outermost render is timed.
+    depth = getattr(__request_state, "render_depth", 0)
+    __request_state.render_depth = depth + 1
+    return time.perf_counter() if depth == 0 else None
+
+
+def finish_render(started):
+    __request_state.render_depth -= 1
+    if started is not None:
+        add_to_request_phase("render", time.perf_counter() - started)
+
+
+class TimedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs):
+        started = start_render()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            finish_render(started)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    observe_sql_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+
+def instrument_sqlalchemy():
+    if not sa.event.contains(
+        sa.engine.Engine, "before_cursor_execute", before_cursor_execute
+    ):
+        sa.event.listen(
+            sa.engine.Engine, "before_cursor_execute", before_cursor_execute
+        )
+        sa.event.listen(sa.engine.Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def instrument_app(app):
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_request_metrics():
+        start_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        rule = flask.request.url_rule
+        finish_request(
+            rule.rule if rule is not None else "unmatched",
+            flask.request.method,
+            response.status_code,
+        )
+        return response
+
+    instrument_sqlalchemy()
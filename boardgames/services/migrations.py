@@ -0,0 +1,195 @@
+import sys
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from .player_count_poll import get_player_count_mask
+from .search_service import backfill_games_fts, create_games_fts
+from .tag_service import backfill_game_tags
+
+# mask column: pipe joined column it is computed from
+PLAYER_COUNT_MASK_COLUMNS = {
+    "user_suggested_best_player_count_mask": "user_suggested_best_number_of_players",
+    "user_suggested_recommended_player_count_mask": "user_suggested_recommended_number_of_players",
+}
+
+
+def get_column_names(session, table_name):
+    return {
+        row[1] for row in session.execute(sa.text(f"PRAGMA table_info({table_name})"))
+    }
+
+
+def get_schema_version(session):
+    return session.execute(sa.text("PRAGMA user_version")).scalar()
+
+
+def set_schema_version(session, version):
+    session.execute(sa.text(f"PRAGMA user_version={int(version)}"))
+
+
+def add_player_count_mask_columns(session):
+    existing_columns = get_column_names(session, Game.__tablename__)
+    missing_columns = [
+        column for column in PLAYER_COUNT_MASK_COLUMNS if column not in existing_columns
+    ]
+    for column in missing_columns:
+        session.execute(
+            sa.text(f"ALTER TABLE games ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        )
+    if not missing_columns:
+        return
+    games = update_player_count_masks(session, sa.true())
+    print(f"Added player count masks to {len(games)} games")
+
+
+def update_player_count_masks(session, condition):
+    games = (
+        session.query(
+            Game.id,
+            *[getattr(Game, column) for column in PLAYER_COUNT_MASK_COLUMNS.values()],
+        )
+        .filter(condition)
+        .all()
+    )
+    session.bulk_update_mappings(
+        Game,
+        [
+            {
+                "id": game.id,
+                **{
+                    mask_column: get_player_count_mask(getattr(game, column))
+                    for mask_column, column in PLAYER_COUNT_MASK_COLUMNS.items()
+                },
+            }
+            for game in games
+        ],
+    )
+    return games
+
+
+def add_game_tags(session):
+    # The tables themselves are created by create_all.
+    backfill_game_tags(session)
+
+
+def add_user_games_indexes(session):
+    # The unique index can't be created while duplicated rows are around.
+    session.execute(
+        sa.text(
+            "DELETE FROM user_games WHERE id NOT IN "
+            "(SELECT MIN(id) FROM user_games GROUP BY user_id, bgg_game_id)"
+        )
+    )
+    for index in UserGame.__table__.indexes:
+        index.create(bind=session.connection(), checkfirst=True)
+
+
+def add_collection_version_column(session):
+    if "collection_version" not in get_column_names(session, User.__tablename__):
+        session.execute(
+            sa.text(
+                "ALTER TABLE users ADD COLUMN collection_version "
+                "INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+
+
+def add_last_synced_at_column(session):
+    if "last_synced_at" not in get_column_names(session, User.__tablename__):
+        session.execute(sa.text("ALTER TABLE users ADD COLUMN last_synced_at DATETIME"))
+
+
+def add_game_fetched_at_column(session):
+    if "fetched_at" not in get_column_names(session, Game.__tablename__):
+        session.execute(sa.text("ALTER TABLE games ADD COLUMN fetched_at DATETIME"))
+    for index in Game.__table__.indexes:
+        index.create(bind=session.connection(), checkfirst=True)
+
+
+def add_games_fts(session):
+    create_games_fts(session)
+    backfill_games_fts(session)
+
+
+def add_game_thumbnail_file_column(session):
+    if "thumbnail_file" not in get_column_names(session, Game.__tablename__):
+        session.execute(sa.text("ALTER TABLE games ADD COLUMN thumbnail_file VARCHAR"))
+
+
+def add_game_change_version_column(session):
+    if "change_version" not in get_column_names(session, Game.__tablename__):
+        session.execute(
+            sa.text(
+                "ALTER TABLE games ADD COLUMN change_version "
+                "INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+        session.execute(sa.text("UPDATE games SET change_version = id"))
+    for index in Game.__table__.indexes:
+        index.create(bind=session.connection(), checkfirst=True)
+    # sqlite has one writer at a time, a version taken from the max is only
+    # seen by readers after every smaller one is committed.
+    for trigger, event in [
+        ("games_change_version_insert", "INSERT"),
+        ("games_change_version_update", "UPDATE OF fetched_at"),
+    ]:
+        session.execute(
+            sa.text(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON games "
+                "BEGIN UPDATE games SET change_version = "
+                "(SELECT COALESCE(MAX(change_version), 0) + 1 FROM games) "
+                "WHERE id = NEW.id; END"
+            )
+        )
+
+
+def update_open_ended_player_count_masks(session):
+    # "N+" options used to only set the overflow bit.
+    games = update_player_count_masks(
+        session,
+        sa.or_(
+            *[
+                getattr(Game, column).contains("+")
+                for column in PLAYER_COUNT_MASK_COLUMNS.values()
+            ]
+        ),
+    )
+    print(f"Updated the player count masks of {len(games)} games")
+
+
+# Append new migrations at the end, the position is the schema version.
+MIGRATIONS = [
+    add_game_tags,
+    add_player_count_mask_columns,
+    add_user_games_indexes,
+    add_collection_version_column,
+    add_last_synced_at_column,
+    add_game_fetched_at_column,
+    add_games_fts,
+    add_game_thumbnail_file_column,
+    add_game_change_version_column,
+    update_open_ended_player_count_masks,
+]
+
+
+def upgrade():
+    session = db_session.create_session()
+    schema_version = get_schema_version(session)
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= schema_version:
+            continue
+        print(f"Migrating db to version {version}: {migration.__name__}")
+        migration(session)
+        set_schema_version(session, version)
+        session.commit()
+    session.close()
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "boardgames/db/db.sqlite"
+    db_session.global_init(db_file)
+    upgrade()
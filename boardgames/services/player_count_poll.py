@@ -0,0 +1,87 @@
+from collections import namedtuple
+
+# options is a list of (num_players, best, recommended, not_recommended) tuples
+PlayerCountPoll = namedtuple("PlayerCountPoll", ["total_votes", "options"])
+
+PlayerCountPollResult = namedtuple(
+    "PlayerCountPollResult",
+    [
+        "best",
+        "recommended",
+        "recommended_not_best",
+    ],
+)
+
+EMPTY_POLL_RESULT = PlayerCountPollResult("", "", "")
+
+NOT_RECOMMENDED = 0
+BEST = 1
+RECOMMENDED = 2
+
+# Player counts 1 to 15 get bit count - 1, anything above 15 shares the
+# overflow bit, so filtering for 16 finds the games for 20 too. bgg's "N+"
+# option, one more than the box says, counts for N and every count above it.
+MAX_PLAYER_COUNT_BIT = 15
+PLAYER_COUNT_OVERFLOW_BIT = 1 << MAX_PLAYER_COUNT_BIT
+ALL_PLAYER_COUNT_BITS = (PLAYER_COUNT_OVERFLOW_BIT << 1) - 1
+
+
+def get_option_result(best, recommended, not_recommended):
+    if not_recommended > recommended + best:
+        return NOT_RECOMMENDED
+    if recommended < best:
+        return BEST
+    return RECOMMENDED
+
+
+def evaluate_poll(poll):
+    if poll.total_votes == 0:
+        return EMPTY_POLL_RESULT
+    option_results = [get_option_result(*votes) for _, *votes in poll.options]
+    return create_poll_result(poll.options, option_results)
+
+
+def evaluate_polls(polls):
+    # A response's polls have a handful of options each, numpy's overhead
+    # made a vectorised version slower than this at every response size.
+    return [evaluate_poll(poll) for poll in polls]
+
+
+def create_poll_result(options, option_results):
+    best, recommended, recommended_not_best = [], [], []
+    for (num_players, *_), option_result in zip(options, option_results):
+        if option_result == NOT_RECOMMENDED:
+            continue
+        recommended.append(num_players)
+        if option_result == BEST:
+            best.append(num_players)
+        else:
+            recommended_not_best.append(num_players)
+    return PlayerCountPollResult(
+        "|".join(best), "|".join(recommended), "|".join(recommended_not_best)
+    )
+
+
+def get_player_count_bit(num_players):
+    count = int(num_players)
+    if count < 1:
+        return 0
+    if count > MAX_PLAYER_COUNT_BIT:
+        return PLAYER_COUNT_OVERFLOW_BIT
+    return 1 << (count - 1)
+
+
+def get_player_count_option_bits(num_players):
+    num_players = str(num_players)
+    if not num_players.endswith("+"):
+        return get_player_count_bit(num_players)
+    first_bit = get_player_count_bit(max(1, int(num_players[:-1])))
+    return ALL_PLAYER_COUNT_BITS & ~(first_bit - 1)
+
+
+def get_player_count_mask(pipe_joined_player_counts):
+    mask = 0
+    for num_players in pipe_joined_player_counts.split("|"):
+        if num_players.strip() != "":
+            mask |= get_player_count_option_bits(num_players.strip())
+    return mask
@@ -0,0 +1,49 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+# Upper bound for the size of all cached pages together.
+MAX_RENDER_CACHE_BYTES = int(os.environ.get("RENDER_CACHE_MAX_MB", 32)) * 1024 * 1024
+
+RenderedPage = namedtuple("RenderedPage", ["etag", "body"])
+
+__cache: OrderedDict[tuple, RenderedPage] = OrderedDict()
+__cache_lock = threading.Lock()
+__cached_bytes = 0
+
+
+def get_rendered(key):
+    with __cache_lock:
+        page = __cache.get(key)
+        if page is not None:
+            __cache.move_to_end(key)
+        return page
+
+
+def store_rendered(key, body):
+    global __cached_bytes
+    body = body.encode()
+    page = RenderedPage(hashlib.sha256(body).hexdigest(), body)
+    if len(body) > MAX_RENDER_CACHE_BYTES:
+        return page
+
+    with __cache_lock:
+        replaced = __cache.pop(key, None)
+        if replaced is not None:
+            __cached_bytes -= len(replaced.body)
+        __cache[key] = page
+        __cached_bytes += len(body)
+        while __cached_bytes > MAX_RENDER_CACHE_BYTES:
+            _, evicted = __cache.popitem(last=False)
+            __cached_bytes -= len(evicted.body)
+    return page
+
+
+def render_cached(key, render):
+    # key must change whenever the rendered output would, callers include the
+    # collection version of the user for that.
+    page = get_rendered(key)
+    if page is None:
+        page = store_rendered(key, render())
+    return page
@@ -0,0 +1,98 @@
+import argparse
+import re
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+
+BACKFILL_BATCH_SIZE = 500
+# bm25 weights of the title and description columns, a word in the title
+# counts as much as ten in the description.
+RANK_FUNCTION = "bm25(10.0, 1.0)"
+
+# fts5 table with one row per game, its rowid is the bgg_game_id. It is not
+# in the models as create_all can't create virtual tables, see create_games_fts.
+games_fts = sa.table(
+    "games_fts",
+    sa.column("rowid", sa.Integer),
+    sa.column("games_fts"),
+    sa.column("title"),
+    sa.column("description"),
+    sa.column("rank", sa.Float),
+)
+
+
+def create_games_fts(session):
+    session.execute(
+        sa.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS games_fts USING fts5("
+            "title, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+    )
+    # Stored in the table, every query ordering by rank uses these weights.
+    session.execute(
+        sa.text("INSERT INTO games_fts(games_fts, rank) VALUES ('rank', :rank)"),
+        {"rank": RANK_FUNCTION},
+    )
+
+
+def index_games(session, games):
+    # games are (bgg_game_id, game) pairs, game is a Game row or a parsed game.
+    if not games:
+        return
+    session.execute(
+        sa.delete(games_fts).where(
+            games_fts.c.rowid.in_([int(bgg_game_id) for bgg_game_id, _ in games])
+        )
+    )
+    session.execute(
+        sa.insert(games_fts),
+        [
+            {
+                "rowid": int(bgg_game_id),
+                "title": game.title,
+                "description": game.description or "",
+            }
+            for bgg_game_id, game in games
+        ],
+    )
+
+
+def create_match_query(search):
+    # Only the words are kept and quoted so user input can't be read as fts5
+    # syntax, the last one matches as a prefix since it is searched while typing.
+    words = [f'"{word}"' for word in re.findall(r"\w+", search)]
+    if not words:
+        return None
+    return " ".join(words) + "*"
+
+
+def backfill_games_fts(session):
+    unindexed_games = (
+        session.query(Game.bgg_game_id, Game.title, Game.description)
+        .filter(~Game.bgg_game_id.in_(sa.select(games_fts.c.rowid)))
+        .order_by(Game.bgg_game_id)
+        .all()
+    )
+    for i in range(0, len(unindexed_games), BACKFILL_BATCH_SIZE):
+        batch = unindexed_games[i : i + BACKFILL_BATCH_SIZE]
+        index_games(session, [(game.bgg_game_id, game) for game in batch])
+    print(f"Indexed {len(unindexed_games)} games for search")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add the games missing from the search index."
+    )
+    parser.add_argument("db_file", nargs="?", default="boardgames/db/db.sqlite")
+    parser.add_argument("--rebuild", action="store_true", help="index every game again")
+    args = parser.parse_args()
+
+    db_session.global_init(args.db_file)
+    with db_session.create_session() as session:
+        create_games_fts(session)
+        if args.rebuild:
+            session.execute(sa.delete(games_fts))
+        backfill_games_fts(session)
+        session.commit()
@@ -0,0 +1,210 @@
+import threading
+
+import numpy as np
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from boardgames.data.tags import GameTag
+
+SIMILAR_GAMES_LIMIT = 8
+# Weight is spread over the two nearest of these bins, so games of close
+# weight share a feature. Bins get negative feature ids, tags use their id.
+WEIGHT_BINS = np.arange(1.0, 5.01, 0.5)
+# How much the weight counts next to a tag, tags count by their rarity.
+WEIGHT_FEATURE_WEIGHT = 2.0
+
+
+def get_weight_features(bgg_game_ids, weights):
+    # Games nobody voted on the weight of have an average weight of 0 and
+    # get no weight features.
+    weighted = weights > 0
+    bgg_game_ids, weights = bgg_game_ids[weighted], weights[weighted]
+    positions = np.clip(
+        (weights - WEIGHT_BINS[0]) / (WEIGHT_BINS[1] - WEIGHT_BINS[0]),
+        0,
+        len(WEIGHT_BINS) - 1,
+    )
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, len(WEIGHT_BINS) - 1)
+    upper_share = positions - lower
+    return (
+        np.concatenate([bgg_game_ids, bgg_game_ids]),
+        np.concatenate([-1 - lower, -1 - upper]),
+        np.concatenate([1 - upper_share, upper_share]) * WEIGHT_FEATURE_WEIGHT,
+    )
+
+
+class SimilarityIndex:
+    # The feature matrix is kept as (game, feature, value) entries, they are
+    # all that is needed to update it, and is built from them in compressed
+    # sparse row and column form: a game's features are read from the rows,
+    # the games sharing a feature from the columns.
+    def __init__(self, bgg_game_ids, entry_games, entry_features, entry_values):
+        self.bgg_game_ids = bgg_game_ids
+        self.entry_games = entry_games
+        self.entry_features = entry_features
+        self.entry_values = entry_values
+        self.change_version = 0
+
+        num_games = len(bgg_game_ids)
+        rows = np.searchsorted(bgg_game_ids, entry_games)
+        features, columns = np.unique(entry_features, return_inverse=True)
+        # Rare tags say more about a game than the ones on every other game.
+        games_per_feature = np.bincount(columns, minlength=len(features))
+        idf = np.where(
+            features < 0, 1.0, np.log(1 + num_games / np.maximum(games_per_feature, 1))
+        )
+        values = entry_values * idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values**2, minlength=num_games))
+        values = values / np.where(norms > 0, norms, 1)[rows]
+
+        order = np.argsort(rows, kind="stable")
+        self.row_columns = columns[order]
+        self.row_values = values[order]
+        self.row_starts = np.searchsorted(rows[order], np.arange(num_games + 1))
+        order = np.argsort(columns, kind="stable")
+        self.column_rows = rows[order]
+        self.column_values = values[order]
+        self.column_starts = np.searchsorted(
+            columns[order], np.arange(len(features) + 1)
+        )
+
+    def update(self, bgg_game_ids, entry_games, entry_features, entry_values):
+        # The features of updated games are replaced, every game's values
+        # change with the tag counts so the matrix is built again.
+        kept = ~np.isin(self.entry_games, bgg_game_ids)
+        return SimilarityIndex(
+            np.union1d(self.bgg_game_ids, bgg_game_ids),
+            np.concatenate([self.entry_games[kept], entry_games]),
+            np.concatenate([self.entry_features[kept], entry_features]),
+            np.concatenate([self.entry_values[kept], entry_values]),
+        )
+
+    def get_scores(self, row):
+        start, end = self.row_starts[row], self.row_starts[row + 1]
+        columns = self.row_columns[start:end]
+        starts = self.column_starts[columns]
+        lengths = self.column_starts[columns + 1] - starts
+        if lengths.sum() == 0:
+            return np.zeros(len(self.bgg_game_ids))
+        positions = np.concatenate(
+            [np.arange(s, s + n) for s, n in zip(starts, lengths)]
+        )
+        # Rows are unit length, so summing the products of shared features
+        # over the games holding them is the cosine similarity.
+        products = self.column_values[positions] * np.repeat(
+            self.row_values[start:end], lengths
+        )
+        return np.bincount(
+            self.column_rows[positions],
+            weights=products,
+            minlength=len(self.bgg_game_ids),
+        )
+
+    def find_similar(self, bgg_game_id, candidate_game_ids=None, limit=10):
+        row = np.searchsorted(self.bgg_game_ids, bgg_game_id)
+        if row == len(self.bgg_game_ids) or self.bgg_game_ids[row] != bgg_game_id:
+            return []
+        scores = self.get_scores(row)
+        scores[row] = 0
+        if candidate_game_ids is None:
+            candidates = np.arange(len(self.bgg_game_ids))
+        else:
+            candidates = np.searchsorted(self.bgg_game_ids, candidate_game_ids)
+            candidates = candidates[candidates < len(self.bgg_game_ids)]
+            candidates = candidates[
+                np.isin(self.bgg_game_ids[candidates], candidate_game_ids)
+            ]
+        candidates = candidates[scores[candidates] > 0]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        # bgg_game_id breaks ties so the order is stable between requests.
+        order = np.lexsort((self.bgg_game_ids[candidates], -scores[candidates]))
+        candidates = candidates[order]
+        return list(
+            zip(self.bgg_game_ids[candidates].tolist(), scores[candidates].tolist())
+        )
+
+
+__index = None
+__index_lock = threading.Lock()
+
+
+def fetch_array(session, query, dtype):
+    # Read straight from the driver's cursor, building sqlalchemy rows takes
+    # several times longer than the query for the whole catalog's tags.
+    result = session.connection().execute(query)
+    rows = result.cursor.fetchall()
+    result.close()
+    return np.array(rows, dtype=dtype).reshape(-1, len(query.selected_columns))
+
+
+def load_features(session, changed_after=None, changed_until=None):
+    games = sa.select(Game.bgg_game_id, Game.average_weight)
+    game_tags = sa.select(GameTag.bgg_game_id, GameTag.tag_id)
+    if changed_after is not None:
+        changed_games = sa.select(Game.bgg_game_id).where(
+            Game.change_version > changed_after,
+            Game.change_version <= changed_until,
+        )
+        games = games.where(Game.bgg_game_id.in_(changed_games))
+        game_tags = game_tags.where(GameTag.bgg_game_id.in_(changed_games))
+    games = fetch_array(session, games, np.float64)
+    game_tags = fetch_array(session, game_tags, np.int64)
+
+    bgg_game_ids = np.unique(games[:, 0].astype(np.int64))
+    weight_games, weight_features, weight_values = get_weight_features(
+        games[:, 0].astype(np.int64), games[:, 1]
+    )
+    return (
+        bgg_game_ids,
+        np.concatenate([game_tags[:, 0], weight_games]),
+        np.concatenate([game_tags[:, 1], weight_features]),
+        np.concatenate([np.ones(len(game_tags)), weight_values]),
+    )
+
+
+def get_index(session, build=True):
+    # Games inserted or refreshed by any process get a higher change_version,
+    # so only those are read again. Without build an index that was never
+    # built is left alone, importing alone doesn't need one.
+    global __index
+    change_version = session.query(sa.func.max(Game.change_version)).scalar() or 0
+    with __index_lock:
+        if __index is None:
+            if not build:
+                return None
+            __index = SimilarityIndex(*load_features(session))
+        elif change_version > __index.change_version:
+            __index = __index.update(
+                *load_features(session, __index.change_version, change_version)
+            )
+        else:
+            return __index
+        __index.change_version = change_version
+        return __index
+
+
+def update_index():
+    with db_session.create_session() as session:
+        get_index(session, build=False)
+
+
+def find_similar_games(bgg_game_id, candidate_game_ids=None, limit=SIMILAR_GAMES_LIMIT):
+    session = db_session.get_current_session()
+    similar = get_index(session).find_similar(bgg_game_id, candidate_game_ids, limit)
+    if not similar:
+        return []
+    games = {
+        game.bgg_game_id: game
+        for game in session.query(
+            Game.bgg_game_id,
+            Game.title,
+            Game.year_published,
+            Game.thumbnail_url,
+            Game.average_weight,
+        ).filter(Game.bgg_game_id.in_([game_id for game_id, _ in similar]))
+    }
+    return [(games[game_id], score) for game_id, score in similar if game_id in games]
@@ -0,0 +1,84 @@
+import sqlalchemy as sa
+
+from boardgames.data.games import Game
+from boardgames.data.tags import GameTag, Tag
+
+# Game columns holding pipe joined tags, the column name is used as tag kind.
+TAG_KINDS = ["mechanics", "categories", "designers"]
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def split_tags(pipe_joined_tags):
+    return [tag for tag in pipe_joined_tags.split("|") if tag != ""]
+
+
+def get_tag_ids(session, kind, names):
+    if not names:
+        return {}
+    existing = dict(
+        session.query(Tag.name, Tag.id)
+        .filter(Tag.kind == kind)
+        .filter(Tag.name.in_(names))
+        .all()
+    )
+    missing = [name for name in names if name not in existing]
+    if missing:
+        # Another import may be adding the same tags at the same time.
+        session.execute(
+            sa.insert(Tag).prefix_with("OR IGNORE"),
+            [{"kind": kind, "name": name} for name in missing],
+        )
+        existing.update(
+            session.query(Tag.name, Tag.id)
+            .filter(Tag.kind == kind)
+            .filter(Tag.name.in_(missing))
+            .all()
+        )
+    return existing
+
+
+def insert_game_tags(session, games):
+    # games are (bgg_game_id, game) pairs, game is a Game row or a parsed game.
+    game_tags = set()
+    for kind in TAG_KINDS:
+        tags_per_game = [
+            (int(bgg_game_id), split_tags(getattr(game, kind)))
+            for bgg_game_id, game in games
+        ]
+        tag_names = {name for _, names in tags_per_game for name in names}
+        tag_ids = get_tag_ids(session, kind, tag_names)
+        for bgg_game_id, names in tags_per_game:
+            for name in names:
+                game_tags.add((bgg_game_id, tag_ids[name]))
+
+    if game_tags:
+        session.execute(
+            sa.insert(GameTag).prefix_with("OR IGNORE"),
+            [
+                {"bgg_game_id": bgg_game_id, "tag_id": tag_id}
+                for bgg_game_id, tag_id in game_tags
+            ],
+        )
+
+
+def get_games_tagged_with(kind, name):
+    return (
+        sa.select(GameTag.bgg_game_id)
+        .join(Tag, Tag.id == GameTag.tag_id)
+        .where(Tag.kind == kind)
+        .where(Tag.name == name)
+    )
+
+
+def backfill_game_tags(session):
+    untagged_games = (
+        session.query(Game.bgg_game_id, Game.mechanics, Game.categories, Game.designers)
+        .filter(~Game.bgg_game_id.in_(sa.select(GameTag.bgg_game_id)))
+        .order_by(Game.bgg_game_id)
+        .all()
+    )
+    for i in range(0, len(untagged_games), BACKFILL_BATCH_SIZE):
+        batch = untagged_games[i : i + BACKFILL_BATCH_SIZE]
+        insert_game_tags(session, [(game.bgg_game_id, game) for game in batch])
+    print(f"Tagged {len(untagged_games)} games")
@@ -0,0 +1,213 @@
+import argparse
+import hashlib
+import io
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageOps, features
+
+import boardgames.data.db_session as db_session
+from boardgames.data.games import Game
+from . import migrations
+from .bgg_fetcher import RateLimiter
+
+THUMBNAIL_DIR = os.environ.get(
+    "THUMBNAIL_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", "thumbnails"
+    ),
+)
+# Square variants stored per thumbnail, the list shows them at 100px and
+# offers the bigger one to high density screens.
+THUMBNAIL_SIZES = [100, 200]
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_EXTENSION = {"WEBP": ".webp", "JPEG": ".jpg"}[THUMBNAIL_FORMAT]
+DOWNLOAD_TIMEOUT_SECONDS = 10
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("THUMBNAIL_MAX_CONCURRENT_DOWNLOADS", 4))
+DOWNLOADS_PER_SECOND = float(os.environ.get("THUMBNAIL_DOWNLOADS_PER_SECOND", 4))
+# Downloads go to this host instead of the one of bgg's thumbnail urls when it
+# is set, like a local stand-in.
+THUMBNAIL_BASE_URI = os.environ.get("THUMBNAIL_BASE_URI")
+
+__http = requests.Session()
+__rate_limiter = RateLimiter(DOWNLOADS_PER_SECOND)
+__executor = None
+__executor_lock = threading.Lock()
+# Games whose thumbnail is queued for caching, so a game on several pages
+# being viewed is only downloaded once.
+__pending_game_ids: set[int] = set()
+__pending_lock = threading.Lock()
+
+
+def get_executor():
+    global __executor
+    with __executor_lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS)
+        return __executor
+
+
+def get_thumbnail_path(size, thumbnail_file):
+    return os.path.join(THUMBNAIL_DIR, str(size), thumbnail_file)
+
+
+def create_variant(image, size):
+    variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    content = io.BytesIO()
+    variant.save(content, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    return content.getvalue()
+
+
+def store_thumbnail(content):
+    # Named after the downloaded image, so the files never change and games
+    # sharing an image, like bgg's placeholder, share the files.
+    thumbnail_file = hashlib.sha256(content).hexdigest()[:32] + THUMBNAIL_EXTENSION
+    image = None
+    for size in THUMBNAIL_SIZES:
+        path = get_thumbnail_path(size, thumbnail_file)
+        if os.path.exists(path):
+            continue
+        if image is None:
+            image = Image.open(io.BytesIO(content))
+            has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+            use_alpha = has_alpha and THUMBNAIL_FORMAT == "WEBP"
+            image = image.convert("RGBA" if use_alpha else "RGB")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to its final name first so a half written file is never
+        # served.
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(create_variant(image, size))
+        os.replace(temporary_path, path)
+    return thumbnail_file
+
+
+def get_download_url(thumbnail_url):
+    if THUMBNAIL_BASE_URI is None:
+        return thumbnail_url
+    url = urllib.parse.urlsplit(thumbnail_url)
+    return THUMBNAIL_BASE_URI.rstrip("/") + urllib.parse.urlunsplit(
+        ("", "", url.path, url.query, "")
+    )
+
+
+def download_thumbnail(thumbnail_url):
+    __rate_limiter.wait()
+    response = __http.get(
+        get_download_url(thumbnail_url), timeout=DOWNLOAD_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+    return response.content
+
+
+def is_stored(thumbnail_file):
+    return all(
+        os.path.exists(get_thumbnail_path(size, thumbnail_file))
+        for size in THUMBNAIL_SIZES
+    )
+
+
+def cache_thumbnail(session, bgg_game_id):
+    # Returns None for games without a thumbnail or when it can't be loaded,
+    # they keep linking to bgg's.
+    game = (
+        session.query(Game.thumbnail_url, Game.thumbnail_file)
+        .filter(Game.bgg_game_id == bgg_game_id)
+        .first()
+    )
+    if game is None or not game.thumbnail_url:
+        return None
+    if game.thumbnail_file is not None and is_stored(game.thumbnail_file):
+        return game.thumbnail_file
+    try:
+        thumbnail_file = store_thumbnail(download_thumbnail(game.thumbnail_url))
+    except (requests.RequestException, OSError) as e:
+        print(f"Could not cache the thumbnail of game {bgg_game_id}: {e}")
+        return None
+    session.query(Game).filter(Game.bgg_game_id == bgg_game_id).update(
+        {Game.thumbnail_file: thumbnail_file}, synchronize_session=False
+    )
+    session.commit()
+    return thumbnail_file
+
+
+def cache_thumbnail_in_background(bgg_game_id):
+    try:
+        with db_session.create_session() as session:
+            cache_thumbnail(session, bgg_game_id)
+    finally:
+        with __pending_lock:
+            __pending_game_ids.discard(bgg_game_id)
+
+
+def enqueue_thumbnail(bgg_game_id):
+    with __pending_lock:
+        if bgg_game_id in __pending_game_ids:
+            return
+        __pending_game_ids.add(bgg_game_id)
+    get_executor().submit(cache_thumbnail_in_background, bgg_game_id)
+
+
+def get_thumbnail_src(game, size):
+    # The same before and after the thumbnail is cached, so the cached
+    # collection pages stay valid while thumbnails are downloaded.
+    return f"/game/{game.bgg_game_id}/thumbnail/{size}"
+
+
+def get_thumbnail_url(bgg_game_id, size):
+    # Returns the url and whether it is of the cached copy. Thumbnails that
+    # are not cached yet are downloaded in the background and bgg's is used
+    # meanwhile, the request never waits for a download.
+    session = db_session.get_current_session()
+    game = (
+        session.query(Game.thumbnail_url, Game.thumbnail_file)
+        .filter(Game.bgg_game_id == bgg_game_id)
+        .first()
+    )
+    if game is None or not game.thumbnail_url:
+        return None, False
+    if game.thumbnail_file is not None and is_stored(game.thumbnail_file):
+        return f"/thumbnails/{size}/{game.thumbnail_file}", True
+    enqueue_thumbnail(bgg_game_id)
+    return game.thumbnail_url, False
+
+
+def cache_missing_thumbnails(limit=None):
+    with db_session.create_session() as session:
+        game_ids = (
+            session.query(Game.bgg_game_id)
+            .filter(Game.thumbnail_url.isnot(None))
+            .filter(Game.thumbnail_file.is_(None))
+            .order_by(Game.bgg_game_id)
+            .limit(limit)
+            .all()
+        )
+
+    def cache(bgg_game_id):
+        with db_session.create_session() as session:
+            return cache_thumbnail(session, bgg_game_id)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as pool:
+        cached = sum(
+            thumbnail_file is not None
+            for thumbnail_file in pool.map(cache, [game_id for game_id, in game_ids])
+        )
+    print(f"Cached the thumbnails of {cached} of {len(game_ids)} games")
+    return cached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download and resize the thumbnails that are not cached yet."
+    )
+    parser.add_argument("db_file", nargs="?", default="boardgames/db/db.sqlite")
+    parser.add_argument("--limit", type=int, help="cache at most this many games")
+    args = parser.parse_args()
+
+    db_session.global_init(args.db_file)
+    migrations.upgrade()
+    cache_missing_thumbnails(args.limit)
@@ -0,0 +1,109 @@
+import http.server
+import io
+import threading
+import time
+import urllib.parse
+
+import pytest
+from PIL import Image
+
+from benchmarks.synthetic_bgg import create_things_xml
+import boardgames.data.db_session as db_session
+from boardgames.services import migrations
+
+NUM_GAMES = 100
+
+
+def create_thumbnail():
+    content = io.BytesIO()
+    Image.new("RGB", (150, 120), (200, 20, 20)).save(content, "PNG")
+    return content.getvalue()
+
+
+THUMBNAIL = create_thumbnail()
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # The db can only be initialised once per process, and before the app is
+    # imported or it would connect to the real one.
+    db_session.global_init(str(tmp_path_factory.mktemp("db") / "db.sqlite"))
+    migrations.upgrade()
+    from benchmarks.fixtures import populate_fixture
+
+    populate_fixture(NUM_GAMES)
+    import boardgames.app
+
+    return boardgames.app.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def current_session():
+    # Services called outside a request use the thread's session, removed
+    # after every test like the app does after every request.
+    yield
+    db_session.remove_current_session()
+
+
+class FakeBoardgamegeek:
+    # Answers thing requests with synthetic games and thumbnail requests with
+    # an image over http. Statuses are answered first, in order, and thing
+    # requests for a failing id get a 500.
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        self.failing_ids = set()
+        self.delay_seconds = 0
+        self._lock = threading.Lock()
+
+    def answer(self, path, params):
+        if path.startswith("/thumb/"):
+            with self._lock:
+                self.requests.append((path, []))
+            return 200, THUMBNAIL
+        game_ids = [
+            int(game_id) for game_id in params.get("id", "").split(",") if game_id
+        ]
+        with self._lock:
+            self.requests.append((path, game_ids))
+            status = self.statuses.pop(0) if self.statuses else None
+        time.sleep(self.delay_seconds)
+        if status is not None:
+            return status, b""
+        if self.failing_ids.intersection(game_ids):
+            return 500, b""
+        return 200, create_things_xml(game_ids)
+
+    def requested_ids(self):
+        with self._lock:
+            return [game_id for _, game_ids in self.requests for game_id in game_ids]
+
+
+@pytest.fixture
+def fake_bgg():
+    bgg = FakeBoardgamegeek()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            status, body = bgg.answer(url.path, params)
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bgg.base_uri = f"http://127.0.0.1:{server.server_port}/xmlapi2/"
+    yield bgg
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,57 @@
+import pytest
+
+from boardgames.services.bgg_fetcher import BoardgamegeekRequestError, ThingFetcher
+from boardgames.services.bgg_xml_stream import iterparse_games
+
+
+def create_fetcher(fake_bgg, max_concurrent_requests=2):
+    return ThingFetcher(
+        base_uri=fake_bgg.base_uri,
+        requests_per_second=0,
+        max_concurrent_requests=max_concurrent_requests,
+        max_retries=2,
+        retry_backoff_seconds=0,
+    )
+
+
+def test_fetch_things_in_chunks(fake_bgg):
+    game_ids = list(range(1, 46))
+    games = [
+        game
+        for content in create_fetcher(fake_bgg).fetch_things(game_ids)
+        for game in iterparse_games(content)
+    ]
+    assert sorted(int(game.id) for game in games) == game_ids
+    assert [len(game_ids) for _, game_ids in fake_bgg.requests] == [20, 20, 5]
+    assert all(path == "/xmlapi2/thing" for path, _ in fake_bgg.requests)
+
+
+def test_fetch_chunk_retries_while_bgg_prepares_the_response(fake_bgg):
+    fake_bgg.statuses = [202, 202]
+    content = create_fetcher(fake_bgg).fetch_chunk([1, 2])
+    assert [int(game.id) for game in iterparse_games(content)] == [1, 2]
+    assert len(fake_bgg.requests) == 3
+
+
+def test_fetch_chunk_gives_up_after_its_retries(fake_bgg):
+    fake_bgg.failing_ids = {2}
+    with pytest.raises(BoardgamegeekRequestError):
+        create_fetcher(fake_bgg).fetch_chunk([1, 2])
+    assert len(fake_bgg.requests) == 3
+
+
+def test_fetch_things_stops_after_a_failed_chunk(fake_bgg):
+    fake_bgg.failing_ids = {1}
+    fake_bgg.delay_seconds = 0.01
+    with pytest.raises(BoardgamegeekRequestError):
+        list(create_fetcher(fake_bgg).fetch_things(range(1, 2001)))
+    # Only the chunks in flight alongside the failing one, not all 100.
+    assert len(fake_bgg.requests) < 20
+
+
+def test_fetch_things_stops_when_closed(fake_bgg):
+    fake_bgg.delay_seconds = 0.01
+    things = create_fetcher(fake_bgg).fetch_things(range(1, 2001))
+    next(things)
+    things.close()
+    assert len(fake_bgg.requests) < 10
@@ -0,0 +1,45 @@
+import pytest
+
+from boardgames.services.bgg_fetcher import BoardgamegeekRequestError, ThingFetcher
+from boardgames.services.bgg_response_cache import ResponseCache
+from boardgames.services.bgg_xml_stream import iterparse_games
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "bgg_cache.sqlite")
+
+
+def create_fetcher(fake_bgg, response_cache):
+    return ThingFetcher(
+        base_uri=fake_bgg.base_uri,
+        requests_per_second=0,
+        max_retries=0,
+        response_cache=response_cache,
+    )
+
+
+def fetch_game_ids(fetcher, game_ids):
+    return [int(game.id) for game in iterparse_games(fetcher.fetch_chunk(game_ids))]
+
+
+def test_things_are_cached_per_game(fake_bgg, cache_path):
+    fetcher = create_fetcher(fake_bgg, ResponseCache(cache_path))
+    assert fetch_game_ids(fetcher, [1, 2, 3, 4, 5]) == [1, 2, 3, 4, 5]
+    # Grouped differently, only the games that were not fetched before.
+    assert fetch_game_ids(fetcher, [8, 3, 7, 5]) == [8, 3, 7, 5]
+    assert fake_bgg.requests[-1] == ("/xmlapi2/thing", [8, 7])
+    assert fetch_game_ids(fetcher, [7, 1]) == [7, 1]
+    assert len(fake_bgg.requests) == 2
+
+
+def test_replay_serves_recorded_games_in_any_grouping(fake_bgg, cache_path):
+    recording = create_fetcher(fake_bgg, ResponseCache(cache_path))
+    fetch_game_ids(recording, list(range(1, 21)))
+    fetch_game_ids(recording, list(range(21, 41)))
+
+    replay = create_fetcher(fake_bgg, ResponseCache(cache_path, replay=True))
+    assert fetch_game_ids(replay, list(range(11, 31))) == list(range(11, 31))
+    assert len(fake_bgg.requests) == 2
+    with pytest.raises(BoardgamegeekRequestError):
+        replay.fetch_chunk([40, 41])
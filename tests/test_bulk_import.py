@@ -0,0 +1,138 @@
+import pytest
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+import boardgames.services.bgg_fetcher as bgg_fetcher
+import boardgames.services.bulk_import_service as bulk_import_service
+from boardgames.data.games import Game
+from boardgames.data.tags import GameTag
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from boardgames.services.bulk_import_service import (
+    bulk_import,
+    fetch_collections,
+    load_checkpoint,
+    save_checkpoint,
+)
+from boardgames.services.collection_service import CollectionItem
+from boardgames.services.search_service import games_fts
+
+# Not in the fixture, which has games 1 to 100.
+NEW_GAME_IDS = [101, 102]
+USERNAMES = ["bulk-alice", "bulk-bob", "bulk-carol"]
+
+
+class FakeCollections:
+    # Collections by username, "waiting" is answered once before the items.
+    def __init__(self, collections):
+        self.collections = collections
+        self.requested = []
+
+    def get(self, username, modified_since=None):
+        self.requested.append(username)
+        collection = self.collections[username]
+        if collection == "waiting":
+            self.collections[username] = [CollectionItem(1, None, True)]
+        return collection
+
+
+@pytest.fixture
+def checkpoint_file(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def create_collection(game_ids):
+    return {
+        "fetched_at": "2026-01-01T00:00:00",
+        "items": [[game_id, None, True] for game_id in game_ids],
+    }
+
+
+def test_fetch_collections_resumes_from_the_checkpoint(checkpoint_file, monkeypatch):
+    save_checkpoint(
+        checkpoint_file,
+        {
+            "collections": {"bulk-alice": create_collection([1])},
+            "invalid_users": ["bulk-bob"],
+            "synced_users": [],
+        },
+    )
+    collections = FakeCollections({"bulk-carol": "waiting"})
+    monkeypatch.setattr(
+        bulk_import_service, "get_user_games_from_boardgamegeek", collections.get
+    )
+    monkeypatch.setattr(bulk_import_service, "COLLECTION_RETRY_SECONDS", 0)
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    assert fetch_collections(USERNAMES, checkpoint, checkpoint_file) == []
+    assert collections.requested == ["bulk-carol", "bulk-carol"]
+    saved = load_checkpoint(checkpoint_file)
+    assert saved == checkpoint
+    assert saved["collections"]["bulk-carol"]["items"] == [[1, None, True]]
+
+
+def delete_imported(session):
+    user_ids = sa.select(User.id).where(User.name.in_(USERNAMES))
+    session.query(UserGame).filter(UserGame.user_id.in_(user_ids)).delete(
+        synchronize_session=False
+    )
+    session.query(User).filter(User.name.in_(USERNAMES)).delete(
+        synchronize_session=False
+    )
+    session.query(GameTag).filter(GameTag.bgg_game_id.in_(NEW_GAME_IDS)).delete(
+        synchronize_session=False
+    )
+    session.execute(sa.delete(games_fts).where(games_fts.c.rowid.in_(NEW_GAME_IDS)))
+    session.query(Game).filter(Game.bgg_game_id.in_(NEW_GAME_IDS)).delete(
+        synchronize_session=False
+    )
+    session.commit()
+
+
+@pytest.fixture
+def interrupted_import(app, fake_bgg, checkpoint_file, monkeypatch):
+    # Collections were fetched and alice synced before the import stopped,
+    # games owned by her and by the benchmark user are in the db.
+    fetcher = bgg_fetcher.ThingFetcher(
+        base_uri=fake_bgg.base_uri, requests_per_second=0, retry_backoff_seconds=0
+    )
+    monkeypatch.setattr(bgg_fetcher, "__default_fetcher", fetcher)
+    save_checkpoint(
+        checkpoint_file,
+        {
+            "collections": {
+                "bulk-alice": create_collection([1, 2]),
+                "bulk-carol": create_collection([2, *NEW_GAME_IDS]),
+            },
+            "invalid_users": ["bulk-bob"],
+            "synced_users": ["bulk-alice"],
+        },
+    )
+    yield
+    with db_session.create_session() as session:
+        delete_imported(session)
+
+
+def get_owned_game_ids(username):
+    with db_session.create_session() as session:
+        return sorted(
+            game_id
+            for game_id, in session.query(UserGame.bgg_game_id)
+            .join(User, User.id == UserGame.user_id)
+            .filter(User.name == username)
+        )
+
+
+def test_bulk_import_resumes_from_the_checkpoint(
+    interrupted_import, fake_bgg, checkpoint_file
+):
+    assert bulk_import(USERNAMES, checkpoint_file, workers=1) == []
+    # Only the games that are not in the db are fetched.
+    assert sorted(fake_bgg.requested_ids()) == NEW_GAME_IDS
+    assert get_owned_game_ids("bulk-carol") == [2, *NEW_GAME_IDS]
+    # Synced before the interruption, so not synced again.
+    assert get_owned_game_ids("bulk-alice") == []
+    assert load_checkpoint(checkpoint_file)["synced_users"] == [
+        "bulk-alice",
+        "bulk-carol",
+    ]
@@ -0,0 +1,111 @@
+import datetime
+
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.bgg_fetcher as bgg_fetcher
+from boardgames.data.games import Game
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from boardgames.services.catalog_refresh_service import (
+    STALE_AFTER,
+    get_stale_game_ids,
+    refresh_stale_games,
+)
+
+USERNAME = "refresh-test"
+NOW = datetime.datetime.utcnow()
+STALE = NOW - STALE_AFTER - datetime.timedelta(days=1)
+
+
+def set_fetched_at(fetched_at_per_game):
+    with db_session.create_session() as session:
+        session.query(Game).update({Game.fetched_at: NOW})
+        for game_id, fetched_at in fetched_at_per_game.items():
+            session.query(Game).filter(Game.bgg_game_id == game_id).update(
+                {Game.fetched_at: fetched_at}
+            )
+        session.commit()
+
+
+@pytest.fixture
+def second_owner(app):
+    # Every fixture game is owned by the benchmark user, this one owns game 30
+    # too.
+    with db_session.create_session() as session:
+        user = User(name=USERNAME)
+        session.add(user)
+        session.flush()
+        session.add(UserGame(user_id=user.id, bgg_game_id=30))
+        session.commit()
+        user_id = user.id
+    yield
+    with db_session.create_session() as session:
+        session.query(UserGame).filter(UserGame.user_id == user_id).delete()
+        session.query(User).filter(User.id == user_id).delete()
+        session.commit()
+    set_fetched_at({})
+
+
+def test_stale_games_most_owned_first(second_owner):
+    set_fetched_at(
+        {
+            10: STALE,
+            20: STALE - datetime.timedelta(days=10),
+            30: STALE,
+            40: None,
+            # Fetched recently enough.
+            50: NOW - STALE_AFTER + datetime.timedelta(days=1),
+        }
+    )
+    with db_session.create_session() as session:
+        # Then never fetched, then least recently fetched.
+        assert get_stale_game_ids(session, 10) == [30, 40, 20, 10]
+        assert get_stale_game_ids(session, 2) == [30, 40]
+
+
+@pytest.fixture
+def fetcher(fake_bgg, monkeypatch):
+    fetcher = bgg_fetcher.ThingFetcher(
+        base_uri=fake_bgg.base_uri,
+        requests_per_second=0,
+        max_retries=2,
+        retry_backoff_seconds=0,
+    )
+    monkeypatch.setattr(bgg_fetcher, "__default_fetcher", fetcher)
+    return fetcher
+
+
+@pytest.fixture
+def stale_games(app):
+    game_ids = list(range(1, 61))
+    set_fetched_at({game_id: STALE for game_id in game_ids})
+    yield game_ids
+    set_fetched_at({})
+
+
+def get_stale_count():
+    with db_session.create_session() as session:
+        return len(get_stale_game_ids(session, 1000))
+
+
+def test_refresh_within_the_budget(fake_bgg, fetcher, stale_games):
+    assert refresh_stale_games(budget=2) == 40
+    assert len(fake_bgg.requests) == 2
+    assert get_stale_count() == 20
+
+
+def test_retries_count_against_the_budget(fake_bgg, fetcher, stale_games):
+    # The first batch takes three requests, the second one uses up the budget.
+    fake_bgg.statuses = [202, 202]
+    assert refresh_stale_games(budget=4) == 40
+    assert len(fake_bgg.requests) == 4
+    assert get_stale_count() == 20
+
+
+def test_failed_batch_stays_stale(fake_bgg, fetcher, stale_games):
+    fake_bgg.failing_ids = {25}
+    assert refresh_stale_games(budget=10) == 40
+    # One request for each batch that worked and three for the failing one.
+    assert len(fake_bgg.requests) == 5
+    assert get_stale_count() == 20
@@ -0,0 +1,84 @@
+import csv
+import io
+
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.export_service as export_service
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.services.collection_service import bump_collection_version
+from boardgames.services.export_service import COLUMN_NAMES
+from boardgames.services.player_count_poll import (
+    get_player_count_bit,
+    get_player_count_mask,
+)
+
+EXPORT_URL = f"/user_collection/{FIXTURE_USERNAME}/export"
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        {"sort_field": "bogus"},
+        {"sort_type": "sideways"},
+        {"player_count": "x", "player_count_filter_type": "Best"},
+        {"player_count": "2", "player_count_filter_type": "Bogus"},
+        {"min_weight": "heavy"},
+    ],
+)
+def test_export_rejects_invalid_filters(client, query_string):
+    response = client.get(EXPORT_URL, query_string=query_string)
+    assert response.status_code == 400
+
+
+def test_export_csv(client):
+    response = client.get(
+        EXPORT_URL,
+        query_string={
+            "include_expansions": "on",
+            "player_count": "2",
+            "player_count_filter_type": "Best",
+            "sort_field": "Weight",
+            "sort_type": "desc",
+        },
+    )
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == COLUMN_NAMES
+    assert len(rows) > 1
+    best_column = COLUMN_NAMES.index("user_suggested_best_number_of_players")
+    assert all(
+        get_player_count_mask(row[best_column]) & get_player_count_bit(2)
+        for row in rows[1:]
+    )
+
+
+def count_exported_games(client, query_string):
+    response = client.get(EXPORT_URL, query_string=query_string)
+    assert response.status_code == 200
+    return len(list(csv.reader(io.StringIO(response.get_data(as_text=True))))) - 1
+
+
+@pytest.mark.parametrize("value", ["0", "false", "off", ""])
+def test_export_without_expansions(client, value):
+    without_expansions = count_exported_games(client, {})
+    assert count_exported_games(client, {"include_expansions": value}) == (
+        without_expansions
+    )
+
+
+def test_export_with_expansions(client):
+    all_games = count_exported_games(client, {"include_expansions": "on"})
+    assert count_exported_games(client, {"include_expansions": "1"}) == all_games
+    assert all_games > count_exported_games(client, {})
+
+
+def test_collection_links_available_formats(client, monkeypatch):
+    monkeypatch.setattr(export_service, "pyarrow", None)
+    # A new version skips the render cache.
+    with db_session.create_session() as session:
+        bump_collection_version(session, FIXTURE_USERNAME)
+        session.commit()
+    page = client.get(f"/user_collection/{FIXTURE_USERNAME}").get_data(as_text=True)
+    assert "export?format=csv" in page
+    assert "export?format=parquet" not in page
@@ -0,0 +1,58 @@
+import pytest
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+import boardgames.services.collection_cache as collection_cache
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.services.collection_service import bump_collection_version
+
+COLLECTION_URL = f"/user_collection/{FIXTURE_USERNAME}"
+
+
+@pytest.fixture
+def statements(app):
+    engine = db_session.create_session().get_bind()
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    sa.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def cold_caches(app):
+    # A new collection version misses the collection and render caches.
+    with db_session.create_session() as session:
+        bump_collection_version(session, FIXTURE_USERNAME)
+        session.commit()
+
+
+def test_page_view_with_cold_caches(client, cold_caches, statements):
+    response = client.get(COLLECTION_URL)
+    assert response.status_code == 200
+    # The collection version and the whole collection for the cache, the page,
+    # stats and facets are then served from it.
+    assert len(statements) == 2
+
+
+def test_page_view_with_warm_caches(client, cold_caches, statements):
+    client.get(COLLECTION_URL)
+    statements.clear()
+    response = client.get(COLLECTION_URL)
+    assert response.status_code == 200
+    # Only the collection version, the page comes from the render cache.
+    assert len(statements) == 1
+
+
+def test_page_view_of_uncacheable_collection(
+    client, cold_caches, statements, monkeypatch
+):
+    monkeypatch.setattr(collection_cache, "MAX_CACHED_GAMES", 0)
+    response = client.get(COLLECTION_URL)
+    assert response.status_code == 200
+    # The collection version, the collection found too big to cache, then the
+    # page, the stats and one facet query per tag kind.
+    assert len(statements) == 7
@@ -0,0 +1,158 @@
+import datetime
+
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.collection_service as collection_service
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from boardgames.services.collection_service import (
+    CollectionItem,
+    diff_user_games,
+    get_modified_since,
+    sync_user_games,
+)
+
+USERNAME = "sync-test"
+SYNCED_AT = datetime.datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def user(app):
+    # Owns games 1 to 4, the fixture's games, rated 1 to 4 but game 4.
+    with db_session.create_session() as session:
+        session.query(User).filter(User.name == USERNAME).delete()
+        user = User(name=USERNAME)
+        session.add(user)
+        session.flush()
+        session.add_all(
+            UserGame(
+                user_id=user.id,
+                bgg_game_id=game_id,
+                user_rating=None if game_id == 4 else game_id,
+            )
+            for game_id in [1, 2, 3, 4]
+        )
+        session.commit()
+        user_id = user.id
+    yield user_id
+    with db_session.create_session() as session:
+        session.query(UserGame).filter(UserGame.user_id == user_id).delete()
+        session.query(User).filter(User.id == user_id).delete()
+        session.commit()
+
+
+def get_user_games(user_id):
+    with db_session.create_session() as session:
+        return dict(
+            session.query(UserGame.bgg_game_id, UserGame.user_rating).filter(
+                UserGame.user_id == user_id
+            )
+        )
+
+
+def get_user(user_id):
+    with db_session.create_session() as session:
+        return session.query(User).filter(User.id == user_id).one()
+
+
+def test_full_sync_diff(user):
+    items = [
+        CollectionItem(1, "1", True),
+        CollectionItem(2, "8.5", True),
+        CollectionItem(4, None, True),
+        CollectionItem(5, "7", True),
+        # Listed but not owned, like a wishlist game.
+        CollectionItem(6, None, False),
+    ]
+    with db_session.create_session() as session:
+        diff = diff_user_games(session, user, items, full_sync=True)
+    assert diff.to_insert == {5: 7.0}
+    # Game 3 is not listed, a full sync lists every owned game.
+    assert diff.to_delete == {3}
+    assert diff.to_update == {2: 8.5}
+
+
+def test_incremental_sync_diff(user):
+    items = [
+        CollectionItem(2, "8.5", True),
+        # Removed from the collection since the last sync.
+        CollectionItem(3, "3", False),
+        CollectionItem(5, None, True),
+    ]
+    with db_session.create_session() as session:
+        diff = diff_user_games(session, user, items, full_sync=False)
+    assert diff.to_insert == {5: None}
+    # Games 1 and 4 did not change, so bgg does not list them.
+    assert diff.to_delete == {3}
+    assert diff.to_update == {2: 8.5}
+
+
+def test_sync_user_games(user):
+    version = get_user(user).collection_version
+    items = [CollectionItem(2, "8.5", True), CollectionItem(3, "3", False)]
+    sync_user_games(USERNAME, items, full_sync=False, synced_at=SYNCED_AT)
+    assert get_user_games(user) == {1: 1, 2: 8.5, 4: None}
+    assert get_user(user).collection_version == version + 1
+    assert get_user(user).last_synced_at == SYNCED_AT
+
+
+def test_unchanged_sync_keeps_the_collection_version(user):
+    version = get_user(user).collection_version
+    items = [CollectionItem(1, "1", True), CollectionItem(4, None, True)]
+    sync_user_games(USERNAME, items, full_sync=False, synced_at=SYNCED_AT)
+    assert get_user_games(user) == {1: 1, 2: 2, 3: 3, 4: None}
+    assert get_user(user).collection_version == version
+    assert get_user(user).last_synced_at == SYNCED_AT
+
+
+def set_last_synced_at(user_id, last_synced_at):
+    with db_session.create_session() as session:
+        session.query(User).filter(User.id == user_id).update(
+            {User.last_synced_at: last_synced_at}
+        )
+        session.commit()
+
+
+def test_modified_since_overlaps_the_last_sync(user):
+    assert get_modified_since(USERNAME) is None
+    last_synced_at = datetime.datetime.utcnow() - datetime.timedelta(hours=2)
+    set_last_synced_at(user, last_synced_at)
+    assert get_modified_since(USERNAME) == (
+        last_synced_at - collection_service.SYNC_OVERLAP
+    )
+
+
+def test_modified_since_after_the_full_sync_interval(user):
+    set_last_synced_at(
+        user,
+        datetime.datetime.utcnow()
+        - collection_service.FULL_SYNC_INTERVAL
+        - datetime.timedelta(minutes=1),
+    )
+    assert get_modified_since(USERNAME) is None
+
+
+class RecordingFetcher:
+    def __init__(self):
+        self.opened = []
+
+    def open(self, endpoint, params):
+        self.opened.append((endpoint, params))
+
+
+def test_collection_request_parameters(monkeypatch):
+    fetcher = RecordingFetcher()
+    monkeypatch.setattr(collection_service, "get_default_fetcher", lambda: fetcher)
+    collection_service.get_users_collection(USERNAME)
+    collection_service.get_users_collection(
+        USERNAME, datetime.datetime(2026, 1, 2, 3, 4, 5)
+    )
+    assert fetcher.opened == [
+        ("collection", {"username": USERNAME, "stats": 1, "own": 1}),
+        # Without own, so games removed from the collection are listed too.
+        (
+            "collection",
+            {"username": USERNAME, "stats": 1, "modifiedsince": "26-01-02 03:04:05"},
+        ),
+    ]
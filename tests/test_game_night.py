@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.filtered_games_service as fgs
+from boardgames.data.games import Game
+from boardgames.data.user_games import UserGame
+from boardgames.data.users import User
+from boardgames.services.collection_service import bump_collection_version
+from boardgames.services.game_night_service import (
+    find_group_games,
+    get_group_games,
+    parse_usernames,
+)
+
+COLLECTIONS = {
+    "night-ann": [1, 2, 3],
+    "night-ben": [2, 3, 4, 5],
+    "night-cat": [3, 5],
+}
+ALL_GAMES_FILTERS = fgs.DEFAULT_COLLECTION_FILTERS._replace(include_expansions=True)
+
+
+@pytest.fixture
+def users(app):
+    with db_session.create_session() as session:
+        for username, game_ids in COLLECTIONS.items():
+            user = User(name=username)
+            session.add(user)
+            session.flush()
+            session.add_all(
+                UserGame(user_id=user.id, bgg_game_id=game_id) for game_id in game_ids
+            )
+        session.commit()
+    yield list(COLLECTIONS)
+    with db_session.create_session() as session:
+        user_ids = [
+            user_id
+            for user_id, in session.query(User.id).filter(
+                User.name.in_(list(COLLECTIONS))
+            )
+        ]
+        session.query(UserGame).filter(UserGame.user_id.in_(user_ids)).delete(
+            synchronize_session=False
+        )
+        session.query(User).filter(User.id.in_(user_ids)).delete(
+            synchronize_session=False
+        )
+        session.commit()
+
+
+def test_group_games_owned_by_anyone(users):
+    group = get_group_games(users)
+    assert group.usernames == users
+    assert group.game_ids.tolist() == [1, 2, 3, 4, 5]
+    assert group.owners.tolist() == [
+        [True, True, True, False, False],
+        [False, True, True, True, True],
+        [False, False, True, False, True],
+    ]
+
+
+def test_group_games_owned_by_all(users):
+    group = get_group_games(users, owned_by_all=True)
+    assert group.game_ids.tolist() == [3]
+    assert group.owners.tolist() == [[True], [True], [True]]
+    assert get_group_games(users[:2], owned_by_all=True).game_ids.tolist() == [2, 3]
+
+
+def test_unknown_users_are_left_out(users):
+    group = get_group_games(["night-cat", "night-nobody"], owned_by_all=True)
+    assert group.usernames == ["night-cat"]
+    assert group.game_ids.tolist() == [3, 5]
+    assert get_group_games(["night-nobody"]).game_ids.tolist() == []
+
+
+def test_changed_collection_is_loaded_again(users):
+    assert get_group_games(["night-cat"]).game_ids.tolist() == [3, 5]
+    with db_session.create_session() as session:
+        user_id = session.query(User.id).filter(User.name == "night-cat").scalar()
+        session.add(UserGame(user_id=user_id, bgg_game_id=7))
+        bump_collection_version(session, "night-cat")
+        session.commit()
+    assert get_group_games(["night-cat"]).game_ids.tolist() == [3, 5, 7]
+
+
+def test_find_group_games(users):
+    group = get_group_games(users)
+    page, stats, owners = find_group_games(group, ALL_GAMES_FILTERS)
+    assert sorted(game.bgg_game_id for game in page.games) == [1, 2, 3, 4, 5]
+    assert owners[3] == users
+    assert owners[4] == ["night-ben"]
+
+
+def test_group_games_query_with_more_ids_than_sqlite_parameters(app):
+    # The ids are one json array, not a parameter each.
+    game_ids = np.arange(1, 50001)
+    session = db_session.get_current_session()
+    query = fgs.get_group_games_query(session, game_ids)
+    assert query.count() == session.query(Game).count()
+
+
+def test_parse_usernames():
+    assert parse_usernames("Ann, ben\nann,, cat ") == ["ann", "ben", "cat"]
+
+
+def test_game_night_page(client, users):
+    response = client.get("/game_night", query_string={"users": ",".join(users)})
+    assert response.status_code == 200
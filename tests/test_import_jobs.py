@@ -0,0 +1,39 @@
+import datetime
+
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.data.import_jobs as import_jobs
+from boardgames.data.import_jobs import ImportJob
+from boardgames.services.import_job_service import JOB_TIMEOUT
+
+
+def create_job(status, updated_at):
+    with db_session.create_session() as session:
+        job = ImportJob(username="stale", status=status, updated_at=updated_at)
+        session.add(job)
+        session.commit()
+        return job.id
+
+
+def get_status(job_id):
+    with db_session.create_session() as session:
+        return session.query(ImportJob.status).filter(ImportJob.id == job_id).scalar()
+
+
+@pytest.mark.parametrize("status", import_jobs.ACTIVE_STATUSES)
+def test_dead_job_is_failed(client, status):
+    job_id = create_job(
+        status, datetime.datetime.utcnow() - JOB_TIMEOUT - datetime.timedelta(1)
+    )
+    response = client.get(f"/import/{job_id}/status")
+    assert response.status_code == 200
+    assert "hx-trigger" not in response.get_data(as_text=True)
+    assert get_status(job_id) == import_jobs.FAILED
+
+
+def test_running_job_keeps_polling(client):
+    job_id = create_job(import_jobs.FETCHING, datetime.datetime.utcnow())
+    response = client.get(f"/import/{job_id}/status")
+    assert "hx-trigger" in response.get_data(as_text=True)
+    assert get_status(job_id) == import_jobs.FETCHING
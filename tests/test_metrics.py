@@ -0,0 +1,18 @@
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.services import metrics
+
+
+def test_metrics_with_failed_and_successful_bgg_requests(client):
+    metrics.observe_bgg_request("thing", 200, 0.1)
+    metrics.observe_bgg_request("thing", "error", 0.2)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'bgg_request_duration_seconds_count{endpoint="thing",status="200"}' in body
+    assert 'bgg_request_duration_seconds_count{endpoint="thing",status="error"}' in body
+
+
+def test_metrics_count_collection_cache_lookups(client):
+    client.get(f"/user_collection/{FIXTURE_USERNAME}")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'collection_cache_lookups_total{result="' in body
@@ -0,0 +1,121 @@
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.collection_cache as collection_cache
+import boardgames.services.filtered_games_service as fgs
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.data.games import Game
+from boardgames.services.collection_service import bump_collection_version
+from boardgames.services.migrations import update_open_ended_player_count_masks
+from boardgames.services.player_count_poll import (
+    MAX_PLAYER_COUNT_BIT,
+    PLAYER_COUNT_OVERFLOW_BIT,
+    get_player_count_bit,
+    get_player_count_mask,
+)
+
+ALL_GAMES_FILTERS = fgs.DEFAULT_COLLECTION_FILTERS._replace(include_expansions=True)
+
+
+def matches(pipe_joined_player_counts, player_count):
+    return (
+        get_player_count_mask(pipe_joined_player_counts)
+        & get_player_count_bit(player_count)
+        != 0
+    )
+
+
+def is_suggested_for(pipe_joined_player_counts, player_count):
+    # The chosen semantics spelled out: a count matches itself, "N+" matches
+    # N and up, and every count above 15 matches every other one.
+    for num_players in pipe_joined_player_counts.split("|"):
+        if num_players.endswith("+"):
+            if int(num_players[:-1]) <= player_count:
+                return True
+        elif num_players and (
+            int(num_players) == player_count
+            or min(int(num_players), player_count) > MAX_PLAYER_COUNT_BIT
+        ):
+            return True
+    return False
+
+
+def test_counts_sharing_digits_are_apart():
+    assert not matches("10", 1)
+    assert not matches("1", 10)
+    assert not matches("11|12", 1)
+    assert matches("1|10", 1)
+    assert matches("1|10", 10)
+
+
+def test_open_ended_option_matches_its_count_and_up():
+    assert not matches("2|3|4+", 1)
+    for player_count in [2, 3, 4, 5, 15, 16, 30]:
+        assert matches("2|3|4+", player_count)
+    assert not matches("3|5+", 4)
+
+
+def test_counts_above_15_share_the_overflow_bit():
+    assert get_player_count_mask("16") == PLAYER_COUNT_OVERFLOW_BIT
+    assert matches("20", 16)
+    assert matches("16+", 30)
+    assert not matches("20", 15)
+    assert not matches("16+", 15)
+
+
+def test_empty_poll_matches_nothing():
+    assert get_player_count_mask("") == 0
+    assert not matches("", 1)
+
+
+@pytest.fixture
+def cold_collection(app):
+    with db_session.create_session() as session:
+        bump_collection_version(session, FIXTURE_USERNAME)
+        session.commit()
+
+
+@pytest.mark.parametrize(
+    "filter_type, column",
+    [
+        ("Best", "user_suggested_best_number_of_players"),
+        ("Recommended", "user_suggested_recommended_number_of_players"),
+    ],
+)
+def test_player_count_filters(cold_collection, filter_type, column):
+    with db_session.create_session() as session:
+        games = session.query(Game.bgg_game_id, getattr(Game, column)).all()
+    assert any("+" in player_counts for _, player_counts in games)
+    collection = collection_cache.get_collection(FIXTURE_USERNAME)
+    cached_game_ids = collection.columns["bgg_game_id"]
+    for player_count in range(1, 18):
+        expected = {
+            game_id
+            for game_id, player_counts in games
+            if is_suggested_for(player_counts, player_count)
+        }
+        filters = ALL_GAMES_FILTERS._replace(
+            player_count=str(player_count), player_count_filter_type=filter_type
+        )
+        found = fgs.get_games(FIXTURE_USERNAME, filters)
+        assert {game.bgg_game_id for game in found} == expected
+        cached = collection.filter_games(filters)
+        assert {int(cached_game_ids[i]) for i in cached} == expected
+
+
+def test_migration_updates_open_ended_masks(app):
+    with db_session.create_session() as session:
+        game = (
+            session.query(Game)
+            .filter(Game.user_suggested_recommended_number_of_players.contains("+"))
+            .first()
+        )
+        mask = game.user_suggested_recommended_player_count_mask
+        # What "N+" was stored as before.
+        game.user_suggested_recommended_player_count_mask = PLAYER_COUNT_OVERFLOW_BIT
+        session.commit()
+
+        update_open_ended_player_count_masks(session)
+        session.commit()
+        session.refresh(game)
+        assert game.user_suggested_recommended_player_count_mask == mask
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from boardgames.services.player_count_poll import (
+    EMPTY_POLL_RESULT,
+    PlayerCountPoll,
+    PlayerCountPollResult,
+    evaluate_poll,
+    evaluate_polls,
+)
+
+pd = pytest.importorskip("pandas")
+
+
+def evaluate_poll_with_pandas(poll):
+    # The rules of the pandas based BoardgameXMLParser this module replaced.
+    if poll.total_votes == 0:
+        return EMPTY_POLL_RESULT
+    df = pd.DataFrame(
+        [
+            {
+                "num_players": num_players,
+                "best": best,
+                "recommended": recommended,
+                "not_recommended": not_recommended,
+            }
+            for num_players, best, recommended, not_recommended in poll.options
+        ]
+    )
+    df.loc[df["not_recommended"] > df["recommended"] + df["best"], "poll_result"] = (
+        "not_recommended"
+    )
+    df.loc[
+        (df["poll_result"] != "not_recommended") & (df["recommended"] < df["best"]),
+        "poll_result",
+    ] = "best"
+    df.loc[
+        (df["poll_result"] != "not_recommended") & (df["poll_result"] != "best"),
+        "poll_result",
+    ] = "recommended"
+    return PlayerCountPollResult(
+        "|".join(df.loc[df["poll_result"] == "best", "num_players"].tolist()),
+        "|".join(
+            df.loc[df["poll_result"] != "not_recommended", "num_players"].tolist()
+        ),
+        "|".join(df.loc[df["poll_result"] == "recommended", "num_players"].tolist()),
+    )
+
+
+FIXED_POLLS = [
+    # Best, recommended and not recommended player counts with an "N+" option.
+    PlayerCountPoll(
+        120,
+        [
+            ("1", 0, 5, 40),
+            ("2", 10, 30, 5),
+            ("3", 40, 12, 1),
+            ("4", 35, 20, 3),
+            ("4+", 1, 3, 30),
+        ],
+    ),
+    # Ties: not recommended equal to the other votes, recommended equal to best.
+    PlayerCountPoll(30, [("2", 5, 5, 10), ("3", 7, 7, 0), ("4", 0, 0, 0)]),
+    # A recommended "N+" option.
+    PlayerCountPoll(12, [("5", 2, 4, 1), ("5+", 1, 6, 2)]),
+    # No votes at all, options are listed anyway.
+    PlayerCountPoll(0, [("1", 0, 0, 0), ("2", 0, 0, 0), ("2+", 0, 0, 0)]),
+    PlayerCountPoll(0, []),
+]
+
+
+def create_random_poll(rng):
+    max_players = rng.randint(1, 12)
+    options = [
+        (str(num_players), rng.randint(0, 50), rng.randint(0, 50), rng.randint(0, 50))
+        for num_players in range(1, max_players + 1)
+    ]
+    if rng.random() < 0.5:
+        options.append((f"{max_players}+", *(rng.randint(0, 20) for _ in range(3))))
+    total_votes = 0 if rng.random() < 0.1 else rng.randint(1, 200)
+    return PlayerCountPoll(total_votes, options)
+
+
+RANDOM_POLLS = [create_random_poll(random.Random(seed)) for seed in range(500)]
+
+
+@pytest.mark.parametrize("poll", FIXED_POLLS)
+def test_evaluate_poll_matches_pandas(poll):
+    assert evaluate_poll(poll) == evaluate_poll_with_pandas(poll)
+
+
+def test_evaluate_poll_matches_pandas_on_random_polls():
+    for poll in RANDOM_POLLS:
+        assert evaluate_poll(poll) == evaluate_poll_with_pandas(poll)
+
+
+def test_evaluate_polls_matches_pandas():
+    polls = FIXED_POLLS + RANDOM_POLLS
+    assert evaluate_polls(polls) == [evaluate_poll_with_pandas(p) for p in polls]
+
+
+@pytest.mark.parametrize("poll", FIXED_POLLS)
+def test_evaluate_polls_matches_pandas_on_single_poll(poll):
+    assert evaluate_polls([poll]) == [evaluate_poll_with_pandas(poll)]
+
+
+def test_evaluate_polls_on_empty_batch():
+    assert evaluate_polls([]) == []
+
+
+def test_fixed_poll_results():
+    assert evaluate_poll(FIXED_POLLS[0]) == PlayerCountPollResult("3|4", "2|3|4", "2")
+    assert evaluate_poll(FIXED_POLLS[1]) == PlayerCountPollResult("", "2|3|4", "2|3|4")
+    assert evaluate_poll(FIXED_POLLS[3]) == EMPTY_POLL_RESULT
@@ -0,0 +1,104 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+import boardgames.data.__all_models  # noqa: F401
+import boardgames.services.filtered_games_service as fgs
+from boardgames.data.games import Game
+from boardgames.data.modelbase import SqlAlchemyBase
+from boardgames.services import migrations
+from boardgames.services.search_service import create_games_fts, index_games
+
+GAMES = {
+    1: ("Wingspan", "Birds and eggs."),
+    2: ("Everdell", "Critters build a city, no birds and no wingspan in sight."),
+    3: ("Azul", "Tiles from Portugal."),
+    4: ("Cascadia", "Habitats with birds, birds and more birds."),
+    5: ("Wings of the Crane", ""),
+}
+
+
+def create_game(bgg_game_id, title, description):
+    return Game(
+        bgg_game_id=bgg_game_id,
+        title=title,
+        description=description,
+        type="boardgame",
+        year_published=2020,
+        min_players=1,
+        max_players=4,
+        playing_time=60,
+        min_playing_time=30,
+        max_playing_time=60,
+        min_age=10,
+        weight_votes=0,
+        average_weight=0,
+        average_rating=0,
+        bayes_average_rating=0,
+        board_game_rank=0,
+        designers="",
+        mechanics="",
+        categories="",
+        user_suggested_best_number_of_players="",
+        user_suggested_recommended_number_of_players="",
+        user_suggested_recommended_not_best_number_of_players="",
+    )
+
+
+@pytest.fixture
+def session():
+    # A db of its own, the fts table is filled differently per test.
+    engine = sa.create_engine("sqlite://")
+    SqlAlchemyBase.metadata.create_all(engine)
+    session = orm.Session(engine)
+    session.add_all(
+        create_game(bgg_game_id, title, description)
+        for bgg_game_id, (title, description) in GAMES.items()
+    )
+    session.flush()
+    yield session
+    session.close()
+
+
+def search(session, search_text):
+    filters = fgs.DEFAULT_COLLECTION_FILTERS._replace(
+        search=search_text, sort_field=fgs.RELEVANCE_SORT_FIELD, sort_type="asc"
+    )
+    query = fgs.apply_search(session.query(Game.bgg_game_id), filters.search)
+    query = fgs.apply_sorting(query, filters.sort_field, filters.sort_type)
+    return [game.bgg_game_id for game in query]
+
+
+@pytest.fixture
+def indexed_session(session):
+    create_games_fts(session)
+    index_games(session, [(game.bgg_game_id, game) for game in session.query(Game)])
+    return session
+
+
+def test_title_ranks_above_description(indexed_session):
+    # Words are matched as a prefix while typing, wingspan and wings.
+    assert search(indexed_session, "wing") == [1, 5, 2]
+    assert set(search(indexed_session, "birds")) == {1, 2, 4}
+
+
+def test_every_word_has_to_match(indexed_session):
+    assert search(indexed_session, "birds eggs") == [1]
+    assert search(indexed_session, "tiles birds") == []
+
+
+def test_search_syntax_is_not_fts5_syntax(indexed_session):
+    assert search(indexed_session, 'birds" OR "tiles') == []
+    assert search(indexed_session, "azul*") == [3]
+    assert search(indexed_session, "NEAR(") == []
+
+
+def test_migration_backfills_the_search_index(session):
+    migrations.add_games_fts(session)
+    assert search(session, "wing") == [1, 5, 2]
+    # Only new games are indexed by a backfill, and running it again is fine.
+    session.add(create_game(6, "Wingspan Asia", ""))
+    session.flush()
+    migrations.add_games_fts(session)
+    assert sorted(search(session, "wingspan")) == [1, 2, 6]
+    assert session.execute(sa.text("SELECT count(*) FROM games_fts")).scalar() == 6
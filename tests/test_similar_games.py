@@ -0,0 +1,76 @@
+import datetime
+
+import sqlalchemy as sa
+
+import boardgames.data.db_session as db_session
+import boardgames.services.similar_games_service as similar_games_service
+from boardgames.data.games import Game
+from boardgames.data.tags import GameTag
+from boardgames.services.tag_service import TAG_KINDS
+
+
+def get_two_game_ids(session):
+    return [
+        game_id
+        for game_id, in session.query(Game.bgg_game_id)
+        .order_by(Game.bgg_game_id)
+        .limit(2)
+    ]
+
+
+def copy_game(session, from_game_id, to_game_id, fetched_at):
+    from_game = session.query(Game).filter(Game.bgg_game_id == from_game_id).one()
+    session.query(GameTag).filter(GameTag.bgg_game_id == to_game_id).delete()
+    session.execute(
+        sa.insert(GameTag),
+        [
+            {"bgg_game_id": to_game_id, "tag_id": game_tag.tag_id}
+            for game_tag in session.query(GameTag).filter(
+                GameTag.bgg_game_id == from_game_id
+            )
+        ],
+    )
+    session.query(Game).filter(Game.bgg_game_id == to_game_id).update(
+        {
+            **{
+                column: getattr(from_game, column)
+                for column in ["average_weight", *TAG_KINDS]
+            },
+            Game.fetched_at: fetched_at,
+        }
+    )
+    session.commit()
+
+
+def test_index_reads_games_fetched_again_with_an_older_fetched_at(app):
+    with db_session.create_session() as session:
+        game_id, copied_game_id = get_two_game_ids(session)
+        index = similar_games_service.get_index(session)
+        newest_fetched_at = session.query(sa.func.max(Game.fetched_at)).scalar()
+        # Like a refresh that started before the last import was committed.
+        copy_game(
+            session,
+            copied_game_id,
+            game_id,
+            newest_fetched_at - datetime.timedelta(minutes=5),
+        )
+
+        updated_index = similar_games_service.get_index(session)
+
+    assert updated_index is not index
+    similar_game_id, score = updated_index.find_similar(game_id, limit=1)[0]
+    assert similar_game_id == copied_game_id
+    assert score > 0.999
+
+
+def test_index_is_kept_without_changes(app):
+    with db_session.create_session() as session:
+        index = similar_games_service.get_index(session)
+        assert similar_games_service.get_index(session) is index
+        # Changes that don't fetch the game again don't touch its features.
+        game_id, _ = get_two_game_ids(session)
+        session.query(Game).filter(Game.bgg_game_id == game_id).update(
+            {Game.thumbnail_file: "changed"}
+        )
+        session.commit()
+        assert similar_games_service.get_index(session) is index
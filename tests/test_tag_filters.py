@@ -0,0 +1,114 @@
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.collection_cache as collection_cache
+import boardgames.services.filtered_games_service as fgs
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.data.games import Game
+from boardgames.services.collection_service import bump_collection_version
+from boardgames.services.tag_service import TAG_KINDS, split_tags
+
+ALL_GAMES_FILTERS = fgs.DEFAULT_COLLECTION_FILTERS._replace(include_expansions=True)
+
+
+def get_like_tagged_game_ids(session, filters):
+    # How the tag filters matched the pipe joined columns before the tag tables.
+    query = session.query(Game.bgg_game_id)
+    for kind, value in get_tag_filters(filters):
+        field = getattr(Game, kind)
+        query = query.filter(
+            (field.like(f"%|{value}|%"))
+            | (field.like(f"%|{value}"))
+            | (field.like(f"{value}|%"))
+            | (field == f"{value}")
+        )
+    return {game_id for game_id, in query}
+
+
+def get_tag_filters(filters):
+    default = fgs.DEFAULT_COLLECTION_FILTERS
+    return [
+        (kind, getattr(filters, field))
+        for kind, field in fgs.FACET_FILTER_FIELDS.items()
+        if getattr(filters, field) != getattr(default, field)
+    ]
+
+
+def get_tagged_game_ids(filters):
+    return {game.bgg_game_id for game in fgs.get_games(FIXTURE_USERNAME, filters)}
+
+
+def get_cached_tagged_game_ids(filters):
+    collection = collection_cache.get_collection(FIXTURE_USERNAME)
+    game_ids = collection.columns["bgg_game_id"]
+    return {int(game_ids[i]) for i in collection.filter_games(filters)}
+
+
+@pytest.fixture
+def tags(app):
+    with db_session.create_session() as session:
+        # A new version is cached again, whatever an earlier test left behind.
+        bump_collection_version(session, FIXTURE_USERNAME)
+        session.commit()
+        games = session.query(*[getattr(Game, kind) for kind in TAG_KINDS]).all()
+    return {
+        kind: sorted({tag for game in games for tag in split_tags(game[i])})
+        for i, kind in enumerate(TAG_KINDS)
+    }
+
+
+def assert_same_games(filters):
+    with db_session.create_session() as session:
+        expected = get_like_tagged_game_ids(session, filters)
+    assert get_tagged_game_ids(filters) == expected
+    assert get_cached_tagged_game_ids(filters) == expected
+    return expected
+
+
+def test_every_single_tag_matches_like_before(tags):
+    for kind, field in fgs.FACET_FILTER_FIELDS.items():
+        for tag in tags[kind]:
+            assert assert_same_games(ALL_GAMES_FILTERS._replace(**{field: tag}))
+
+
+def test_tag_that_is_part_of_other_tags(tags):
+    # "Mechanic 1" is part of "Mechanic 10" to "Mechanic 179".
+    mechanic = next(
+        tag
+        for tag in tags["mechanics"]
+        if any(tag + "0" in t for t in tags["mechanics"])
+    )
+    game_ids = assert_same_games(ALL_GAMES_FILTERS._replace(mechanic=mechanic))
+    with db_session.create_session() as session:
+        for (mechanics,) in session.query(Game.mechanics).filter(
+            Game.bgg_game_id.in_(game_ids)
+        ):
+            assert mechanic in split_tags(mechanics)
+
+
+def test_several_tags(tags):
+    with db_session.create_session() as session:
+        game = session.query(Game).order_by(Game.bgg_game_id).first()
+        filters = ALL_GAMES_FILTERS._replace(
+            mechanic=split_tags(game.mechanics)[0],
+            category=split_tags(game.categories)[0],
+            designer=split_tags(game.designers)[0],
+        )
+        game_id = game.bgg_game_id
+    assert game_id in assert_same_games(filters)
+
+
+@pytest.mark.parametrize(
+    "tag_filter",
+    [
+        {"mechanic": "Mechanic 999"},
+        # Parts of a tag or of several pipe joined tags are no tag.
+        {"mechanic": "Mechanic"},
+        {"category": "Category 1|Category 2"},
+        {"designer": ""},
+        # Tags are only looked up within their kind.
+        {"designer": "Mechanic 1"},
+    ],
+)
+def test_tag_without_games(tags, tag_filter):
+    assert assert_same_games(ALL_GAMES_FILTERS._replace(**tag_filter)) == set()
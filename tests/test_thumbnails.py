@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import boardgames.data.db_session as db_session
+import boardgames.services.thumbnail_service as thumbnail_service
+from benchmarks.fixtures import FIXTURE_USERNAME
+from boardgames.data.users import User
+
+
+@pytest.fixture
+def thumbnails(fake_bgg, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        thumbnail_service, "THUMBNAIL_BASE_URI", fake_bgg.base_uri.split("/xml")[0]
+    )
+    monkeypatch.setattr(thumbnail_service, "THUMBNAIL_DIR", str(tmp_path))
+    return fake_bgg
+
+
+def get_collection_version():
+    with db_session.create_session() as session:
+        return (
+            session.query(User.collection_version)
+            .filter(User.name == FIXTURE_USERNAME)
+            .scalar()
+        )
+
+
+def wait_for_cached_thumbnail(client, url):
+    for _ in range(100):
+        response = client.get(url)
+        if response.headers["Location"].startswith("/thumbnails/"):
+            return response
+        time.sleep(0.05)
+    raise AssertionError(f"{url} was not cached")
+
+
+def test_thumbnail_is_cached_in_the_background(client, thumbnails):
+    version = get_collection_version()
+    page = client.get(f"/user_collection/{FIXTURE_USERNAME}").get_data(as_text=True)
+    assert 'src="/game/' in page and "/thumbnails/" not in page
+
+    response = client.get("/game/5/thumbnail/100")
+    # bgg's thumbnail right away, the download happens afterwards.
+    assert response.status_code == 302
+    assert response.headers["Location"] == "https://example.com/thumb/5.jpg"
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    response = wait_for_cached_thumbnail(client, "/game/5/thumbnail/100")
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    assert client.get(response.headers["Location"]).status_code == 200
+    assert ("/thumb/5.jpg", []) in thumbnails.requests
+    # The pages link the same url before and after, they stay cached.
+    assert get_collection_version() == version
+
+
+def test_unknown_thumbnail_size(client):
+    assert client.get("/game/5/thumbnail/123").status_code == 404